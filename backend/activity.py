@@ -0,0 +1,175 @@
+"""Compact per-wallet activity storage.
+
+Activities are kept column-wise in typed arrays instead of one dict per
+entry: integer timestamps and points, interned type/reward labels and raw
+32-byte transaction ids. Dicts are only built for the rows a caller asks
+for, and whole logs can be dumped to and loaded from bytes in one step.
+
+Timestamps never decrease along a log, so the log is its own time index:
+time ranges are found by bisection and the newest page is read straight
+off the end. Pages are addressed by a cursor holding the position to
+continue below.
+"""
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+TX_SIZE = 32
+
+
+class StringTable:
+    """Interns short repeated strings (activity types, reward names) as codes
+
+    Code 0 is reserved for ``None``.
+    """
+
+    def __init__(self, strings=()):
+        self.strings = [None]
+        self._codes = {None: 0}
+        self._lock = threading.Lock()
+        for s in strings:
+            self.code(s)
+
+    def code(self, s):
+        code = self._codes.get(s)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(s)
+                if code is None:
+                    code = self._codes[s] = len(self.strings)
+                    self.strings.append(s)
+        return code
+
+    def get(self, s):
+        """Return the code for ``s`` without interning it"""
+        return self._codes.get(s)
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class ActivityLog:
+    __slots__ = ("timestamps", "points", "types", "rewards", "txs", "_by_type")
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.points = array("q")
+        self.types = array("I")
+        self.rewards = array("I")
+        self.txs = bytearray()
+        # type code -> positions of that type, built on the first filtered query
+        self._by_type = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, type_code, reward_code, points, tx):
+        """Append one activity and return its position in the log
+
+        A timestamp earlier than the last entry (a clock step backwards) is
+        raised to match it, keeping the log sorted.
+        """
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self.txs += tx
+        self.types.append(type_code)
+        self.rewards.append(reward_code)
+        self.points.append(points)
+        self.timestamps.append(timestamp)
+        position = len(self.timestamps) - 1
+        if self._by_type is not None:
+            self._by_type.setdefault(type_code, array("I")).append(position)
+        return position
+
+    def _type_index(self):
+        if self._by_type is None:
+            by_type = {}
+            for position, code in enumerate(self.types):
+                by_type.setdefault(code, array("I")).append(position)
+            self._by_type = by_type
+        return self._by_type
+
+    def query(self, before=None, since=None, until=None, type_codes=None, limit=20):
+        """Find up to ``limit`` activities, newest first
+
+        ``before`` is a cursor from a previous page, ``since``/``until``
+        bound the timestamp (inclusive) and ``type_codes`` restricts the
+        activity type. Returns ``(positions, next_cursor)`` where
+        ``next_cursor`` is None once the range is exhausted.
+        """
+        hi = len(self)
+        if before is not None:
+            hi = min(hi, before)
+        if until is not None:
+            hi = min(hi, bisect_right(self.timestamps, until))
+        lo = bisect_left(self.timestamps, since) if since is not None else 0
+
+        if type_codes is None:
+            positions = list(range(hi - 1, max(hi - limit, lo) - 1, -1))
+        else:
+            index = self._type_index()
+            streams = []
+            for code in set(type_codes):
+                matches = index.get(code)
+                if matches:
+                    end = bisect_left(matches, hi)
+                    start = bisect_left(matches, lo)
+                    streams.append(map(matches.__getitem__, range(end - 1, start - 1, -1)))
+            positions = list(islice(heapq.merge(*streams, reverse=True), limit))
+
+        more = len(positions) == limit and positions[-1] > lo
+        return positions, (positions[-1] if more else None)
+
+    def span(self, since=None, until=None):
+        """Positions ``[lo, hi)`` of the activities timestamped within ``[since, until]``"""
+        lo = bisect_left(self.timestamps, since) if since is not None else 0
+        hi = bisect_right(self.timestamps, until) if until is not None else len(self)
+        return lo, max(lo, hi)
+
+    def columns(self, lo, hi):
+        """Copies of activities ``lo`` to ``hi``: ``(timestamps, points, type codes, reward codes, txs)``"""
+        return (self.timestamps[lo:hi], self.points[lo:hi], self.types[lo:hi], self.rewards[lo:hi],
+                bytes(self.txs[lo * TX_SIZE:hi * TX_SIZE]))
+
+    def tx(self, i):
+        return bytes(self.txs[i * TX_SIZE:(i + 1) * TX_SIZE])
+
+    def row(self, i, labels):
+        """Materialize activity ``i`` as an API-shaped dict"""
+        return {
+            "timestamp": self.timestamps[i],
+            "type": labels[self.types[i]],
+            "reward": labels[self.rewards[i]],
+            "points": self.points[i],
+            "tx": self.tx(i).hex(),
+        }
+
+    def to_bytes(self, n):
+        """Serialize the first ``n`` activities column by column"""
+        return b"".join((
+            self.timestamps[:n].tobytes(),
+            self.points[:n].tobytes(),
+            self.types[:n].tobytes(),
+            self.rewards[:n].tobytes(),
+            bytes(self.txs[:n * TX_SIZE]),
+        ))
+
+    @classmethod
+    def from_bytes(cls, buf, n):
+        """Inverse of ``to_bytes``; ``buf`` may be a memoryview"""
+        log = cls()
+        offset = 0
+        for column, width in ((log.timestamps, 8), (log.points, 8), (log.types, 4), (log.rewards, 4)):
+            column.frombytes(buf[offset:offset + n * width])
+            offset += n * width
+        log.txs[:] = buf[offset:offset + n * TX_SIZE]
+        return log
+
+    @staticmethod
+    def encoded_size(n):
+        return n * (8 + 8 + 4 + 4 + TX_SIZE)
@@ -0,0 +1,268 @@
+"""Admission control for the redemption and balance endpoints.
+
+Every request to a guarded endpoint passes three checks before it runs:
+
+- its wallet's token bucket, so one wallet (a stuck button, a script)
+  cannot take more than ``wallet_rate`` requests a second;
+- the endpoint's global token bucket, of which batch traffic may not
+  spend the last ``BATCH_RESERVE`` share, so interactive users still get
+  in while batch clients are being turned away;
+- a limit of ``concurrency`` requests running at once. Requests over it
+  wait in a bounded queue, interactive ones first, for at most
+  ``max_wait`` seconds. A full queue sheds its newest batch request to
+  make room for an interactive one.
+
+A request that fails a check raises ``Rejected`` at once, with how long
+the client should wait before retrying. ``AdmissionMiddleware`` answers
+it with 429 before the request is routed or its body parsed, so turning
+a request away costs a small fraction of serving it. Under overload,
+clients get a fast answer instead of a timeout, and the requests that are
+admitted still finish quickly. A request is interactive only if it is
+authenticated as coming from a dashboard, with one of the service's
+interactive tokens as its bearer token; everything else is batch
+traffic, whatever headers it sends.
+
+Buckets for up to ``max_wallets`` wallets are kept in two flat arrays.
+A bucket that has refilled is the same as no bucket, so when every slot
+is taken the full ones are reclaimed first. If that is not enough, the
+least recently used ones are reclaimed next.
+
+Waiting happens on the event loop, so ``admit`` and ``release`` must be
+called from it.
+"""
+import asyncio
+import heapq
+import hmac
+import json
+import math
+import time
+from array import array
+from collections import deque
+
+from .metrics import HTTP_REQUESTS, Counter, Gauge
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+# Share of a global bucket only interactive requests may spend
+BATCH_RESERVE = 0.2
+MAX_WALLETS = 100_000
+# Share of the slots reclaimed at once when every wallet slot is taken
+RECLAIM_SHARE = 8
+
+ADMISSION_REJECTED = Counter("admission_rejected", "Requests shed by admission control",
+                             ["endpoint", "priority", "reason"])
+_controls = []
+Gauge("admission_waiting", "Requests queued for admission", lambda: {
+    (control.name, priority): len(control._waiting[priority])
+    for control in _controls for priority in PRIORITIES
+}, ["endpoint", "priority"])
+Gauge("admission_running", "Admitted requests still running",
+      lambda: {(control.name,): control.running for control in _controls}, ["endpoint"])
+
+REASONS = {
+    "wallet_rate": "Too many requests for this wallet",
+    "rate": "The service is busy",
+    "queue_full": "The service is busy",
+    "queue_timeout": "The service is busy",
+}
+
+
+class Rejected(Exception):
+    """Raised when a request is shed; ``retry_after`` is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{REASONS[reason]}; retry shortly.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled at ``rate`` tokens a second up to ``burst``"""
+
+    def __init__(self, rate, burst, max_keys=MAX_WALLETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._slots = {}  # key -> index into the arrays
+        self._tokens = array("d")
+        self._updated = array("d")
+        self._free = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def take(self, key, now=None, reserve=0.0):
+        """Take a token for ``key``; return 0 if one was taken, else seconds until one is due
+
+        A token is only taken if ``reserve`` tokens are left behind.
+        """
+        now = time.monotonic() if now is None else now
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key, now)
+        tokens = min(self.burst, self._tokens[slot] + (now - self._updated[slot]) * self.rate)
+        self._updated[slot] = now
+        if tokens >= 1 + reserve:
+            self._tokens[slot] = tokens - 1
+            return 0.0
+        self._tokens[slot] = tokens
+        return (1 + reserve - tokens) / self.rate
+
+    def _allocate(self, key, now):
+        if not self._free and len(self._slots) >= self.max_keys:
+            self._reclaim(now)
+        if self._free:
+            slot = self._free.pop()
+            self._tokens[slot] = self.burst
+            self._updated[slot] = now
+        else:
+            slot = len(self._tokens)
+            self._tokens.append(self.burst)
+            self._updated.append(now)
+        self._slots[key] = slot
+        return slot
+
+    def _reclaim(self, now):
+        tokens, updated, rate, burst = self._tokens, self._updated, self.rate, self.burst
+        full = [key for key, slot in self._slots.items()
+                if tokens[slot] + (now - updated[slot]) * rate >= burst]
+        wanted = max(1, self.max_keys // RECLAIM_SHARE)
+        if len(full) < wanted:
+            full.extend(heapq.nsmallest(wanted - len(full), self._slots, key=lambda k: updated[self._slots[k]]))
+        for key in full:
+            slot = self._slots.pop(key, None)
+            if slot is not None:
+                self._free.append(slot)
+
+
+class Admission:
+    """Admission for one group of endpoints; see the module docstring"""
+
+    def __init__(self, name, concurrency, queue_limit, max_wait, wallet_rate, wallet_burst, rate, burst,
+                 max_wallets=MAX_WALLETS):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.max_wait = max_wait
+        self.wallets = TokenBuckets(wallet_rate, wallet_burst, max_wallets)
+        self.total = TokenBuckets(rate, burst, 1)
+        self.running = 0
+        self._waiting = {priority: deque() for priority in PRIORITIES}
+        _controls.append(self)
+
+    def _reject(self, priority, reason, retry_after):
+        ADMISSION_REJECTED.labels(self.name, priority, reason).inc()
+        return Rejected(reason, retry_after)
+
+    async def admit(self, public_key, priority=BATCH):
+        """Wait for a slot for a request for ``public_key``; ``release`` it when the request is done
+
+        Raises ``Rejected`` if the request is shed.
+        """
+        now = time.monotonic()
+        wait = self.wallets.take(public_key, now)
+        if wait:
+            raise self._reject(priority, "wallet_rate", wait)
+        wait = self.total.take(None, now, 0.0 if priority == INTERACTIVE else self.total.burst * BATCH_RESERVE)
+        if wait:
+            raise self._reject(priority, "rate", wait)
+        if self.running < self.concurrency:
+            self.running += 1
+            return
+        batch = self._waiting[BATCH]
+        if len(self._waiting[INTERACTIVE]) + len(batch) >= self.queue_limit:
+            if priority == BATCH or not batch:
+                raise self._reject(priority, "queue_full", self.max_wait)
+            while batch:
+                shed = batch.pop()
+                if not shed.done():
+                    shed.set_exception(self._reject(BATCH, "queue_full", self.max_wait))
+                    break
+        future = asyncio.get_running_loop().create_future()
+        queue = self._waiting[priority]
+        queue.append(future)
+        timer = asyncio.get_running_loop().call_later(self.max_wait, self._expire, future, priority)
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Cancelled just after being handed a slot: pass it on
+                self.release()
+            raise
+        finally:
+            timer.cancel()
+            if not future.done() or future.cancelled():
+                try:
+                    queue.remove(future)
+                except ValueError:
+                    pass
+
+    def _expire(self, future, priority):
+        if not future.done():
+            self._waiting[priority].remove(future)
+            future.set_exception(self._reject(priority, "queue_timeout", self.max_wait))
+
+    def release(self):
+        """Hand the finished request's slot to the next waiter, interactive ones first"""
+        for priority in PRIORITIES:
+            queue = self._waiting[priority]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.running -= 1
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting requests to ``/wallets/{public_key}/<endpoint>``
+
+    ``rules`` maps ``(method, endpoint)`` to the ``Admission`` guarding it;
+    other requests pass straight through. Requests with
+    ``Authorization: Bearer <token>`` for one of ``interactive_tokens`` are
+    interactive. The requests it turns away never reach routing, so it
+    counts them in ``http_requests`` itself, under their route.
+    """
+
+    def __init__(self, app, rules, interactive_tokens=()):
+        self.app = app
+        self.rules = rules
+        self._interactive = [f"Bearer {token}".encode() for token in interactive_tokens]
+
+    def _priority(self, headers):
+        if self._interactive:
+            for name, value in headers:
+                if name == b"authorization":
+                    # Compared in constant time, so a token cannot be guessed a byte at a time
+                    if any(hmac.compare_digest(value, token) for token in self._interactive):
+                        return INTERACTIVE
+                    break
+        return BATCH
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        parts = scope["path"].split("/")
+        control = None
+        if len(parts) == 4 and parts[1] == "wallets":
+            control = self.rules.get((scope["method"], parts[3]))
+        if control is None:
+            return await self.app(scope, receive, send)
+        priority = self._priority(scope["headers"])
+        try:
+            await control.admit(parts[2], priority)
+        except Rejected as e:
+            HTTP_REQUESTS.labels(f"/wallets/{{public_key}}/{parts[3]}", scope["method"], 429).inc()
+            body = json.dumps({"detail": str(e)}).encode()
+            await send({"type": "http.response.start", "status": 429, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(e.retry_after))).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.release()
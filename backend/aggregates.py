@@ -0,0 +1,344 @@
+"""Per-wallet lifetime totals and the earnings leaderboard.
+
+The ledger keeps both up to date as it writes, so dashboards read them
+without scanning any activity. Each wallet carries a ``WalletTotals``
+(points earned and redeemed, earnings per platform, and its streak of
+consecutive UTC days with an earning), updated under the wallet's lock
+as each activity is recorded, or once per wallet for a bulk credit.
+After a restart or an import, ``WalletTotals.from_logs`` rebuilds the
+totals of every wallet at once from the logs' columns.
+
+``Leaderboard`` ranks wallets by points earned in one sorted sequence of
+integer keys (the negated score above a dense wallet id), split into
+buckets of a few hundred keys and searched with ``bisect``. A Fenwick
+tree over the bucket lengths counts the entries before any bucket.
+Moving a wallet, finding its rank and counting the wallets ahead of a
+score therefore take O(log n) time, plus a short move within one bucket.
+Reading the top k walks the first buckets, which is O(k). Moves are
+queued as they are written. Once more than ``READ_APPLY_LIMIT`` are
+queued, the write applies them all, merging them in with one sort when
+they are more than one wallet in ``MERGE_SHARE``; a read moves the few
+left queued one at a time, so it never sorts the board. Wallets with
+equal scores share a rank (1 + the number of wallets with more points)
+and are listed in the order they first reached the board.
+"""
+import threading
+from bisect import bisect_left, insort
+from itertools import chain, islice
+
+from .lazy import lazy_import
+
+# Only needed to rebuild totals from recovered or imported logs
+np = lazy_import("numpy")
+
+SECONDS_PER_DAY = 86400
+# Buckets are split once they hold twice this many keys
+BUCKET_LOAD = 512
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+# Queued moves over one wallet in this many are merged with a sort
+MERGE_SHARE = 16
+# Moves left queued for the next read; a write queueing more applies them
+READ_APPLY_LIMIT = 64
+
+
+class WalletTotals:
+    __slots__ = ("earned", "redeemed", "platforms", "streak", "longest_streak", "last_day")
+
+    def __init__(self):
+        self.earned = 0
+        self.redeemed = 0
+        self.platforms = {}  # type code -> points earned
+        self.streak = 0
+        self.longest_streak = 0
+        self.last_day = None  # UTC day of the latest earning
+
+    @classmethod
+    def from_logs(cls, logs):
+        """Totals for each of a sequence of activity logs, computed over all their columns at once"""
+        logs = list(logs)
+        timestamps = [log.timestamps for log in logs]
+        lengths = np.fromiter(map(len, timestamps), dtype=np.int64, count=len(logs))
+        owner = np.repeat(np.arange(len(logs)), lengths)
+        points = np.frombuffer(b"".join([log.points for log in logs]), dtype=np.int64)
+        earning = points >= 0
+        redeemed = np.zeros(len(logs), dtype=np.int64)
+        np.add.at(redeemed, owner[~earning], -points[~earning])
+        owner, points = owner[earning], points[earning]
+        types = np.frombuffer(b"".join([log.types for log in logs]), dtype=np.uint32)[earning]
+        days = np.frombuffer(b"".join(timestamps), dtype=np.int64)[earning] // SECONDS_PER_DAY
+
+        # Points per (log, type) pair; pairs come out grouped by log
+        pairs, pair_of = np.unique(owner << ID_BITS | types, return_inverse=True)
+        pair_points = np.zeros(len(pairs), dtype=np.int64)
+        np.add.at(pair_points, pair_of, points)
+        platforms = [{} for _ in logs]
+        for pair, total in zip(pairs.tolist(), pair_points.tolist()):
+            platforms[pair >> ID_BITS][pair & ID_MASK] = total
+
+        # Logs are in time order, so each log's distinct days come out sorted
+        log_days = np.unique(owner << ID_BITS | days)
+        day_owner, days = log_days >> ID_BITS, log_days & ID_MASK
+        starts = np.ones(len(log_days), dtype=bool)
+        starts[1:] = (day_owner[1:] != day_owner[:-1]) | (days[1:] != days[:-1] + 1)
+        run_starts = np.flatnonzero(starts)
+        run_lengths = np.diff(run_starts, append=len(log_days))
+        run_owner = day_owner[run_starts]
+        longest = np.zeros(len(logs), dtype=np.int64)
+        np.maximum.at(longest, run_owner, run_lengths)
+        # Each log's latest run and day are the last of its own
+        last_run = np.flatnonzero(np.diff(run_owner, append=-1))
+        streak = np.zeros(len(logs), dtype=np.int64)
+        streak[run_owner[last_run]] = run_lengths[last_run]
+        last = np.flatnonzero(np.diff(day_owner, append=-1))
+        last_day = np.full(len(logs), -1, dtype=np.int64)
+        last_day[day_owner[last]] = days[last]
+        earned = np.zeros(len(logs), dtype=np.int64)
+        np.add.at(earned, owner, points)
+
+        result = []
+        new = object.__new__
+        for e, r, by_type, s, longest_streak, day in zip(
+            earned.tolist(), redeemed.tolist(), platforms, streak.tolist(), longest.tolist(), last_day.tolist()
+        ):
+            # Every slot is set here, so __init__ is skipped
+            totals = new(cls)
+            totals.earned = e
+            totals.redeemed = r
+            totals.platforms = by_type
+            totals.streak = s
+            totals.longest_streak = longest_streak
+            totals.last_day = None if day < 0 else day
+            result.append(totals)
+        return result
+
+    def add(self, timestamp, type_code, points):
+        if points < 0:
+            self.redeemed -= points
+            return
+        self.earned += points
+        self.platforms[type_code] = self.platforms.get(type_code, 0) + points
+        self._earned_on(timestamp // SECONDS_PER_DAY)
+
+    def add_earnings(self, timestamp, earnings):
+        """``add`` for ``(type_code, points, tx)`` earnings sharing one timestamp; returns the points"""
+        platforms = self.platforms
+        earned = 0
+        for type_code, points, _ in earnings:
+            earned += points
+            platforms[type_code] = platforms.get(type_code, 0) + points
+        self.earned += earned
+        day = timestamp // SECONDS_PER_DAY
+        if day != self.last_day:
+            self._earned_on(day)
+        return earned
+
+    def _earned_on(self, day):
+        if self.last_day is not None and day <= self.last_day:
+            return
+        self.streak = self.streak + 1 if self.last_day is not None and day == self.last_day + 1 else 1
+        self.longest_streak = max(self.longest_streak, self.streak)
+        self.last_day = day
+
+    def current_streak(self, today):
+        """The streak as of ``today``; it lapses once a whole day passes without an earning"""
+        if self.last_day is None or self.last_day < today - 1:
+            return 0
+        return self.streak
+
+
+class Leaderboard:
+    """Wallets ranked by score; thread-safe"""
+
+    def __init__(self, load=BUCKET_LOAD):
+        self._load = load
+        self._buckets = []  # sorted runs of keys, best first
+        self._maxes = []  # last key of each bucket
+        self._sizes = [0]  # Fenwick tree over bucket lengths, 1-based
+        self._length = 0
+        self._keys = {}  # public key -> its current key
+        self._pending = {}  # public key -> score not yet applied
+        self._ids = {}  # public key -> dense id
+        self._public_keys = []  # dense id -> public key
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._catch_up()
+            return self._length
+
+    def _index(self):
+        sizes = [0] + [len(bucket) for bucket in self._buckets]
+        for i in range(1, len(sizes)):
+            parent = i + (i & -i)
+            if parent < len(sizes):
+                sizes[parent] += sizes[i]
+        self._sizes = sizes
+
+    def _resize(self, bucket, delta):
+        sizes = self._sizes
+        i = bucket + 1
+        while i < len(sizes):
+            sizes[i] += delta
+            i += i & -i
+
+    # _insert and _remove leave the Fenwick tree to their caller: they return
+    # the bucket whose length changed, or None if they re-indexed instead
+
+    def _insert(self, key):
+        self._length += 1
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._index()
+            return None
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._buckets[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._buckets[i], key)
+        bucket = self._buckets[i]
+        if len(bucket) > 2 * self._load:
+            self._buckets[i:i + 1] = [bucket[:self._load], bucket[self._load:]]
+            self._maxes[i:i + 1] = [bucket[self._load - 1], bucket[-1]]
+            self._index()
+            return None
+        return i
+
+    def _remove(self, key):
+        self._length -= 1
+        i = bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if not bucket:
+            del self._buckets[i], self._maxes[i]
+            self._index()
+            return None
+        self._maxes[i] = bucket[-1]
+        return i
+
+    def _count_before(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._length
+        count = bisect_left(self._buckets[i], key)
+        while i > 0:
+            count += self._sizes[i]
+            i -= i & -i
+        return count
+
+    def _key(self, public_key, score):
+        wallet_id = self._ids.get(public_key)
+        if wallet_id is None:
+            wallet_id = self._ids[public_key] = len(self._public_keys)
+            self._public_keys.append(public_key)
+        return -score << ID_BITS | wallet_id
+
+    def update(self, public_key, score):
+        """Set a wallet's score; a score of 0 takes it off the board"""
+        self.update_many(((public_key, score),))
+
+    def update_many(self, scores):
+        """``update`` for each ``(public_key, score)`` pair, under one lock acquisition
+
+        The scores are queued; once more than ``READ_APPLY_LIMIT`` are, this
+        call applies everything queued in a single pass.
+        """
+        with self._lock:
+            self._pending.update(scores)
+            if len(self._pending) <= READ_APPLY_LIMIT:
+                return
+            scores, self._pending = self._pending, {}
+            if len(scores) * MERGE_SHARE > self._length:
+                self._merge(scores.items())
+            else:
+                self._move(scores.items())
+
+    def _catch_up(self):
+        # Reads move the few queued wallets one at a time rather than sort
+        if self._pending:
+            scores, self._pending = self._pending, {}
+            self._move(scores.items())
+
+    def _move(self, scores):
+        resized = {}  # bucket -> change in length not yet in the Fenwick tree
+        for public_key, score in scores:
+            old = self._keys.pop(public_key, None)
+            if old is not None:
+                removed = self._remove(old)
+                if removed is None:
+                    resized.clear()  # re-indexed: the tree is exact again
+                else:
+                    resized[removed] = resized.get(removed, 0) - 1
+            if score:
+                key = self._keys[public_key] = self._key(public_key, score)
+                inserted = self._insert(key)
+                if inserted is None:
+                    resized.clear()
+                else:
+                    resized[inserted] = resized.get(inserted, 0) + 1
+        # Past a point, re-indexing every bucket beats walking the tree per bucket
+        if len(resized) * len(self._buckets).bit_length() > len(self._buckets):
+            self._index()
+        else:
+            for bucket, delta in resized.items():
+                if delta:
+                    self._resize(bucket, delta)
+
+    def _merge(self, scores):
+        removed = set()
+        added = []
+        for public_key, score in scores:
+            old = self._keys.pop(public_key, None)
+            if old is not None:
+                removed.add(old)
+            if score:
+                key = self._keys[public_key] = self._key(public_key, score)
+                added.append(key)
+        keys = [key for key in chain.from_iterable(self._buckets) if key not in removed]
+        keys.extend(sorted(added))
+        # Two sorted runs, which the sort merges in one pass
+        keys.sort()
+        self._split(keys)
+
+    def _split(self, keys):
+        self._buckets = [keys[i:i + self._load] for i in range(0, len(keys), self._load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._length = len(keys)
+        self._index()
+
+    def rebuild(self, scores):
+        """Replace the board with ``(public_key, score)`` pairs in one sort"""
+        with self._lock:
+            self._pending = {}
+            self._keys = {public_key: self._key(public_key, score) for public_key, score in scores if score}
+            self._split(sorted(self._keys.values()))
+
+    def remove(self, public_key):
+        self.update(public_key, 0)
+
+    def top(self, k):
+        """The ``k`` highest ``(public_key, score)`` pairs, best first"""
+        with self._lock:
+            self._catch_up()
+            return [
+                (self._public_keys[key & ID_MASK], -(key >> ID_BITS))
+                for key in islice(chain.from_iterable(self._buckets), k)
+            ]
+
+    def rank(self, public_key):
+        """A wallet's rank (1 + the wallets with more points), or None if it is not on the board"""
+        with self._lock:
+            self._catch_up()
+            key = self._keys.get(public_key)
+            if key is None:
+                return None
+            return self._count_before(key >> ID_BITS << ID_BITS) + 1
+
+    def ahead_of(self, score):
+        """How many wallets have more than ``score`` points"""
+        with self._lock:
+            self._catch_up()
+            return self._count_before(-score << ID_BITS)
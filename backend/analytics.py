@@ -0,0 +1,172 @@
+"""Columnar activity store and vectorized analytics.
+
+Activities are laid out as Arrow tables: int64 timestamps and points,
+dictionary-encoded wallet/type/reward columns and fixed-width 32-byte
+transaction ids. Tables are written as numbered partitions in either
+Arrow IPC (memory-mapped on read) or Parquet, and aggregations run on
+pyarrow compute kernels rather than Python loops.
+"""
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from .activity import TX_SIZE
+
+SECONDS_PER_DAY = 86400
+
+ACTIVITY_SCHEMA = pa.schema([
+    ("wallet", pa.dictionary(pa.int32(), pa.string())),
+    ("timestamp", pa.int64()),
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("reward", pa.dictionary(pa.int32(), pa.string())),
+    ("points", pa.int64()),
+    ("tx", pa.binary(TX_SIZE)),
+])
+
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def _labels_array(codes, labels):
+    # Code 0 is the string table's None entry: mask it rather than store a null value
+    indices = pa.array(codes.astype(np.int32), mask=codes == 0)
+    return pa.DictionaryArray.from_arrays(indices, pa.array(["", *labels[1:]], pa.string()))
+
+
+def ledger_table(ledger):
+    """Copy every wallet's activity log into one Arrow table
+
+    Labels keep the ledger's own interned codes, so the type and reward
+    columns are dictionary-encoded without re-hashing any strings.
+    """
+    wallets, counts = [], []
+    columns = {"timestamps": [], "points": [], "types": [], "rewards": [], "txs": []}
+    labels, logs = ledger.wallet_logs()
+    for public_key, log in logs:
+        # Columns are appended timestamps-last, so this length is safe for all
+        n = len(log.timestamps)
+        if not n:
+            continue
+        wallets.append(public_key)
+        counts.append(n)
+        columns["timestamps"].append(log.timestamps[:n].tobytes())
+        columns["points"].append(log.points[:n].tobytes())
+        columns["types"].append(log.types[:n].tobytes())
+        columns["rewards"].append(log.rewards[:n].tobytes())
+        columns["txs"].append(bytes(log.txs[:n * TX_SIZE]))
+
+    def column(name, dtype):
+        return np.frombuffer(b"".join(columns[name]), dtype=dtype)
+
+    wallet_codes = np.repeat(np.arange(len(wallets), dtype=np.int32), counts)
+    return pa.table({
+        "wallet": pa.DictionaryArray.from_arrays(wallet_codes, pa.array(wallets, pa.string())),
+        "timestamp": column("timestamps", np.int64),
+        "type": _labels_array(column("types", np.uint32), labels),
+        "reward": _labels_array(column("rewards", np.uint32), labels),
+        "points": column("points", np.int64),
+        "tx": pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(TX_SIZE), sum(counts), [None, pa.py_buffer(b"".join(columns["txs"]))]
+        ),
+    }, schema=ACTIVITY_SCHEMA)
+
+
+def records_table(records, wallet=""):
+    """Convert frontend-style activity dicts into an Arrow table
+
+    Accepts both ``{'date', 'type', 'points', 'tx'}`` (app.py) and
+    ``{'date', 'app', 'points', 'tx'}`` (app2.py) rows; ``tx`` must be a
+    64-character hex id.
+    """
+    dates = pa.array([r["date"] for r in records], pa.string())
+    timestamps = pc.cast(pc.strptime(dates, format="%Y-%m-%d", unit="s"), pa.int64())
+    types = pa.array([r.get("type", r.get("app")) for r in records], pa.string()).dictionary_encode()
+    txs = b"".join(bytes.fromhex(r["tx"]) for r in records)
+    n = len(records)
+    return pa.table({
+        "wallet": pa.DictionaryArray.from_arrays(np.zeros(n, np.int32), pa.array([wallet])),
+        "timestamp": timestamps,
+        "type": types,
+        "reward": pa.DictionaryArray.from_arrays(pa.nulls(n, pa.int32()), pa.array([], pa.string())),
+        "points": pa.array([r["points"] for r in records], pa.int64()),
+        "tx": pa.FixedSizeBinaryArray.from_buffers(pa.binary(TX_SIZE), n, [None, pa.py_buffer(txs)]),
+    }, schema=ACTIVITY_SCHEMA)
+
+
+class ActivityStore:
+    """A directory of numbered activity partitions"""
+
+    def __init__(self, directory, format="arrow"):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}; expected one of {sorted(FORMATS)}")
+        self.directory = directory
+        self.format = format
+        os.makedirs(directory, exist_ok=True)
+
+    def partitions(self):
+        ext = FORMATS[self.format]
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith("part-") and name.endswith(ext)
+        )
+
+    def append(self, table, rows_per_partition=10_000_000):
+        """Write ``table`` as one or more new partitions"""
+        ext = FORMATS[self.format]
+        next_part = len(self.partitions())
+        for offset in range(0, max(table.num_rows, 1), rows_per_partition):
+            chunk = table.slice(offset, rows_per_partition)
+            path = os.path.join(self.directory, f"part-{next_part:06d}{ext}")
+            tmp = path + ".tmp"
+            if self.format == "arrow":
+                with ipc.new_file(tmp, ACTIVITY_SCHEMA) as writer:
+                    writer.write_table(chunk)
+            else:
+                pq.write_table(chunk, tmp)
+            os.replace(tmp, path)
+            next_part += 1
+
+    def read(self, columns=None):
+        """Load all partitions; Arrow IPC partitions are memory-mapped, not copied"""
+        tables = []
+        for path in self.partitions():
+            if self.format == "arrow":
+                table = ipc.open_file(pa.memory_map(path)).read_all()
+                tables.append(table.select(columns) if columns else table)
+            else:
+                tables.append(pq.read_table(path, columns=columns, memory_map=True))
+        if not tables:
+            return ACTIVITY_SCHEMA.empty_table().select(columns) if columns else ACTIVITY_SCHEMA.empty_table()
+        return pa.concat_tables(tables, promote_options="permissive")
+
+
+def points_per_platform_per_day(table, since=None, until=None):
+    """Sum of points earned per platform (activity type) per UTC day"""
+    if since is not None:
+        table = table.filter(pc.greater_equal(table["timestamp"], since))
+    if until is not None:
+        table = table.filter(pc.less_equal(table["timestamp"], until))
+    table = table.filter(pc.greater(table["points"], 0))
+    # Partitions carry their own dictionaries; unify them so grouping can
+    # hash the integer codes instead of the strings
+    earned = pa.table({
+        "platform": table["type"],
+        "day": pc.multiply(pc.divide(table["timestamp"], SECONDS_PER_DAY), SECONDS_PER_DAY),
+        "points": table["points"],
+    }).unify_dictionaries()
+    grouped = earned.group_by(["platform", "day"]).aggregate([("points", "sum")])
+    grouped = grouped.set_column(0, "platform", pc.cast(grouped["platform"], pa.string()))
+    return grouped.sort_by([("day", "descending"), ("platform", "ascending")])
+
+
+def top_earners(table, k=10):
+    """The ``k`` wallets with the most points earned"""
+    table = table.filter(pc.greater(table["points"], 0))
+    earned = pa.table({"wallet": table["wallet"], "points": table["points"]}).unify_dictionaries()
+    totals = earned.group_by("wallet").aggregate([("points", "sum")])
+    top = totals.take(pc.select_k_unstable(totals, k, [("points_sum", "descending")]))
+    return top.set_column(0, "wallet", pc.cast(top["wallet"], pa.string()))
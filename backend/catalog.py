@@ -0,0 +1,197 @@
+"""Rewards catalog: items, stock and cached listings.
+
+Rewards are loaded from a JSON file (``catalog.json`` beside this module
+by default) and indexed by category and by price: each index is a list
+sorted by points, so a points range is two bisections rather than a scan.
+
+Stock is decremented by ``reserve`` under the catalog lock, so concurrent
+redemptions of the last few units can never take more than there are.
+Every change bumps the catalog version. Listings are serialized once per
+version and query and served with the version as their ETag, so clients
+revalidating an unchanged catalog get a 304 without anything being
+rebuilt. Stock is not logged separately: on startup it is recomputed by
+subtracting the redemptions already recorded in the ledger.
+"""
+import json
+import os
+import secrets
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Optional
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), "catalog.json")
+
+# Serialized listings kept per catalog version (distinct query parameters)
+LISTING_CACHE_SIZE = 256
+
+
+class UnknownReward(Exception):
+    """Raised for a reward id that is not in the catalog"""
+
+
+class OutOfStock(Exception):
+    """Raised when a reward has no units left to redeem"""
+
+
+@dataclass
+class Reward:
+    id: str
+    name: str
+    category: str
+    points: int
+    image: str
+    description: str
+    # None means unlimited
+    stock: Optional[int] = None
+    # Resized copies of ``image`` served at /images/<name>: {ext: [[width, name], ...]}
+    thumbnails: Optional[dict] = None
+
+
+class _PriceIndex:
+    """Reward ids sorted by points"""
+
+    __slots__ = ("points", "ids")
+
+    def __init__(self, rewards):
+        ordered = sorted(rewards, key=lambda r: (r.points, r.id))
+        self.points = [r.points for r in ordered]
+        self.ids = [r.id for r in ordered]
+
+    def between(self, min_points=None, max_points=None):
+        lo = 0 if min_points is None else bisect_left(self.points, min_points)
+        hi = len(self.points) if max_points is None else bisect_right(self.points, max_points)
+        return self.ids[lo:hi]
+
+
+class Catalog:
+    def __init__(self, rewards=()):
+        self._lock = threading.Lock()
+        self._rewards = {r.id: r for r in rewards}
+        # Distinguishes this process's ETags from those served before a restart
+        self._epoch = secrets.token_hex(4)
+        self._version = 0
+        self._listings = {}
+        self._reindex()
+
+    @classmethod
+    def load(cls, path=CATALOG_PATH):
+        with open(path) as f:
+            return cls(Reward(**item) for item in json.load(f))
+
+    def _reindex(self):
+        by_category = {}
+        for reward in self._rewards.values():
+            by_category.setdefault(reward.category, []).append(reward)
+        self._index = {None: _PriceIndex(self._rewards.values())}
+        self._index.update((category, _PriceIndex(items)) for category, items in by_category.items())
+
+    def _changed(self):
+        # Callers hold the lock
+        self._version += 1
+        self._listings.clear()
+
+    @property
+    def etag(self):
+        return f'"{self._epoch}-{self._version}"'
+
+    def get(self, reward_id):
+        reward = self._rewards.get(reward_id)
+        if reward is None:
+            raise UnknownReward(f"Unknown reward {reward_id!r}.")
+        return reward
+
+    def categories(self):
+        return sorted(category for category in self._index if category is not None)
+
+    def find(self, category=None, min_points=None, max_points=None):
+        """Rewards in ``category`` priced within ``[min_points, max_points]``, cheapest first"""
+        index = self._index.get(category)
+        if index is None:
+            return []
+        return [self._rewards[i] for i in index.between(min_points, max_points)]
+
+    def listing(self, category=None, min_points=None, max_points=None):
+        """Return ``(etag, body)`` for a query, serializing it at most once per version"""
+        query = (category, min_points, max_points)
+        with self._lock:
+            etag = self.etag
+            body = self._listings.get(query)
+            if body is not None:
+                return etag, body
+            version = self._version
+            items = [dict(vars(r)) for r in self.find(*query)]
+        body = json.dumps({"version": version, "rewards": items}, separators=(",", ":")).encode()
+        with self._lock:
+            # Only cache it if nothing changed while it was being built
+            if self._version == version:
+                if len(self._listings) >= LISTING_CACHE_SIZE:
+                    self._listings.clear()
+                self._listings[query] = body
+        return etag, body
+
+    def reserve(self, reward_id, quantity=1):
+        """Take ``quantity`` units of a reward from stock, returning what is left"""
+        reward = self.get(reward_id)
+        with self._lock:
+            if reward.stock is not None:
+                if reward.stock < quantity:
+                    raise OutOfStock(f"{reward.name} is out of stock.")
+                reward.stock -= quantity
+                self._changed()
+            return reward.stock
+
+    def release(self, reward_id, quantity=1):
+        """Return units taken by ``reserve`` to stock"""
+        reward = self.get(reward_id)
+        with self._lock:
+            if reward.stock is not None:
+                reward.stock += quantity
+                self._changed()
+
+    def set_thumbnails(self, reward_id, thumbnails):
+        reward = self.get(reward_id)
+        with self._lock:
+            reward.thumbnails = thumbnails
+            self._changed()
+
+    def upsert(self, reward):
+        """Add a reward or replace one with the same id"""
+        with self._lock:
+            self._rewards[reward.id] = reward
+            self._reindex()
+            self._changed()
+
+    def restock_from(self, ledger):
+        """Subtract the units that redemptions already in ``ledger`` took from each reward's stock
+
+        Only redemptions made against a catalog ``reward_id`` took stock, so
+        free-form ones that share a reward's name are not counted.
+        """
+        taken = ledger.stock_taken()
+        with self._lock:
+            for reward in self._rewards.values():
+                if reward.stock is not None and reward.id in taken:
+                    reward.stock = max(0, reward.stock - taken[reward.id])
+            self._changed()
+
+    def stock(self, reward_id):
+        """A handle on one reward's stock, for ``Ledger.redeem``"""
+        self.get(reward_id)
+        return RewardStock(self, reward_id)
+
+
+class RewardStock:
+    """One unit of a reward's stock, taken by ``reserve`` and returned by ``release``"""
+
+    __slots__ = ("catalog", "reward_id")
+
+    def __init__(self, catalog, reward_id):
+        self.catalog = catalog
+        self.reward_id = reward_id
+
+    def reserve(self):
+        return self.catalog.reserve(self.reward_id)
+
+    def release(self):
+        self.catalog.release(self.reward_id)
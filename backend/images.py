@@ -0,0 +1,180 @@
+"""Reward image thumbnails: fetched once, resized once, cached on disk.
+
+Reward cards show their image cropped to a 200px-tall box, but the
+catalog points at remote images sized for something else. ``ImageCache``
+downloads each one once, crops and scales it to the card's aspect ratio
+at the widths in ``THUMBNAIL_WIDTHS`` and encodes it as WebP (and AVIF
+when the installed Pillow can write it). Images are never scaled up:
+widths the source cannot fill are replaced by the widest crop it has,
+so a high-density screen gets the source's own detail in fewer bytes
+rather than an enlarged copy.
+
+Files are content-addressed: a thumbnail's name is a hash of the source
+image's bytes and the encoding settings, so a name always denotes the
+same bytes and can be served with an immutable, year-long cache
+lifetime. Sources and thumbnails share one byte budget; when it is
+exceeded the least recently used files are deleted. A thumbnail evicted
+after being handed out is regenerated on its next request.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from .lazy import lazy_import
+
+httpx = lazy_import("httpx")
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+THUMBNAIL_WIDTHS = (400, 800)
+# Width over height of the card's image box
+THUMBNAIL_ASPECT = 2
+IMAGE_CACHE_BYTES = 256 * 2**20
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# extension -> (Pillow format, media type, save options)
+ENCODINGS = {
+    "avif": ("AVIF", "image/avif", {"quality": 50}),
+    "webp": ("WEBP", "image/webp", {"quality": 70, "method": 6}),
+}
+MEDIA_TYPES = {ext: media_type for ext, (_, media_type, _) in ENCODINGS.items()}
+
+
+@lru_cache(maxsize=None)
+def formats():
+    """Extensions of the encodings this Pillow can write"""
+    Image.init()
+    return [ext for ext, (fmt, _, _) in ENCODINGS.items() if fmt in Image.SAVE]
+
+
+def _fetch(url):
+    response = httpx.get(url, timeout=10, follow_redirects=True)
+    response.raise_for_status()
+    return response.content
+
+
+def fit_widths(source, widths, aspect):
+    """The ``widths`` that ``source`` can fill at ``aspect`` without scaling up, capped at its widest crop"""
+    with Image.open(io.BytesIO(source)) as image:
+        width, height = image.size
+        # EXIF orientations 5-8 are rotated a quarter turn
+        if image.getexif().get(0x0112, 1) > 4:
+            width, height = height, width
+    widest = min(width, height * aspect)
+    fitted = [w for w in widths if w <= widest]
+    if len(fitted) < len(widths):
+        fitted.append(widest)
+    return fitted
+
+
+def render_thumbnail(source, width, height, ext):
+    """Crop ``source`` (encoded image bytes) to ``width``x``height`` and encode it"""
+    fmt, _, options = ENCODINGS[ext]
+    with Image.open(io.BytesIO(source)) as image:
+        image.draft("RGB", (width, height))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        thumbnail = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    thumbnail.save(out, fmt, **options)
+    return out.getvalue()
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=IMAGE_CACHE_BYTES, fetch=_fetch):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # name -> size, least recently used first
+        self._bytes = 0
+        self._recipes = {}  # thumbnail name -> (url, width, height, ext)
+        os.makedirs(directory, exist_ok=True)
+        # Files from earlier runs start out in the order they were written
+        existing = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                existing.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self._files[name] = size
+            self._bytes += size
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read(self, name):
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, name, data):
+        tmp = self._path(f"{name}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(name))
+        with self._lock:
+            self._bytes += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                evicted, size = self._files.popitem(last=False)
+                self._bytes -= size
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    def _source(self, url):
+        name = hashlib.blake2b(url.encode(), digest_size=16).hexdigest() + ".src"
+        data = self._read(name)
+        if data is None:
+            data = self._fetch(url)
+            self._write(name, data)
+        return data
+
+    def thumbnail(self, url, width, height, ext):
+        """Name of the cached ``width``x``height`` thumbnail of ``url`` in format ``ext``"""
+        source = self._source(url)
+        key = hashlib.blake2b(source, digest_size=16)
+        key.update(f"{width}x{height}:{ENCODINGS[ext]}".encode())
+        name = f"{key.hexdigest()}.{ext}"
+        with self._lock:
+            self._recipes[name] = (url, width, height, ext)
+            cached = name in self._files
+        if not cached:
+            self._write(name, render_thumbnail(source, width, height, ext))
+        return name
+
+    def thumbnails(self, url, widths=THUMBNAIL_WIDTHS, aspect=THUMBNAIL_ASPECT):
+        """``{ext: [[width, name], ...]}`` for every format this Pillow can write (see ``fit_widths``)"""
+        widths = fit_widths(self._source(url), widths, aspect)
+        return {
+            ext: [[width, self.thumbnail(url, width, width // aspect, ext)] for width in widths]
+            for ext in formats()
+        }
+
+    def get(self, name):
+        """Bytes of a thumbnail, regenerating it if it was evicted and its source is known"""
+        if name.endswith(".src"):
+            return None
+        data = self._read(name)
+        if data is None:
+            with self._lock:
+                recipe = self._recipes.get(name)
+            if recipe is not None:
+                self.thumbnail(*recipe)
+                data = self._read(name)
+        return data
+
+    def size(self):
+        """Bytes currently held on disk"""
+        with self._lock:
+            return self._bytes
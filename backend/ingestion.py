@@ -0,0 +1,331 @@
+"""Ingestion of points earned on connected partner platforms.
+
+Platforms post batches of earn events. A batch that validates is written
+to an intake journal and put on a bounded queue, and is acknowledged once
+the journal write is on disk; when the queue is full, ``submit`` raises
+``Backpressure`` and the API answers 429 so the sender slows down instead
+of the service buffering without limit.
+
+A single applier thread drains the queue, merging whatever batches have
+queued up into one bulk credit of up to ``max_apply`` events. Each
+event's ledger transaction id is derived from its platform and
+``event_id``, which is also the key for de-duplication: ids seen in the
+last ``DEDUPE_TTL`` seconds (rebuilt from the ledger on startup) are
+dropped, so platforms may resend a batch whenever they are unsure it
+arrived.
+
+The journal is split into segments, and a segment is deleted once every
+batch in it has been applied. On startup the batches left in the journal
+are queued again; the ones a crash interrupted after they were credited
+are dropped as duplicates. A batch the ledger fails to apply is retried
+with backoff, and after ``APPLY_ATTEMPTS`` failures it is moved to a
+dead-letter file and counted in ``failed``.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from .metrics import span
+from .storage import WriteAheadLog, encode_earnings, iter_records
+
+logger = logging.getLogger(__name__)
+
+PLATFORMS = ("MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell")
+
+# Batches waiting to be applied before submitters are pushed back
+QUEUE_BATCHES = 256
+# Events credited to the ledger in one bulk write at most
+MAX_APPLY = 20_000
+# Seconds an event id is remembered for de-duplication, up to a cap
+DEDUPE_TTL = 60 * 60
+DEDUPE_CAPACITY = 5_000_000
+# Journal bytes per segment before it rotates
+JOURNAL_SEGMENT_BYTES = 64 << 20
+# Times a failing batch is applied before it is dead-lettered, and the first retry delay
+APPLY_ATTEMPTS = 5
+RETRY_DELAY = 0.5
+
+
+class Backpressure(Exception):
+    """Raised when the ingestion queue is full"""
+
+
+class UnknownPlatform(Exception):
+    """Raised for events from a platform that is not connected"""
+
+
+def event_tx(platform, event_id):
+    """Ledger transaction id of a platform's earn event"""
+    return hashlib.blake2b(f"{platform}\0{event_id}".encode(), digest_size=32).digest()
+
+
+@dataclass
+class IngestionStats:
+    received: int = 0
+    applied: int = 0
+    duplicates: int = 0
+    rejected_batches: int = 0
+    queued_batches: int = 0
+    failed: int = 0
+    apply_seconds: float = 0.0
+
+
+class IntakeJournal:
+    """Segmented log of accepted earn batches not yet applied to the ledger
+
+    On-disk layout inside the journal directory::
+
+        intake-00000007.log        batches accepted while segment 7 was current
+        dead-letter-00000002.log   batches the ledger failed to apply
+    """
+
+    def __init__(self, root, segment_bytes=JOURNAL_SEGMENT_BYTES):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._outstanding = {}  # segment -> batches not yet applied
+        segments = self._segments("intake")
+        self.segment = segments[-1] + 1 if segments else 0
+        self._size = 0
+        self._wal = WriteAheadLog(self._path("intake", self.segment))
+
+    def _path(self, kind, n):
+        return os.path.join(self.root, f"{kind}-{n:08d}.log")
+
+    def _segments(self, kind):
+        found = []
+        for name in os.listdir(self.root):
+            if name.startswith(kind + "-") and name.endswith(".log"):
+                found.append(int(name[len(kind) + 1:-4]))
+        return sorted(found)
+
+    def recover(self, max_apply):
+        """Yield ``(segment, timestamp, credits)`` for the batches left by an earlier run
+
+        Credits are regrouped into chunks of at most ``max_apply``, and each
+        segment's chunks are counted as outstanding until ``done``.
+        """
+        for segment in self._segments("intake"):
+            if segment == self.segment:
+                continue
+            with open(self._path("intake", segment), "rb") as f:
+                buf = f.read()
+            chunks = []
+            for _, (_, public_key, timestamp, points, platform, _, tx, _, _) in iter_records(buf):
+                if not chunks or len(chunks[-1][1]) >= max_apply:
+                    chunks.append((timestamp, []))
+                chunks[-1][1].append((public_key, platform, points, tx))
+            if not chunks:
+                os.remove(self._path("intake", segment))
+                continue
+            with self._lock:
+                self._outstanding[segment] = len(chunks)
+            for timestamp, credits in chunks:
+                yield segment, timestamp, credits
+
+    def append(self, timestamp, credits):
+        """Write a batch and wait until it is on disk, returning its segment"""
+        record = encode_earnings(timestamp, credits)
+        with self._lock:
+            segment = self.segment
+            seq = self._wal.append(record)
+            self._outstanding[segment] = self._outstanding.get(segment, 0) + 1
+            self._size += len(record)
+            if self._size >= self.segment_bytes:
+                self.segment += 1
+                self._size = 0
+                self._wal.rotate(self._path("intake", self.segment))
+        self._wal.wait(seq)
+        return segment
+
+    def done(self, segment):
+        """Mark one batch of ``segment`` applied (or given up on), deleting the segment after its last"""
+        with self._lock:
+            left = self._outstanding[segment] = self._outstanding[segment] - 1
+            if left or segment == self.segment:
+                return
+            del self._outstanding[segment]
+        os.remove(self._path("intake", segment))
+
+    def dead_letter(self, timestamp, credits):
+        """Keep credits the ledger failed to apply in a file of their own"""
+        segments = self._segments("dead-letter")
+        path = self._path("dead-letter", segments[-1] + 1 if segments else 0)
+        with open(path, "wb") as f:
+            f.write(encode_earnings(timestamp, credits))
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+
+class IngestionPipeline:
+    def __init__(self, ledger, platforms=PLATFORMS, queue_batches=QUEUE_BATCHES, max_apply=MAX_APPLY,
+                 dedupe_ttl=DEDUPE_TTL, dedupe_capacity=DEDUPE_CAPACITY, on_credit=None, journal_dir=None,
+                 apply_attempts=APPLY_ATTEMPTS, retry_delay=RETRY_DELAY):
+        self._ledger = ledger
+        self._platforms = frozenset(platforms)
+        self._queue = queue.Queue(queue_batches)
+        self._max_apply = max_apply
+        self._dedupe_ttl = dedupe_ttl
+        self._dedupe_capacity = dedupe_capacity
+        self._on_credit = on_credit
+        self._apply_attempts = apply_attempts
+        self._retry_delay = retry_delay
+        self._seen = set()
+        self._seen_order = deque()  # (time seen, tx), oldest first
+        self._stats = IngestionStats()
+        self._stats_lock = threading.Lock()
+        # Without a journal, accepted batches live only in memory until they are applied
+        self._journal = IntakeJournal(journal_dir) if journal_dir is not None else None
+        recovered = list(self._journal.recover(max_apply)) if self._journal is not None else []
+        now = time.time()
+        since = min([now - dedupe_ttl] + [timestamp for _, timestamp, _ in recovered])
+        self._remember(ledger.earned_txs(int(since)), now)
+        self._backlog = deque(recovered)  # applied before anything newly queued
+        self._worker = threading.Thread(target=self._run, name="ingestion-applier", daemon=True)
+        self._worker.start()
+
+    def submit(self, platform, events):
+        """Accept a batch of ``(event_id, public_key, points)`` events
+
+        Returns once the batch is journaled, without waiting for it to be
+        applied.
+        """
+        if platform not in self._platforms:
+            with self._stats_lock:
+                self._stats.rejected_batches += 1
+            raise UnknownPlatform(f"{platform!r} is not a connected platform.")
+        if self._queue.full():
+            return self._reject()
+        timestamp = int(time.time())
+        credits = [(public_key, platform, points, event_tx(platform, event_id))
+                   for event_id, public_key, points in events]
+        segment = self._journal.append(timestamp, credits) if self._journal is not None else None
+        try:
+            self._queue.put_nowait((segment, timestamp, credits))
+        except queue.Full:
+            # Filled up while it was being journaled; the sender's retry is de-duplicated
+            if segment is not None:
+                self._journal.done(segment)
+            return self._reject()
+        with self._stats_lock:
+            self._stats.received += len(events)
+
+    def _reject(self):
+        with self._stats_lock:
+            self._stats.rejected_batches += 1
+        raise Backpressure("Ingestion queue is full; retry shortly.")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = IngestionStats(**vars(self._stats))
+        stats.queued_batches = self._queue.qsize() + len(self._backlog)
+        return stats
+
+    def drain(self, timeout=None):
+        """Block until every queued batch has been applied or dead-lettered"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._backlog:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _remember(self, txs, now):
+        self._seen.update(txs)
+        self._seen_order.extend((now, tx) for tx in txs)
+        expired = now - self._dedupe_ttl
+        while self._seen_order and (
+            self._seen_order[0][0] < expired or len(self._seen_order) > self._dedupe_capacity
+        ):
+            self._seen.discard(self._seen_order.popleft()[1])
+
+    def _run(self):
+        while self._backlog:
+            self._apply_with_retries([self._backlog[0]])
+            self._backlog.popleft()
+        while True:
+            batches = [self._queue.get()]
+            size = len(batches[0][2])
+            while size < self._max_apply:
+                try:
+                    batch = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batches.append(batch)
+                size += len(batch[2])
+            try:
+                self._apply_with_retries(batches)
+            finally:
+                for _ in batches:
+                    self._queue.task_done()
+
+    def _apply_with_retries(self, batches):
+        # The batches stay journaled while they are retried, and the queue
+        # filling up behind them pushes back on the platforms
+        for attempt in range(1, self._apply_attempts + 1):
+            try:
+                with span("ingestion.apply"):
+                    self._apply(batches)
+                break
+            except Exception:
+                size = sum(len(credits) for _, _, credits in batches)
+                logger.exception("Applying %d ingested events failed (attempt %d of %d)",
+                                 size, attempt, self._apply_attempts)
+                # Part of the batch may have been credited before the failure
+                since = min(timestamp for _, timestamp, _ in batches)
+                self._remember(self._ledger.earned_txs(since), time.time())
+                if attempt < self._apply_attempts:
+                    time.sleep(self._retry_delay * 2 ** (attempt - 1))
+        else:
+            self._dead_letter(batches)
+        if self._journal is not None:
+            for segment, _, _ in batches:
+                self._journal.done(segment)
+
+    def _dead_letter(self, batches):
+        credits = [credit for _, _, batch in batches for credit in batch if credit[3] not in self._seen]
+        with self._stats_lock:
+            self._stats.failed += len(credits)
+        if self._journal is None:
+            logger.error("Dropped %d ingested events the ledger failed to apply", len(credits))
+            return
+        path = self._journal.dead_letter(min(timestamp for _, timestamp, _ in batches), credits)
+        logger.error("Moved %d ingested events the ledger failed to apply to %s", len(credits), path)
+
+    def _apply(self, batches):
+        start = time.perf_counter()
+        now = time.time()
+        seen = self._seen
+        fresh = set()
+        credits = []
+        duplicates = 0
+        for _, _, batch in batches:
+            for credit in batch:
+                tx = credit[3]
+                if tx in seen or tx in fresh:
+                    duplicates += 1
+                    continue
+                fresh.add(tx)
+                credits.append(credit)
+        balances = self._ledger.credit_many(credits) if credits else {}
+        self._remember(fresh, now)
+        with self._stats_lock:
+            self._stats.applied += len(credits)
+            self._stats.duplicates += duplicates
+            self._stats.apply_seconds += time.perf_counter() - start
+        if self._on_credit is not None:
+            for public_key, tokens in balances.items():
+                self._on_credit(public_key, tokens)
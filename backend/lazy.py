@@ -0,0 +1,47 @@
+"""Modules imported on first use instead of at startup.
+
+Most of the service's cold start is spent importing libraries that only
+some requests need: pyarrow and numpy for ``/analytics``, Pillow and httpx
+for reward thumbnails, solders and the RPC client only when a Solana node
+is configured. ``lazy_import(name)`` returns a stand-in that imports the
+module the first time one of its attributes is read; the import system's
+per-module lock makes that safe from any thread. A process that never
+serves an analytics request never loads pyarrow.
+
+Set ``EAGER_IMPORTS=1`` to import everything up front as before.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+EAGER_IMPORTS = os.environ.get("EAGER_IMPORTS", "0") != "0"
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is first read"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name, package=None):
+    """``importlib.import_module(name, package)``, deferred until first use"""
+    name = importlib.util.resolve_name(name, package) if name.startswith(".") else name
+    if EAGER_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    return LazyModule(name)
@@ -0,0 +1,443 @@
+"""Points ledger owning wallet balances, redemptions and activity.
+
+Every read-modify-write on a wallet happens under that wallet's stripe
+lock, so balance checks and debits are a single atomic step even when
+the ledger is shared by many threads. Redemptions may carry an
+idempotency key; replaying a key returns the original result instead of
+debiting again. Points earned on partner platforms are credited in bulk,
+one lock acquisition and one log write per wallet in the batch.
+
+Every recorded activity also updates the wallet's running totals, and
+earnings move the wallet on the leaderboard (see ``aggregates``), so
+summaries and rankings never need a scan.
+
+With a ``LedgerStorage`` attached, each mutation is written to the
+write-ahead log under the same lock (so the log order matches the order
+changes were applied) and the call returns once the record is durable.
+"""
+import secrets
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
+
+from .activity import TX_SIZE, ActivityLog, StringTable
+from .aggregates import SECONDS_PER_DAY, Leaderboard, WalletTotals
+from .metrics import span
+from .storage import DEBIT, EARN, REDEEM, encode_earnings, encode_record
+
+# Starting balances for wallets the ledger has not seen yet (demo accounts)
+DEFAULT_SOL = 8500
+DEFAULT_TOKENS = 150000
+
+LOCK_STRIPES = 64
+# Idempotency keys are remembered for a day, up to a cap per wallet
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_KEYS_PER_WALLET = 100_000
+# Activities per page of a statement
+STATEMENT_PAGE = 50_000
+
+
+class InsufficientPoints(Exception):
+    """Raised when a debit would take a wallet's token balance below zero"""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different redemption"""
+
+
+@dataclass
+class Wallet:
+    sol: int
+    tokens: int
+    activities: ActivityLog = field(default_factory=ActivityLog)
+    # idempotency key -> position of the redemption in ``activities``
+    redemptions: OrderedDict = field(default_factory=OrderedDict)
+    totals: WalletTotals = field(default_factory=WalletTotals)
+    # catalog reward id -> units its redemptions took from stock
+    taken: dict = field(default_factory=dict)
+
+
+class Ledger:
+    def __init__(self, default_sol=DEFAULT_SOL, default_tokens=DEFAULT_TOKENS,
+                 stripes=LOCK_STRIPES, storage=None):
+        self.default_sol = default_sol
+        self.default_tokens = default_tokens
+        self._wallets = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._labels = StringTable()
+        self._checkpoint_lock = threading.Lock()
+        self._leaderboard = Leaderboard()
+        self._storage = storage
+        if storage is not None:
+            storage.recover(self)
+            # Ranked once at the end rather than per replayed record
+            self._leaderboard.rebuild((k, w.totals.earned) for k, w in self._wallets.items())
+
+    def _lock(self, public_key):
+        return self._locks[hash(public_key) % len(self._locks)]
+
+    def _all_locks(self):
+        # Always in stripe order, so holders of several stripes cannot deadlock
+        for lock in self._locks:
+            lock.acquire()
+
+    def _release_all(self):
+        for lock in self._locks:
+            lock.release()
+
+    def _wallet(self, public_key):
+        # Callers hold the wallet's stripe lock, so creation cannot race
+        wallet = self._wallets.get(public_key)
+        if wallet is None:
+            wallet = self._wallets[public_key] = Wallet(self.default_sol, self.default_tokens)
+        return wallet
+
+    def _debit(self, wallet, points):
+        if wallet.tokens < points:
+            raise InsufficientPoints(
+                f"Insufficient points. You need {points} points but have {wallet.tokens}."
+            )
+        wallet.tokens -= points
+        return wallet.tokens
+
+    def _log(self, kind, *fields):
+        if self._storage is None:
+            return None
+        return self._storage.append(encode_record(kind, *fields))
+
+    def _wait(self, seq):
+        if seq is not None:
+            with span("ledger.wal_wait"):
+                self._storage.wait(seq)
+
+    def balances(self, public_key):
+        """Return ``(sol, tokens)`` for a wallet"""
+        with self._lock(public_key):
+            wallet = self._wallets.get(public_key)
+            if wallet is None:
+                return self.default_sol, self.default_tokens
+            return wallet.sol, wallet.tokens
+
+    def debit(self, public_key, points):
+        """Atomically check and deduct points, returning the new token balance"""
+        with self._lock(public_key):
+            balance = self._debit(self._wallet(public_key), points)
+            seq = self._log(DEBIT, public_key, int(time.time()), points)
+        self._wait(seq)
+        return balance
+
+    def redeem(self, public_key, reward, points, idempotency_key=None, stock=None):
+        """Debit a reward's cost and record the redemption as an activity
+
+        With an ``idempotency_key``, retrying the same redemption returns the
+        activity recorded the first time rather than debiting twice.
+        ``stock.reserve()`` is called under the wallet's lock once the debit
+        has gone through (see ``catalog.RewardStock``); if it raises, the
+        debit is undone and nothing is recorded. Otherwise the unit is
+        counted against ``stock.reward_id`` (see ``stock_taken``).
+        """
+        with self._lock(public_key):
+            wallet = self._wallet(public_key)
+            log = wallet.activities
+            if idempotency_key is not None and idempotency_key in wallet.redemptions:
+                index = wallet.redemptions[idempotency_key]
+                if self._labels[log.rewards[index]] != reward or log.points[index] != -points:
+                    raise IdempotencyConflict(
+                        f"Idempotency key {idempotency_key!r} was already used for a different redemption."
+                    )
+                # The original may still be waiting on its flush
+                seq = self._storage.tail() if self._storage is not None else None
+            else:
+                timestamp = int(time.time())
+                tx = secrets.token_bytes(32)
+                self._debit(wallet, points)
+                reward_id = None
+                if stock is not None:
+                    try:
+                        stock.reserve()
+                    except BaseException:
+                        wallet.tokens += points
+                        raise
+                    reward_id = stock.reward_id
+                    wallet.taken[reward_id] = wallet.taken.get(reward_id, 0) + 1
+                index = self._record(wallet, timestamp, "Redemption", reward, -points, tx, idempotency_key)
+                seq = self._log(REDEEM, public_key, timestamp, points, "Redemption", reward, tx,
+                                idempotency_key, reward_id)
+            activity = log.row(index, self._labels)
+        self._wait(seq)
+        return activity
+
+    def credit_many(self, credits):
+        """Credit a batch of ``(public_key, type, points, tx)`` earnings
+
+        Each credit becomes an activity labelled with its ``type`` (the
+        platform the points came from). The batch takes the stripe locks of
+        all its wallets at once (in stripe order, as ``checkpoint`` does),
+        so it is applied and logged as one write. Returns the new token
+        balance of every wallet in the batch once the batch is durable.
+        """
+        by_wallet = defaultdict(list)
+        type_codes = {}
+        for public_key, type_, points, tx in credits:
+            code = type_codes.get(type_)
+            if code is None:
+                code = type_codes[type_] = self._labels.code(type_)
+            by_wallet[public_key].append((code, points, tx))
+        stripes = sorted({hash(public_key) % len(self._locks) for public_key in by_wallet})
+        timestamp = int(time.time())
+        balances = {}
+        ranked = []
+        for i in stripes:
+            self._locks[i].acquire()
+        try:
+            for public_key, earned in by_wallet.items():
+                wallet = self._wallet(public_key)
+                append = wallet.activities.append
+                for code, points, tx in earned:
+                    append(timestamp, code, 0, points, tx)
+                # Totals and balance move once per wallet, not once per credit
+                wallet.tokens += wallet.totals.add_earnings(timestamp, earned)
+                balances[public_key] = wallet.tokens
+                ranked.append((public_key, wallet.totals))
+            seq = None
+            if self._storage is not None and credits:
+                seq = self._storage.append(encode_earnings(timestamp, credits), len(credits))
+        finally:
+            for i in reversed(stripes):
+                self._locks[i].release()
+        # Outside the wallet locks, and while the log flushes; scores are read
+        # under the leaderboard's lock, so a later write is never overtaken
+        self._leaderboard.update_many((public_key, totals.earned) for public_key, totals in ranked)
+        self._wait(seq)
+        return balances
+
+    def earned_txs(self, since):
+        """Transaction ids of every credit recorded at or after ``since``"""
+        txs = []
+        for _, log in self.wallet_logs()[1]:
+            n = len(log.timestamps)
+            for i in range(bisect_left(log.timestamps, since, 0, n), n):
+                if log.points[i] > 0:
+                    txs.append(bytes(log.txs[i * TX_SIZE:(i + 1) * TX_SIZE]))
+        return txs
+
+    def _record(self, wallet, timestamp, type_, reward, points, tx, idempotency_key):
+        type_code = self._labels.code(type_)
+        index = wallet.activities.append(timestamp, type_code, self._labels.code(reward), points, tx)
+        wallet.totals.add(timestamp, type_code, points)
+        if idempotency_key is not None:
+            self._remember(wallet, idempotency_key, index, timestamp)
+        return index
+
+    def _remember(self, wallet, idempotency_key, index, timestamp):
+        # Keys are kept in insertion order, so expired ones are at the front
+        keys = wallet.redemptions
+        keys[idempotency_key] = index
+        expired = timestamp - IDEMPOTENCY_TTL
+        timestamps = wallet.activities.timestamps
+        while keys:
+            oldest = timestamps[next(iter(keys.values()))]
+            if oldest >= expired and len(keys) <= IDEMPOTENCY_KEYS_PER_WALLET:
+                break
+            keys.popitem(last=False)
+
+    def activities(self, public_key, limit=20, cursor=None, since=None, until=None, types=None):
+        """Return a page of a wallet's activities, newest first
+
+        Returns ``(activities, next_cursor)``; pass ``next_cursor`` back as
+        ``cursor`` to fetch the following (older) page.
+        """
+        with self._lock(public_key):
+            wallet = self._wallets.get(public_key)
+            if wallet is None:
+                return [], None
+            type_codes = None
+            if types:
+                type_codes = [code for code in map(self._labels.get, types) if code is not None]
+            log = wallet.activities
+            positions, next_cursor = log.query(cursor, since, until, type_codes, limit)
+            return [log.row(i, self._labels) for i in positions], next_cursor
+
+    def statement(self, public_key, since=None, until=None, cursor=None, limit=STATEMENT_PAGE):
+        """One page of a wallet's activities in ``[since, until]``, oldest first, as columns
+
+        Returns ``(page, next_cursor)``. ``page`` is ``(timestamps, points,
+        types, rewards, txs, labels)``: the type and reward columns hold
+        label codes, ``labels`` maps the codes used to their strings, and
+        ``txs`` is the 32-byte ids back to back. ``page`` is None for an
+        unknown wallet. The range is fixed when the first page is read, so
+        activities recorded while a statement is being read do not shift
+        its pages.
+        """
+        with self._lock(public_key):
+            wallet = self._wallets.get(public_key)
+            if wallet is None:
+                return None, None
+            log = wallet.activities
+            lo, hi = log.span(since, until) if cursor is None else cursor
+            end = min(hi, lo + limit)
+            timestamps, points, types, rewards, txs = log.columns(lo, end)
+        strings = self._labels.strings
+        labels = {code: strings[code] for code in set(types).union(rewards)}
+        return (timestamps, points, types, rewards, txs, labels), ((end, hi) if end < hi else None)
+
+    def summary(self, public_key):
+        """A wallet's lifetime totals, read from its running aggregates"""
+        with self._lock(public_key):
+            wallet = self._wallets.get(public_key)
+            if wallet is None:
+                wallet = Wallet(self.default_sol, self.default_tokens)
+            totals = wallet.totals
+            return {
+                "tokens": wallet.tokens,
+                "earned": totals.earned,
+                "redeemed": totals.redeemed,
+                "platforms": {self._labels[code]: points for code, points in totals.platforms.items()},
+                "streak": totals.current_streak(int(time.time()) // SECONDS_PER_DAY),
+                "longest_streak": totals.longest_streak,
+            }
+
+    def leaderboard(self, k=10):
+        """The ``k`` wallets with the most points earned, as ``(public_key, earned)`` pairs"""
+        return self._leaderboard.top(k)
+
+    def rank(self, public_key):
+        """A wallet's place on the leaderboard (tied wallets share it), or None before its first earning"""
+        return self._leaderboard.rank(public_key)
+
+    def wallets_ahead(self, earned):
+        """How many wallets have earned more than ``earned`` points"""
+        return self._leaderboard.ahead_of(earned)
+
+    def wallet_logs(self):
+        """Snapshot of every wallet's ``(public_key, activity_log)`` for bulk readers, with its labels
+
+        Returns ``(labels, logs)``. Logs are only ever appended to, so
+        readers may use any prefix of a log without holding its lock.
+        ``labels`` is the ledger's own string table, which only grows, so it
+        names every code in any prefix read before it is; read-only.
+        """
+        logs = [(public_key, wallet.activities) for public_key, wallet in list(self._wallets.items())]
+        return self._labels.strings, logs
+
+    def stock_taken(self):
+        """Units taken from stock by recorded redemptions, per catalog reward id
+
+        Only redemptions made with a ``stock`` count; free-form ones never
+        took any.
+        """
+        taken = Counter()
+        for wallet in list(self._wallets.values()):
+            taken.update(dict(wallet.taken))
+        return dict(taken)
+
+    # Persistence hooks used by LedgerStorage
+
+    def _apply(self, kind, public_key, timestamp, points, type_, reward, tx, idempotency_key, reward_id=None):
+        """Re-apply a write-ahead log record during recovery"""
+        with self._lock(public_key):
+            wallet = self._wallet(public_key)
+            if kind == EARN:
+                wallet.tokens += points
+                self._record(wallet, timestamp, type_, None, points, tx, None)
+                return
+            self._debit(wallet, points)
+            if kind == REDEEM:
+                self._record(wallet, timestamp, type_, reward, -points, tx, idempotency_key)
+                if reward_id is not None:
+                    wallet.taken[reward_id] = wallet.taken.get(reward_id, 0) + 1
+
+    def _restore_labels(self, labels):
+        self._labels = StringTable(labels)
+
+    def _restore_wallets(self, wallets):
+        """Add ``(public_key, sol, tokens, log, keys, taken)`` wallets, with totals rebuilt from their logs"""
+        wallets = list(wallets)
+        totals = WalletTotals.from_logs(log for _, _, _, log, _, _ in wallets)
+        for (public_key, sol, tokens, log, keys, taken), wallet_totals in zip(wallets, totals):
+            self._wallets[public_key] = Wallet(sol, tokens, log, OrderedDict(keys), wallet_totals, dict(taken))
+
+    def checkpoint(self):
+        """Snapshot every wallet so storage can drop the log segments it covers"""
+        if self._storage is None:
+            return
+        with self._checkpoint_lock:
+            self._all_locks()
+            try:
+                segment = self._storage.rotate()
+                labels = list(self._labels.strings)
+                # Logs are append-only, so recording their length is enough to
+                # pin the snapshot's cut while writers carry on
+                wallets = [
+                    (public_key, w.sol, w.tokens, w.activities, len(w.activities), dict(w.redemptions),
+                     dict(w.taken))
+                    for public_key, w in self._wallets.items()
+                ]
+            finally:
+                self._release_all()
+            self._storage.write_snapshot(segment, labels, wallets)
+
+    # Moving wallets between ledgers (used when resharding)
+
+    def export_wallets(self, select):
+        """Copy out every wallet whose public key satisfies ``select``
+
+        Returns ``(labels, wallets)`` with ``wallets`` in the form taken by
+        ``import_wallets``: ``(public_key, sol, tokens, log bytes, n, keys,
+        taken)``, ``taken`` being the wallet's units of stock per reward id.
+        """
+        self._all_locks()
+        try:
+            labels = list(self._labels.strings)
+            wallets = [
+                (public_key, w.sol, w.tokens, w.activities.to_bytes(len(w.activities)),
+                 len(w.activities), dict(w.redemptions), dict(w.taken))
+                for public_key, w in self._wallets.items() if select(public_key)
+            ]
+        finally:
+            self._release_all()
+        return labels, wallets
+
+    def import_wallets(self, labels, wallets):
+        """Add wallets exported by another ledger, replacing any held under the same keys
+
+        Label codes are translated into this ledger's string table, and the
+        result is checkpointed so it is durable before this returns.
+        """
+        codes = array("I", [self._labels.code(label) for label in labels])
+        logs = []
+        for _, _, _, buf, n, _, _ in wallets:
+            log = ActivityLog.from_bytes(buf, n)
+            log.types = array("I", map(codes.__getitem__, log.types))
+            log.rewards = array("I", map(codes.__getitem__, log.rewards))
+            logs.append(log)
+        restored = [
+            (public_key, Wallet(sol, tokens, log, OrderedDict(keys), totals, dict(taken)))
+            for (public_key, sol, tokens, _, _, keys, taken), log, totals
+            in zip(wallets, logs, WalletTotals.from_logs(logs))
+        ]
+        self._all_locks()
+        try:
+            self._wallets.update(restored)
+            self._leaderboard.update_many((public_key, wallet.totals.earned) for public_key, wallet in restored)
+        finally:
+            self._release_all()
+        self.checkpoint()
+
+    def drop_wallets(self, select):
+        """Forget every wallet whose public key satisfies ``select``, durably"""
+        self._all_locks()
+        try:
+            for public_key in [k for k in self._wallets if select(k)]:
+                del self._wallets[public_key]
+                self._leaderboard.remove(public_key)
+        finally:
+            self._release_all()
+        self.checkpoint()
+
+    def close(self):
+        if self._storage is not None:
+            self._storage.close()
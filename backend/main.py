@@ -0,0 +1,415 @@
+"""FastAPI points-ledger service backing the Streamlit frontends.
+
+Run with ``python -m backend`` (uvicorn on uvloop/httptools, port 8000).
+Ledger state is persisted under ``LEDGER_DATA_DIR`` (default
+``ledger-data``); set ``LEDGER_GROUP_COMMIT=0`` to fsync every write
+individually. With ``LEDGER_SHARDS`` set to a count, wallets are split
+across that many ledger worker processes, each with its own log under the
+data directory; changing the count on restart reshards. With
+``SOLANA_RPC_URL`` set, SOL balances are read from
+the chain instead of the ledger's demo value.
+
+Dashboards can subscribe to balance and activity pushes on a WebSocket
+hub (``SUBSCRIPTIONS_PORT``, default 8001). With ``SOLANA_WS_URL`` set,
+the hub also forwards on-chain SOL balance changes.
+
+The rewards catalog (``CATALOG_PATH``, default ``backend/catalog.json``)
+is served at ``/rewards`` with an ETag, so dashboards revalidate it with
+``If-None-Match`` and only download it again after it has changed.
+Redemptions that name a catalog ``reward_id`` take a unit of its stock.
+Reward images are downloaded once at startup and served as card-sized
+thumbnails from ``/images`` (cached under ``IMAGE_CACHE_DIR``, default
+``image-cache``); until a reward's thumbnails exist, cards use the
+original image URL.
+
+Connected partner platforms post earn events in batches to
+``/ingest/events``; each batch is journaled under ``ingestion/`` in the
+data directory before it is acknowledged, then de-duplicated and
+credited in bulk by a background applier, and a full queue answers 429. Lifetime totals and
+streaks per wallet (``/wallets/{public_key}/summary``) and the
+``/leaderboard`` of points earned are kept up to date on every write.
+A wallet's full activity history for any time range is streamed from
+``/wallets/{public_key}/statement`` as CSV, JSON Lines or Parquet, a page
+at a time (see ``statements.py``).
+
+With ``SOLANA_RPC_URL`` and ``SETTLEMENT_KEYPAIR`` (a Solana CLI keypair
+file) both set, redemptions are also anchored on chain in batched memo
+transactions; their progress is served per ledger transaction id.
+
+Redemptions and balance reads pass admission control first (see
+``admission.py``): per-wallet and service-wide rate limits and a short
+queue for a limited number of slots, with dashboard requests admitted
+ahead of batch traffic. Dashboards are told apart by a bearer token, one
+of the comma-separated ``INTERACTIVE_TOKENS``. Requests it turns away are
+answered 429 at once. Set ``ADMISSION_CONTROL=0`` to admit everything.
+
+Request counts and latency histograms, per-operation timings (ledger
+writes, log flushes, RPC calls) and queue depths are served at
+``/metrics`` in the Prometheus text format. Requests slower than
+``SLOW_TRACE_SECONDS`` (default 0.1) are kept with a breakdown of where
+their time went at ``/debug/traces``. ``/debug/profile?seconds=5`` samples
+every thread's stack for a few seconds and returns folded stacks for a
+flame graph; with ``PROFILE_HZ`` set, a low-rate profiler runs all the
+time and ``/debug/profile`` returns what it has collected.
+
+pyarrow, Pillow, httpx and the Solana client are only imported when a
+request or the configuration first needs them (``EAGER_IMPORTS=1``
+imports them at startup); once the service is answering, the catalog
+listing and reward thumbnails are prepared in the background.
+
+Endpoints that call the ledger are plain ``def`` so they run on the
+threadpool (the balance read, which also awaits the RPC client, hands
+its ledger call to the threadpool). Writes each wait for their log
+record to reach disk, and running them side by side is what lets group
+commit batch their flushes; with ``LEDGER_SHARDS`` set, every ledger call
+is a round trip to a worker process, which must not hold up the event
+loop.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException, Path, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from .admission import Admission, AdmissionMiddleware
+from .catalog import CATALOG_PATH, Catalog, OutOfStock, UnknownReward
+from .images import CACHE_CONTROL, IMAGE_CACHE_BYTES, MEDIA_TYPES, ImageCache
+from .ingestion import Backpressure, IngestionPipeline, UnknownPlatform
+from .lazy import lazy_import
+from .ledger import IdempotencyConflict, InsufficientPoints, Ledger
+from .metrics import Counter, Gauge, MetricsMiddleware, SamplingProfiler, exposition, slow_traces, span
+from .models import (
+    Activity,
+    ActivityPage,
+    BalanceUpdate,
+    Balances,
+    EarnBatch,
+    IngestionReceipt,
+    IngestionStatus,
+    LeaderboardEntry,
+    RedemptionRequest,
+    SettlementStatus,
+    WalletSummary,
+)
+from .shards import ShardedLedger
+from .statements import FORMATS as STATEMENT_FORMATS, export as export_statement
+from .storage import LedgerStorage
+from .subscriptions import SubscriptionHub
+
+# Imported on first use; see lazy.py
+analytics = lazy_import(".analytics", __package__)
+httpx = lazy_import("httpx")
+keypair = lazy_import("solders.keypair")
+solana_rpc = lazy_import(".rpc", __package__)
+solana_settlement = lazy_import(".settlement", __package__)
+
+logger = logging.getLogger(__name__)
+
+# Seconds an analytics table built from the ledger is reused for
+ANALYTICS_REFRESH = 30
+# Longest and fastest on-demand profile
+MAX_PROFILE_SECONDS = 60
+MAX_PROFILE_HZ = 1000
+# Requests a second admitted service-wide, before queueing
+REDEMPTION_RATE = 4000
+BALANCE_RATE = 40_000
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "1") != "0"
+# Bearer tokens of the dashboards, whose requests are admitted ahead of batch traffic
+INTERACTIVE_TOKENS = [token for token in os.environ.get("INTERACTIVE_TOKENS", "").split(",") if token]
+
+REDEMPTIONS = Counter("redemptions", "Redemption requests by outcome", ["outcome"])
+
+_data_dir = os.environ.get("LEDGER_DATA_DIR", "ledger-data")
+_group_commit = os.environ.get("LEDGER_GROUP_COMMIT", "1") != "0"
+if int(os.environ.get("LEDGER_SHARDS", "0")):
+    ledger = ShardedLedger(_data_dir, int(os.environ["LEDGER_SHARDS"]), _group_commit)
+else:
+    ledger = Ledger(storage=LedgerStorage(_data_dir, group_commit=_group_commit))
+catalog = Catalog.load(os.environ.get("CATALOG_PATH", CATALOG_PATH))
+catalog.restock_from(ledger)
+images = ImageCache(
+    os.environ.get("IMAGE_CACHE_DIR", "image-cache"),
+    max_bytes=int(os.environ.get("IMAGE_CACHE_BYTES", IMAGE_CACHE_BYTES)),
+)
+rpc = solana_rpc.SolanaRPC(os.environ["SOLANA_RPC_URL"]) if os.environ.get("SOLANA_RPC_URL") else None
+settlement = None
+if rpc is not None and os.environ.get("SETTLEMENT_KEYPAIR"):
+    with open(os.environ["SETTLEMENT_KEYPAIR"]) as f:
+        settlement = solana_settlement.SettlementSubmitter(rpc, keypair.Keypair.from_json(f.read()))
+hub = SubscriptionHub(
+    os.environ.get("SOLANA_WS_URL"),
+    on_account_update=rpc.invalidate if rpc is not None else None,
+)
+ingestion = IngestionPipeline(
+    ledger,
+    on_credit=lambda public_key, tokens: hub.publish(
+        public_key, {"type": "tokens", "public_key": public_key, "tokens": tokens}
+    ),
+    journal_dir=os.path.join(_data_dir, "ingestion"),
+)
+# Enough writes at once for group commit to batch their flushes; more only
+# contend for the GIL and stretch every admitted request's latency
+redemption_admission = Admission("redemptions", concurrency=16, queue_limit=64, max_wait=0.25,
+                                 wallet_rate=5, wallet_burst=10, rate=REDEMPTION_RATE, burst=REDEMPTION_RATE // 4)
+balance_admission = Admission("balances", concurrency=256, queue_limit=1024, max_wait=0.25,
+                              wallet_rate=50, wallet_burst=100, rate=BALANCE_RATE, burst=BALANCE_RATE // 4)
+profiler = SamplingProfiler(float(os.environ["PROFILE_HZ"])) if float(os.environ.get("PROFILE_HZ", "0")) else None
+Gauge("ingestion_queued_batches", "Earn event batches waiting to be applied",
+      lambda: ingestion.stats().queued_batches)
+Gauge("settlement_pending", "Redemptions waiting to be anchored on chain",
+      lambda: settlement.pending() if settlement is not None else 0)
+
+
+def prewarm_thumbnails():
+    """Make thumbnails of every reward image, publishing each reward's as it is ready"""
+    for reward in catalog.find():
+        try:
+            catalog.set_thumbnails(reward.id, images.thumbnails(reward.image))
+        except (httpx.HTTPError, OSError, ValueError) as e:
+            logger.warning("No thumbnails for %s: %s", reward.id, e)
+
+
+def prewarm():
+    """Fill the caches the first dashboards read, after the service is already answering"""
+    catalog.listing()
+    prewarm_thumbnails()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().run_in_executor(None, prewarm)
+    await hub.serve(os.environ.get("HOST", "0.0.0.0"), int(os.environ.get("SUBSCRIPTIONS_PORT", "8001")))
+    if settlement is not None:
+        settlement.start()
+    if profiler is not None:
+        profiler.start()
+    yield
+    if profiler is not None:
+        profiler.stop()
+    await hub.close()
+    if settlement is not None:
+        await settlement.close()
+    if rpc is not None:
+        await rpc.close()
+    ledger.close()
+
+
+app = FastAPI(title="Soezliana Points Ledger", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+if ADMISSION_CONTROL:
+    # Outermost, so a request turned away costs as little as possible; it counts its own 429s
+    app.add_middleware(AdmissionMiddleware, rules={
+        ("GET", "balances"): balance_admission,
+        ("POST", "balances"): redemption_admission,
+        ("POST", "redemptions"): redemption_admission,
+    }, interactive_tokens=INTERACTIVE_TOKENS)
+
+
+@app.get("/wallets/{public_key}/balances", response_model=Balances)
+async def get_user_balances(public_key: str):
+    with span("ledger.balances"):
+        sol, tokens = await run_in_threadpool(ledger.balances, public_key)
+    if rpc is not None:
+        try:
+            with span("rpc.get_balance"):
+                sol = await rpc.get_balance(public_key) / solana_rpc.LAMPORTS_PER_SOL
+        except (ValueError, solana_rpc.RPCError, httpx.HTTPError):
+            # Not a valid on-chain key or the node is unavailable: keep the ledger's value
+            pass
+    return Balances(public_key=public_key, sol=sol, tokens=tokens)
+
+
+@app.post("/wallets/{public_key}/balances", response_model=Balances)
+def update_balance(public_key: str, update: BalanceUpdate):
+    try:
+        with span("ledger.debit"):
+            tokens = ledger.debit(public_key, update.points_to_deduct)
+    except InsufficientPoints as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    sol, _ = ledger.balances(public_key)
+    hub.publish(public_key, {"type": "tokens", "public_key": public_key, "tokens": tokens})
+    return Balances(public_key=public_key, sol=sol, tokens=tokens)
+
+
+@app.post("/wallets/{public_key}/redemptions", response_model=Activity, status_code=201)
+def redeem_reward(public_key: str, redemption: RedemptionRequest,
+                  idempotency_key: Optional[str] = Header(None)):
+    stock = None
+    if redemption.reward_id is not None:
+        try:
+            reward = catalog.get(redemption.reward_id)
+        except UnknownReward as e:
+            REDEMPTIONS.labels("unknown_reward").inc()
+            raise HTTPException(status_code=404, detail=str(e))
+        if (reward.name, reward.points) != (redemption.reward, redemption.points):
+            REDEMPTIONS.labels("wrong_price").inc()
+            raise HTTPException(status_code=422, detail=f"{reward.name} costs {reward.points} points.")
+        stock = catalog.stock(reward.id)
+    try:
+        with span("ledger.redeem"):
+            activity = ledger.redeem(public_key, redemption.reward, redemption.points, idempotency_key, stock)
+    except InsufficientPoints as e:
+        REDEMPTIONS.labels("insufficient_points").inc()
+        raise HTTPException(status_code=409, detail=str(e))
+    except OutOfStock as e:
+        REDEMPTIONS.labels("out_of_stock").inc()
+        raise HTTPException(status_code=409, detail=str(e))
+    except IdempotencyConflict as e:
+        REDEMPTIONS.labels("idempotency_conflict").inc()
+        raise HTTPException(status_code=422, detail=str(e))
+    REDEMPTIONS.labels("redeemed").inc()
+    if settlement is not None:
+        settlement.submit(bytes.fromhex(activity["tx"]))
+    with span("hub.publish"):
+        hub.publish(public_key, {
+            "type": "activity",
+            "public_key": public_key,
+            "tokens": ledger.balances(public_key)[1],
+            "activity": activity,
+        })
+    return activity
+
+
+@app.get("/wallets/{public_key}/summary", response_model=WalletSummary)
+def get_wallet_summary(public_key: str):
+    return WalletSummary(public_key=public_key, rank=ledger.rank(public_key), **ledger.summary(public_key))
+
+
+@app.get("/leaderboard", response_model=list[LeaderboardEntry])
+def get_leaderboard(k: int = Query(10, gt=0, le=1000)):
+    entries = []
+    for position, (public_key, earned) in enumerate(ledger.leaderboard(k), 1):
+        # Tied wallets share the rank of the first of them
+        rank = entries[-1].rank if entries and entries[-1].earned == earned else position
+        entries.append(LeaderboardEntry(rank=rank, public_key=public_key, earned=earned))
+    return entries
+
+
+@app.get("/wallets/{public_key}/redemptions/{tx}", response_model=SettlementStatus)
+async def get_settlement(public_key: str, tx: str = Path(pattern=r"^[0-9a-f]{64}$")):
+    found = settlement.status(bytes.fromhex(tx)) if settlement is not None else None
+    if found is None:
+        raise HTTPException(status_code=404, detail="No settlement for this transaction")
+    return SettlementStatus(tx=tx, status=found.status, signature=found.signature, error=found.error)
+
+
+@app.get("/wallets/{public_key}/activities", response_model=ActivityPage)
+def get_activities(
+    public_key: str,
+    limit: int = Query(20, gt=0, le=1000),
+    cursor: Optional[str] = Query(None, pattern=r"^\d+$"),
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    type: Optional[list[str]] = Query(None),
+):
+    items, next_cursor = ledger.activities(
+        public_key, limit, int(cursor) if cursor else None, since, until, type
+    )
+    return ActivityPage(items=items, next_cursor=None if next_cursor is None else str(next_cursor))
+
+
+@app.get("/wallets/{public_key}/statement")
+def get_statement(
+    public_key: str,
+    format: str = Query("csv", pattern=f"^({'|'.join(STATEMENT_FORMATS)})$"),
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+):
+    media_type, extension = STATEMENT_FORMATS[format]
+    return StreamingResponse(
+        export_statement(ledger, public_key, format, since, until),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="statement.{extension}"'},
+    )
+
+
+# Plain def: the batch is journaled and fsynced before it is acknowledged
+@app.post("/ingest/events", response_model=IngestionReceipt, status_code=202)
+def ingest_events(batch: EarnBatch):
+    try:
+        ingestion.submit(batch.platform, [(e.event_id, e.public_key, e.points) for e in batch.events])
+    except UnknownPlatform as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Backpressure as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return IngestionReceipt(accepted=len(batch.events))
+
+
+@app.get("/ingest/stats", response_model=IngestionStatus)
+async def get_ingestion_stats():
+    return IngestionStatus(**vars(ingestion.stats()))
+
+
+@app.get("/rewards")
+async def get_rewards(
+    category: Optional[str] = None,
+    min_points: Optional[int] = None,
+    max_points: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    etag, body = catalog.listing(category, min_points, max_points)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match is not None and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/images/{name}")
+def get_image(name: str = Path(pattern=r"^[0-9a-f]{32}\.[a-z]+$")):
+    ext = name.rsplit(".", 1)[1]
+    data = images.get(name) if ext in MEDIA_TYPES else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="No such image")
+    return Response(data, media_type=MEDIA_TYPES[ext], headers={"Cache-Control": CACHE_CONTROL})
+
+
+_analytics_cache = {"built_at": 0.0, "table": None}
+
+
+def analytics_table():
+    """Columnar copy of the ledger's activity, rebuilt at most every ANALYTICS_REFRESH seconds"""
+    now = time.monotonic()
+    if _analytics_cache["table"] is None or now - _analytics_cache["built_at"] > ANALYTICS_REFRESH:
+        _analytics_cache["table"] = analytics.ledger_table(ledger)
+        _analytics_cache["built_at"] = now
+    return _analytics_cache["table"]
+
+
+@app.get("/analytics/platform-points")
+def get_platform_points(since: Optional[int] = None, until: Optional[int] = None):
+    return analytics.points_per_platform_per_day(analytics_table(), since, until).to_pylist()
+
+
+@app.get("/analytics/top-earners")
+def get_top_earners(k: int = Query(10, gt=0, le=1000)):
+    return analytics.top_earners(analytics_table(), k).to_pylist()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(exposition(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/traces")
+async def get_slow_traces():
+    return slow_traces()
+
+
+@app.get("/debug/profile")
+def get_profile(seconds: float = Query(0, ge=0, le=MAX_PROFILE_SECONDS),
+                hz: float = Query(100, gt=0, le=MAX_PROFILE_HZ), reset: bool = False):
+    if seconds:
+        folded = SamplingProfiler.capture(seconds, hz)
+    elif profiler is not None:
+        folded = profiler.folded(reset)
+    else:
+        raise HTTPException(status_code=404, detail="PROFILE_HZ is not set; pass seconds to take a profile")
+    return Response(folded, media_type="text/plain")
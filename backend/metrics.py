@@ -0,0 +1,356 @@
+"""Counters, latency histograms, tracing spans and a sampling profiler.
+
+Metrics are registered once at import time and rendered at ``/metrics``
+in the Prometheus text format. Histograms keep one count per fixed
+bucket, so recording a value is a bisect and a few increments under a
+lock; the cumulative counts Prometheus expects are summed when scraped.
+A metric given its own ``registry`` list is kept apart from the
+service's and rendered with ``exposition(registry)``; the dashboards
+time themselves this way (``frontend/timings.py``).
+
+``span(name)`` times a block and records it in ``span_seconds``. Spans
+opened inside another span (in the same thread or asyncio task) become
+its children. A top-level span (usually an HTTP request) that takes
+longer than ``SLOW_TRACE_SECONDS`` is kept with its children's timings
+in a short list of recent slow traces, so one slow redemption can be
+broken down into the ledger write, the catalog check and the RPC calls.
+
+``SamplingProfiler`` reads every thread's stack ``hz`` times a second
+from a background thread and counts the stacks it saw, in the folded
+format flame graph tools read. At the default 10 Hz it costs well under
+1% of a core, so it can run all the time (``PROFILE_HZ``). A faster
+capture for a few seconds can also be taken on demand.
+"""
+import contextvars
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from collections import deque
+
+# Upper bounds in seconds, from a cache hit to a stalled RPC node
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_TRACE_SECONDS = float(os.environ.get("SLOW_TRACE_SECONDS", "0.1"))
+SLOW_TRACES = 100
+# Child spans kept per span in a slow trace; later ones are only counted
+MAX_CHILDREN = 64
+PROFILE_HZ = 10
+MAX_STACKS = 10_000
+
+_metrics = []  # the service's registry
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (_metrics if registry is None else registry).append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}_total{_labels(self.labelnames, values)} {child.value}"
+
+
+class Gauge(_Metric):
+    """A value read when scraped: ``fn()`` returns ``{label values: value}``, or a number without labels"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=(), registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self._fn = fn
+
+    def _samples(self):
+        values = self._fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, label_values)} {value}"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+def exposition(registry=None):
+    """Every metric in ``registry`` (by default, the service's) in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in (_metrics if registry is None else registry)) + "\n"
+
+
+SPAN_SECONDS = Histogram("span_seconds", "Time spent in each traced operation", ["span"])
+SPAN_ERRORS = Counter("span_errors", "Traced operations that raised", ["span"])
+
+_current = contextvars.ContextVar("span", default=None)
+_slow_traces = deque(maxlen=SLOW_TRACES)
+
+
+class span:
+    """Time a block as ``name``; see the module docstring"""
+
+    __slots__ = ("name", "start", "children", "dropped", "_parent", "_token")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._parent = _current.get()
+        self._token = _current.set(self)
+        self.children = None
+        self.dropped = 0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self._token)
+        SPAN_SECONDS.labels(self.name).observe(elapsed)
+        if exc_type is not None:
+            SPAN_ERRORS.labels(self.name).inc()
+        parent = self._parent
+        if parent is not None:
+            if parent.children is None:
+                parent.children = []
+            if len(parent.children) < MAX_CHILDREN:
+                parent.children.append((self, elapsed))
+            else:
+                parent.dropped += 1
+        elif elapsed >= SLOW_TRACE_SECONDS:
+            _slow_traces.append((time.time() - elapsed, self._tree(elapsed, self.start)))
+        return False
+
+    def _tree(self, elapsed, origin):
+        tree = {"span": self.name, "offset_ms": (self.start - origin) * 1e3, "ms": elapsed * 1e3}
+        if self.children:
+            tree["children"] = [child._tree(took, origin) for child, took in self.children]
+        if self.dropped:
+            tree["dropped_children"] = self.dropped
+        return tree
+
+
+def traced(name):
+    """Decorator form of ``span`` for plain and ``async`` functions"""
+
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def slow_traces():
+    """Recent slow top-level spans with their children, newest first"""
+    return [dict(tree, started_at=started) for started, tree in reversed(_slow_traces)]
+
+
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests answered", ["route", "method", "status"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests and tracing each one as a top-level span
+
+    Requests are labelled with their route's path template, so one route
+    is one series whatever wallet it was called for.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        request = span("http")
+        route = None
+        try:
+            with request:
+                try:
+                    await self.app(scope, receive, send_status)
+                finally:
+                    # Routing has filled in the template by now; name the span after it
+                    route = scope.get("route")
+                    request.name = f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+        finally:
+            HTTP_REQUESTS.labels(route.path if route is not None else "unmatched", scope["method"], status).inc()
+
+
+class SamplingProfiler:
+    """Counts the stacks of every thread, sampled ``hz`` times a second"""
+
+    def __init__(self, hz=PROFILE_HZ, max_stacks=MAX_STACKS):
+        self.interval = 1 / hz
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = StackCounter()
+        self._frames = {}  # code object -> its name in a stack
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _name(self, code):
+        name = self._frames.get(code)
+        if name is None:
+            name = self._frames[code] = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return name
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(self._name(frame.f_code))
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            del frames
+            with self._lock:
+                self.samples += 1
+                for stack in stacks:
+                    if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[stack] += 1
+                    else:
+                        self._stacks["(other)"] += 1
+
+    def folded(self, reset=False):
+        """``stack count`` lines, hottest first, as flame graph tools read them"""
+        with self._lock:
+            stacks = self._stacks
+            if reset:
+                self._stacks = StackCounter()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    @classmethod
+    def capture(cls, seconds, hz):
+        """Profile for ``seconds`` at ``hz`` and return the folded stacks"""
+        profiler = cls(hz).start()
+        time.sleep(seconds)
+        profiler.stop()
+        return profiler.folded()
@@ -0,0 +1,88 @@
+"""Request and response schemas for the points-ledger API."""
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+# Most points a single partner-platform event may award
+MAX_EVENT_POINTS = 100_000
+MAX_EVENTS_PER_BATCH = 1000
+
+
+class Balances(BaseModel):
+    public_key: str
+    sol: float
+    tokens: int
+
+
+class BalanceUpdate(BaseModel):
+    points_to_deduct: int = Field(gt=0)
+
+
+class RedemptionRequest(BaseModel):
+    reward: str
+    points: int = Field(gt=0)
+    # Catalog item to take from stock; free-form rewards leave this unset
+    reward_id: Optional[str] = None
+
+
+class Activity(BaseModel):
+    timestamp: int
+    type: str
+    points: int
+    tx: str
+    reward: Optional[str] = None
+
+
+class ActivityPage(BaseModel):
+    items: list[Activity]
+    next_cursor: Optional[str] = None
+
+
+class WalletSummary(BaseModel):
+    public_key: str
+    tokens: int
+    earned: int
+    redeemed: int
+    platforms: dict[str, int]
+    streak: int
+    longest_streak: int
+    rank: Optional[int] = None
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    public_key: str
+    earned: int
+
+
+class SettlementStatus(BaseModel):
+    tx: str
+    status: str
+    signature: Optional[str] = None
+    error: Optional[str] = None
+
+
+class EarnEvent(BaseModel):
+    event_id: str = Field(min_length=1, max_length=128)
+    public_key: str = Field(min_length=1, max_length=64)
+    points: int = Field(gt=0, le=MAX_EVENT_POINTS)
+
+
+class EarnBatch(BaseModel):
+    platform: str
+    events: list[EarnEvent] = Field(min_length=1, max_length=MAX_EVENTS_PER_BATCH)
+
+
+class IngestionReceipt(BaseModel):
+    accepted: int
+
+
+class IngestionStatus(BaseModel):
+    received: int
+    applied: int
+    duplicates: int
+    rejected_batches: int
+    queued_batches: int
+    # Events moved to the dead-letter file after the ledger failed to apply them
+    failed: int
+    apply_seconds: float
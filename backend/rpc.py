@@ -0,0 +1,179 @@
+"""Batched Solana JSON-RPC access layer.
+
+Balance lookups made within a few milliseconds of each other are
+coalesced: the keys are split into ``getMultipleAccounts`` calls of up to
+100 accounts and those calls are sent together as one JSON-RPC batch over
+a pooled HTTP/2 client. Results are cached for a short TTL along with the
+slot they were read at, so an answer from a lagging node never replaces a
+newer one and ``invalidate`` can drop entries older than a known change.
+Transport errors and 429/5xx responses are retried with jittered backoff.
+"""
+import asyncio
+import itertools
+
+import cachetools
+import httpx
+from solders.pubkey import Pubkey
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from .metrics import Counter, span
+
+LAMPORTS_PER_SOL = 1_000_000_000
+# Server-side limit on keys per getMultipleAccounts call
+MAX_ACCOUNTS_PER_CALL = 100
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+RPC_RETRIES = Counter("rpc_retries", "JSON-RPC requests sent again after a retryable failure", ["method"])
+
+
+class RPCError(Exception):
+    """Raised when the RPC node answers with a JSON-RPC error"""
+
+
+def _retryable(exc):
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+class SolanaRPC:
+    def __init__(self, url, commitment="confirmed", cache_ttl=2.0, cache_size=100_000,
+                 batch_window=0.002, max_calls_per_batch=10, max_connections=16, attempts=4):
+        self.url = url
+        self.commitment = commitment
+        self.batch_window = batch_window
+        self.max_keys = MAX_ACCOUNTS_PER_CALL * max_calls_per_batch
+        self.attempts = attempts
+        self.requests_sent = 0
+        self._client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=10,
+        )
+        self._cache = cachetools.TTLCache(cache_size, cache_ttl)  # key -> (slot, lamports)
+        self._floors = cachetools.TTLCache(cache_size, cache_ttl)  # key -> oldest acceptable slot
+        self._pending = {}
+        self._flush_handle = None
+        self._inflight = set()
+        self._ids = itertools.count(1)
+
+    async def get_balance(self, public_key):
+        """Lamport balance of an account (0 if it does not exist)
+
+        Raises ``ValueError`` for a malformed public key.
+        """
+        key = str(Pubkey.from_string(public_key))
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached[1]
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            if len(self._pending) >= self.max_keys:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        # Other callers may be waiting on the same lookup
+        return await asyncio.shield(future)
+
+    async def get_balances(self, public_keys):
+        balances = await asyncio.gather(*(self.get_balance(key) for key in public_keys))
+        return dict(zip(public_keys, balances))
+
+    async def call(self, method, params):
+        """Send one JSON-RPC request (retried like balance lookups) and return its result"""
+        response, = await self._post({"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params})
+        if "error" in response:
+            raise RPCError(response["error"].get("message", "RPC error"))
+        return response["result"]
+
+    def invalidate(self, public_key, slot=None):
+        """Forget a cached balance, and with ``slot`` refuse answers older than it"""
+        key = str(public_key)
+        cached = self._cache.get(key)
+        if cached is not None and (slot is None or cached[0] < slot):
+            del self._cache[key]
+        if slot is not None:
+            self._floors[key] = max(slot, self._floors.get(key, 0))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = asyncio.ensure_future(self._fetch(pending))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _fetch(self, pending):
+        keys = list(pending)
+        chunks = [keys[i:i + MAX_ACCOUNTS_PER_CALL] for i in range(0, len(keys), MAX_ACCOUNTS_PER_CALL)]
+        calls = {next(self._ids): chunk for chunk in chunks}
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "id": call_id,
+                "method": "getMultipleAccounts",
+                "params": [chunk, {
+                    "encoding": "base64",
+                    "commitment": self.commitment,
+                    "dataSlice": {"offset": 0, "length": 0},
+                }],
+            }
+            for call_id, chunk in calls.items()
+        ]
+        try:
+            responses = await self._post(payload if len(payload) > 1 else payload[0])
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for response in responses:
+            chunk = calls.pop(response.get("id"), None)
+            if chunk is None:
+                continue
+            if "error" in response:
+                error = RPCError(response["error"].get("message", "RPC error"))
+                for key in chunk:
+                    pending[key].set_exception(error)
+                continue
+            result = response["result"]
+            slot = result["context"]["slot"]
+            for key, account in zip(chunk, result["value"]):
+                lamports = 0 if account is None else account["lamports"]
+                pending[key].set_result(self._store(key, slot, lamports))
+        for chunk in calls.values():
+            for key in chunk:
+                pending[key].set_exception(RPCError("No response for account lookup"))
+
+    def _store(self, key, slot, lamports):
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > slot:
+            return cached[1]
+        if slot >= self._floors.get(key, 0):
+            self._cache[key] = (slot, lamports)
+        return lamports
+
+    async def _post(self, payload):
+        method = (payload[0] if isinstance(payload, list) else payload)["method"]
+        with span(f"rpc.{method}"):
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(self.attempts),
+                wait=wait_exponential_jitter(initial=0.05, max=2),
+                retry=retry_if_exception(_retryable),
+                reraise=True,
+            ):
+                with attempt:
+                    if attempt.retry_state.attempt_number > 1:
+                        RPC_RETRIES.labels(method).inc()
+                    self.requests_sent += 1
+                    response = await self._client.post(self.url, json=payload)
+                    response.raise_for_status()
+                    body = response.json()
+        return body if isinstance(body, list) else [body]
+
+    async def close(self):
+        await self._client.aclose()
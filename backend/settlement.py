@@ -0,0 +1,273 @@
+"""Batched on-chain settlement of ledger redemptions.
+
+The ledger debits a redemption as soon as it is requested; this module
+anchors it on Solana afterwards as a memo holding the ledger's
+transaction id. Each redemption is its own memo instruction, and as many
+as fit in the 1232-byte packet limit (22 at most) share one transaction,
+so a spike of identical redemptions costs a handful of round-trips rather
+than one each.
+
+Up to ``window`` transactions are in flight at a time. A separate loop
+polls ``getSignatureStatuses`` for all of them together and re-queues
+only the redemptions that did not land:
+
+* a transaction still missing once its blockhash has expired can no
+  longer land, so all of its entries go back on the queue;
+* a transaction that fails at instruction *i* rolls back as a whole, so
+  the other entries are re-queued as they are and entry *i* is retried up
+  to ``attempts`` times before it is marked failed. The cluster would
+  treat an identical resend as already processed, so the retry is packed
+  under a newer blockhash.
+
+A send that fails for any reason other than an RPC or HTTP error counts
+as an attempt for every entry in it, so entries that cannot be packed or
+signed end up failed rather than re-queued forever.
+
+Settlement state is held in memory: redemptions still queued when the
+process stops remain debited in the ledger but are not anchored.
+"""
+import asyncio
+import base64
+import collections
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import cachetools
+import httpx
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.message import Message
+from solders.pubkey import Pubkey
+from solders.transaction import Transaction
+
+from .metrics import traced
+from .rpc import RPCError
+
+MEMO_PROGRAM = Pubkey.from_string("MemoSq4gqABAXKb96qnH8TysNcWxMyWCqXgDLGmfcHr")
+PACKET_DATA_SIZE = 1232
+# Signature count and signature, message header, key count, payer and memo
+# program keys, recent blockhash and instruction count
+TX_OVERHEAD = 1 + 64 + 3 + 1 + 2 * 32 + 32 + 1
+# Program index, account count and data length ahead of each memo
+ENTRY_OVERHEAD = 3
+MAX_STATUSES_PER_CALL = 256
+LANDED = {"confirmed", "finalized"}
+
+PENDING = "pending"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Settlement:
+    tx: bytes
+    submitted_at: float
+    status: str = PENDING
+    signature: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    settled_at: Optional[float] = None
+    memo: bytes = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.memo = str(Hash(self.tx)).encode()
+
+
+class SettlementSubmitter:
+    def __init__(self, rpc, payer, window=8, max_entries_per_transaction=None, poll_interval=0.4,
+                 attempts=3, blockhash_ttl=20.0, history=100_000, history_ttl=3600):
+        self.rpc = rpc
+        self.payer = payer
+        self.window = window
+        self.max_entries = max_entries_per_transaction
+        self.poll_interval = poll_interval
+        self.attempts = attempts
+        self.blockhash_ttl = blockhash_ttl
+        self.transactions_sent = 0
+        self.requeued = 0
+        self._queue = collections.deque()
+        self._pending = {}  # ledger tx -> Settlement, queued or in flight
+        self._finished = cachetools.TTLCache(history, history_ttl)
+        self._inflight = {}  # signature -> (entries, last valid block height)
+        self._failed_signatures = cachetools.TTLCache(history, history_ttl)
+        self._sending = 0
+        self._blockhash = None  # (fetched_at, blockhash, last valid block height)
+        self._blockhash_lock = None
+        self._wakeup = None
+        self._loop = None
+        self._tasks = set()
+
+    def start(self):
+        """Start the send and confirmation loops on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._blockhash_lock = asyncio.Lock()
+        for loop in (self._send_loop(), self._confirm_loop()):
+            self._spawn(loop)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, tx):
+        """Queue a ledger transaction id for settlement (safe from any thread)"""
+        self._loop.call_soon_threadsafe(self._enqueue, tx, time.time())
+
+    def status(self, tx):
+        """Settlement of a ledger transaction id, or None if it was never submitted"""
+        return self._pending.get(tx) or self._finished.get(tx)
+
+    def pending(self):
+        return len(self._pending)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _enqueue(self, tx, submitted_at):
+        # An idempotent replay of a redemption submits the same id again
+        if tx in self._pending or tx in self._finished:
+            return
+        settlement = self._pending[tx] = Settlement(tx, submitted_at)
+        self._queue.append(settlement)
+        self._wakeup.set()
+
+    def _requeue(self, entries):
+        self.requeued += len(entries)
+        for entry in entries:
+            entry.signature = None
+        self._queue.extendleft(reversed(entries))
+        self._wakeup.set()
+
+    def _finish(self, entry, status, error=None):
+        entry.status = status
+        entry.error = error
+        entry.settled_at = time.time()
+        del self._pending[entry.tx]
+        self._finished[entry.tx] = entry
+
+    async def _send_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue and len(self._inflight) + self._sending < self.window:
+                self._sending += 1
+                self._spawn(self._send(self._pack()))
+
+    def _pack(self):
+        entries = []
+        size = TX_OVERHEAD
+        while self._queue and len(entries) != self.max_entries:
+            cost = ENTRY_OVERHEAD + len(self._queue[0].memo)
+            if size + cost > PACKET_DATA_SIZE:
+                break
+            entries.append(self._queue.popleft())
+            size += cost
+        return entries
+
+    @traced("settlement.send")
+    async def _send(self, entries):
+        try:
+            blockhash, last_valid = await self._latest_blockhash()
+            message = Message.new_with_blockhash(
+                [Instruction(MEMO_PROGRAM, entry.memo, []) for entry in entries], self.payer.pubkey(), blockhash
+            )
+            transaction = Transaction([self.payer], message, blockhash)
+            if str(transaction.signatures[0]) in self._failed_signatures:
+                # Same entries under the same blockhash: wait for a newer one
+                self._blockhash = None
+                self._requeue(entries)
+                await asyncio.sleep(self.poll_interval)
+                return
+            signature = await self.rpc.call("sendTransaction", [base64.b64encode(bytes(transaction)).decode(), {
+                "encoding": "base64", "skipPreflight": True,
+            }])
+        except (RPCError, httpx.HTTPError) as e:
+            logger.warning("Sending a settlement transaction failed: %s", e)
+            self._requeue(entries)
+            # Back off before the send loop retries against the same node
+            await asyncio.sleep(self.poll_interval)
+            return
+        except Exception as e:
+            # Anything else may fail again for the same entries, so it counts as an attempt
+            logger.exception("Sending a settlement transaction failed")
+            self._retry(entries, repr(e))
+            await asyncio.sleep(self.poll_interval)
+            return
+        finally:
+            self._sending -= 1
+            self._wakeup.set()
+        self.transactions_sent += 1
+        self._inflight[signature] = (entries, last_valid)
+        for entry in entries:
+            entry.signature = signature
+
+    async def _latest_blockhash(self):
+        async with self._blockhash_lock:
+            if self._blockhash is None or time.monotonic() - self._blockhash[0] > self.blockhash_ttl:
+                value = (await self.rpc.call("getLatestBlockhash", [{"commitment": self.rpc.commitment}]))["value"]
+                self._blockhash = (time.monotonic(), Hash.from_string(value["blockhash"]),
+                                   value["lastValidBlockHeight"])
+            return self._blockhash[1:]
+
+    async def _confirm_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self._inflight:
+                continue
+            signatures = list(self._inflight)
+            try:
+                block_height, *pages = await asyncio.gather(
+                    self.rpc.call("getBlockHeight", [{"commitment": self.rpc.commitment}]),
+                    *(self.rpc.call("getSignatureStatuses", [signatures[i:i + MAX_STATUSES_PER_CALL]])
+                      for i in range(0, len(signatures), MAX_STATUSES_PER_CALL)),
+                )
+            except (RPCError, httpx.HTTPError) as e:
+                logger.warning("Polling settlement confirmations failed: %s", e)
+                continue
+            except Exception:
+                # The transactions stay in flight and are polled again
+                logger.exception("Polling settlement confirmations failed")
+                continue
+            statuses = [status for page in pages for status in page["value"]]
+            for signature, status in zip(signatures, statuses):
+                entries, last_valid = self._inflight[signature]
+                if status is None or (status["err"] is None and status.get("confirmationStatus") not in LANDED):
+                    if block_height > last_valid:
+                        del self._inflight[signature]
+                        self._requeue(entries)
+                    continue
+                del self._inflight[signature]
+                if status["err"] is None:
+                    for entry in entries:
+                        self._finish(entry, CONFIRMED)
+                else:
+                    self._failed(signature, entries, status["err"])
+            self._wakeup.set()
+
+    def _failed(self, signature, entries, error):
+        self._failed_signatures[signature] = True
+        self._blockhash = None
+        index = None
+        if isinstance(error, dict) and "InstructionError" in error:
+            index = error["InstructionError"][0]
+        self._retry(entries, str(error), index)
+
+    def _retry(self, entries, error, index=None):
+        # Entry ``index`` (every entry if None) used an attempt; the others go back as they are
+        retry = []
+        for i, entry in enumerate(entries):
+            if index is None or i == index:
+                entry.attempts += 1
+                if entry.attempts >= self.attempts:
+                    self._finish(entry, FAILED, error)
+                    continue
+            retry.append(entry)
+        if retry:
+            self._requeue(retry)
@@ -0,0 +1,539 @@
+"""Points ledger sharded across worker processes.
+
+Wallets are spread over a fixed set of ``SLOTS`` hash slots (crc32 of the
+public key), and a ``ShardMap`` assigns every slot to one shard. Each
+shard is a worker process owning a ``Ledger`` with its own write-ahead
+log under ``<directory>/shard-NN``. It answers routers over a Unix
+socket and refuses requests for wallets outside its slots with
+``WrongShard``.
+
+``ShardedLedger`` is the router. It has the ``Ledger`` API and forwards
+each call to the owning shard over one pipelined connection per shard.
+Calls spanning wallets, such as bulk credits, are split and sent to all
+their shards at once. Several routers, in different processes, may share
+one pool: the map is kept in ``<directory>/shards.json`` and a router
+rereads it whenever a shard turns a request away.
+
+Resharding moves whole slots. The source shard freezes them and waits
+out requests already running, then exports their wallets. The
+destination imports and checkpoints them. The new map is saved, and only
+then does the source drop its copies. Until the map is saved, the old
+owner is authoritative: a move that fails part-way is rolled back, the
+sources serving their slots again and the destinations dropping their
+copies, and after a crash part-way, workers start from the saved map and
+discard wallets outside their slots.
+"""
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing.connection import Client, Listener
+
+from . import metrics
+from .activity import ActivityLog, StringTable
+from .ledger import STATEMENT_PAGE, Ledger
+from .storage import LedgerStorage
+
+SLOTS = 1024
+MAP_FILE = "shards.json"
+# Threads per worker running writes, which wait on their log flush
+WORKER_THREADS = 16
+# Threads per worker running long reads, kept apart from the writes waiting on a flush
+READ_THREADS = 4
+# How long a router keeps retrying a wallet whose slot is being moved
+MIGRATION_TIMEOUT = 30.0
+RETRY_DELAY = 0.005
+# Answered on the connection's own thread, as they cost about as much as handing them off
+READS = frozenset({"balances", "activities", "summary", "wallets_ahead"})
+# Reads that copy a statement page or rank the board: run on the read pool, so requests
+# pipelined behind them on the connection are not held up
+LONG_READS = frozenset({"statement", "leaderboard"})
+
+SHARD_RETRIES = metrics.Counter("shard_retries", "Router calls retried while a wallet's slot moved", ["method"])
+
+
+def slot_of(public_key):
+    return zlib.crc32(public_key.encode()) % SLOTS
+
+
+class WrongShard(Exception):
+    """Raised by a shard for a wallet outside its slots or in a slot being moved"""
+
+
+@dataclass
+class ShardMap:
+    owners: list  # slot -> shard index
+    version: int = 0
+
+    @classmethod
+    def even(cls, shards):
+        return cls([slot % shards for slot in range(SLOTS)])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["owners"], data["version"])
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": self.version, "owners": self.owners}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @property
+    def shards(self):
+        return max(self.owners) + 1
+
+    def owner(self, public_key):
+        return self.owners[slot_of(public_key)]
+
+    def slots(self, shard):
+        return {slot for slot, owner in enumerate(self.owners) if owner == shard}
+
+    def rebalanced(self, shards):
+        """A map over ``shards`` shards that moves as few slots as possible"""
+        quota = [SLOTS // shards + (i < SLOTS % shards) for i in range(shards)]
+        owners = list(self.owners)
+        unassigned = []
+        for slot, owner in enumerate(owners):
+            if owner < shards and quota[owner] > 0:
+                quota[owner] -= 1
+            else:
+                unassigned.append(slot)
+        for shard in range(shards):
+            for _ in range(quota[shard]):
+                owners[unassigned.pop()] = shard
+        return ShardMap(owners, self.version + 1)
+
+
+def _socket_path(directory, shard):
+    return os.path.join(directory, f"shard-{shard:02d}.sock")
+
+
+class ShardWorker:
+    """One shard's ledger, served to routers over a Unix socket"""
+
+    def __init__(self, index, directory, slots, group_commit=True):
+        self.index = index
+        self.ledger = Ledger(storage=LedgerStorage(os.path.join(directory, f"shard-{index:02d}"), group_commit))
+        self._owned = set(slots)
+        self._frozen = set()
+        self._running = Counter()  # slot -> requests in progress
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(WORKER_THREADS, thread_name_prefix=f"shard-{index}")
+        self._reads = ThreadPoolExecutor(READ_THREADS, thread_name_prefix=f"shard-{index}-read")
+        # Copies left behind by a move that did not finish
+        if any(slot_of(public_key) not in self._owned for public_key, _ in self.ledger.wallet_logs()[1]):
+            self.ledger.drop_wallets(lambda public_key: slot_of(public_key) not in self._owned)
+        self._wallet_methods = {
+            "balances": self.ledger.balances,
+            "debit": self.ledger.debit,
+            "redeem": self._redeem,
+            "activities": self.ledger.activities,
+            "statement": self.ledger.statement,
+            "summary": self.ledger.summary,
+        }
+        self._shard_methods = {
+            "credit_many": self._credit_many,
+            "earned_txs": self.ledger.earned_txs,
+            "stock_taken": self.ledger.stock_taken,
+            "leaderboard": self.ledger.leaderboard,
+            "wallets_ahead": self.ledger.wallets_ahead,
+            "dump": self._dump,
+            "checkpoint": self.ledger.checkpoint,
+            "export_slots": self._export_slots,
+            "thaw_slots": self._thaw_slots,
+            "import_slots": self._import_slots,
+            "drop_slots": self._drop_slots,
+        }
+
+    @contextmanager
+    def _admit(self, slots):
+        with self._cond:
+            for slot in slots:
+                if slot not in self._owned or slot in self._frozen:
+                    raise WrongShard(f"Shard {self.index} does not hold slot {slot}.")
+            self._running.update(slots)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running.subtract(slots)
+                self._cond.notify_all()
+
+    def _redeem(self, public_key, reward, points, idempotency_key, reward_id):
+        # Stock lives with the router: tell it whether this call took the unit it reserved
+        taken = _Taken(reward_id) if reward_id is not None else None
+        activity = self.ledger.redeem(public_key, reward, points, idempotency_key, taken)
+        return activity, taken is not None and taken.taken
+
+    def _credit_many(self, credits):
+        with self._admit({slot_of(public_key) for public_key, _, _, _ in credits}):
+            return self.ledger.credit_many(credits)
+
+    def _dump(self):
+        labels, logs = self.ledger.wallet_logs()
+        wallets = [(public_key, len(log), log.to_bytes(len(log))) for public_key, log in logs]
+        # Copied after the logs, so it names every code in them
+        return list(labels), wallets
+
+    def _export_slots(self, slots):
+        slots = set(slots)
+        with self._cond:
+            if not slots <= self._owned:
+                raise WrongShard(f"Shard {self.index} does not hold all of the slots to export.")
+            self._frozen |= slots
+            while any(self._running[slot] for slot in slots):
+                self._cond.wait()
+        try:
+            return self.ledger.export_wallets(lambda public_key: slot_of(public_key) in slots)
+        except BaseException:
+            self._thaw_slots(slots)
+            raise
+
+    def _thaw_slots(self, slots):
+        """Serve frozen slots again after a move of them was abandoned"""
+        with self._cond:
+            self._frozen -= set(slots)
+
+    def _import_slots(self, slots, labels, wallets):
+        self.ledger.import_wallets(labels, wallets)
+        with self._cond:
+            self._owned |= set(slots)
+
+    def _drop_slots(self, slots):
+        slots = set(slots)
+        with self._cond:
+            self._owned -= slots
+            self._frozen -= slots
+        self.ledger.drop_wallets(lambda public_key: slot_of(public_key) in slots)
+
+    def call(self, method, args):
+        wallet_method = self._wallet_methods.get(method)
+        if wallet_method is not None:
+            with self._admit((slot_of(args[0]),)):
+                return wallet_method(*args)
+        return self._shard_methods[method](*args)
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+
+        def run(request_id, method, args):
+            try:
+                reply = (request_id, True, self.call(method, args))
+            except Exception as e:
+                reply = (request_id, False, e)
+            with send_lock:
+                conn.send(reply)
+
+        while True:
+            try:
+                request_id, method, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            if method == "close":
+                self.ledger.close()
+                with send_lock:
+                    conn.send((request_id, True, None))
+                os._exit(0)
+            if method in READS:
+                run(request_id, method, args)
+            elif method in LONG_READS:
+                self._reads.submit(run, request_id, method, args)
+            else:
+                self._pool.submit(run, request_id, method, args)
+
+    def serve(self, address, authkey):
+        with Listener(address, authkey=authkey) as listener:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class _Taken:
+    __slots__ = ("reward_id", "taken")
+
+    def __init__(self, reward_id):
+        self.reward_id = reward_id
+        self.taken = False
+
+    def reserve(self):
+        self.taken = True
+
+
+def run_worker(index, directory, slots, authkey, group_commit=True):
+    """Process entry point for one shard"""
+    address = _socket_path(directory, index)
+    if os.path.exists(address):
+        os.remove(address)
+    ShardWorker(index, directory, slots, group_commit).serve(address, authkey)
+
+
+class ShardClient:
+    """A router's pipelined connection to one shard"""
+
+    def __init__(self, address, authkey, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._conn = Client(address, authkey=authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+        threading.Thread(target=self._read, name="shard-client", daemon=True).start()
+
+    def submit(self, method, *args):
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self._conn.send((request_id, method, args))
+        return future
+
+    def call(self, method, *args):
+        return self.submit(method, *args).result()
+
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, value = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("Shard connection closed"))
+
+    def close(self):
+        self._conn.close()
+
+
+class ShardedLedger:
+    """The ``Ledger`` API over a pool of shard processes
+
+    With ``spawn`` the router starts the pool (``shards`` workers, or the
+    saved map's count); without it, it attaches to a pool another router
+    started in ``directory`` with the same ``authkey``.
+    """
+
+    def __init__(self, directory, shards=None, group_commit=True, authkey=None, spawn=True):
+        self.directory = directory
+        self.authkey = authkey or secrets.token_bytes(16)
+        self.group_commit = group_commit
+        self._map_path = os.path.join(directory, MAP_FILE)
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._map_path):
+            self._map = ShardMap.load(self._map_path)
+        else:
+            self._map = ShardMap.even(shards or os.cpu_count())
+            self._map.save(self._map_path)
+        self._processes = {}
+        self._clients = {}
+        if spawn:
+            for shard in range(self._map.shards):
+                self._start_worker(shard)
+        for shard in range(self._map.shards):
+            self._connect(shard)
+        if spawn and shards and shards != self._map.shards:
+            self.reshard(shards)
+
+    def _start_worker(self, shard):
+        process = multiprocessing.get_context("spawn").Process(
+            target=run_worker, name=f"ledger-shard-{shard}", daemon=True,
+            args=(shard, self.directory, self._map.slots(shard), self.authkey, self.group_commit),
+        )
+        process.start()
+        self._processes[shard] = process
+
+    def _connect(self, shard):
+        self._clients[shard] = ShardClient(_socket_path(self.directory, shard), self.authkey)
+
+    @property
+    def shards(self):
+        return self._map.shards
+
+    def _route(self, method, public_key, *args):
+        deadline = time.monotonic() + MIGRATION_TIMEOUT
+        while True:
+            shard = self._map.owner(public_key)
+            try:
+                with metrics.span(f"shard.{method}"):
+                    return self._clients[shard].call(method, public_key, *args)
+            except WrongShard:
+                SHARD_RETRIES.labels(method).inc()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(RETRY_DELAY)
+                self._reload_map()
+
+    def _reload_map(self):
+        shard_map = ShardMap.load(self._map_path)
+        if shard_map.version != self._map.version:
+            for shard in range(shard_map.shards):
+                if shard not in self._clients:
+                    self._connect(shard)
+            self._map = shard_map
+
+    def _gather(self, method, *args):
+        futures = [client.submit(method, *args) for client in self._clients.values()]
+        return [future.result() for future in futures]
+
+    def balances(self, public_key):
+        return self._route("balances", public_key)
+
+    def debit(self, public_key, points):
+        return self._route("debit", public_key, points)
+
+    def redeem(self, public_key, reward, points, idempotency_key=None, stock=None):
+        """As ``Ledger.redeem``; stock is reserved here and released if the shard did not take it"""
+        if stock is not None:
+            stock.reserve()
+        taken = False
+        try:
+            activity, taken = self._route("redeem", public_key, reward, points, idempotency_key,
+                                          stock.reward_id if stock is not None else None)
+        finally:
+            if stock is not None and not taken:
+                stock.release()
+        return activity
+
+    def activities(self, public_key, limit=20, cursor=None, since=None, until=None, types=None):
+        return self._route("activities", public_key, limit, cursor, since, until, types)
+
+    def statement(self, public_key, since=None, until=None, cursor=None, limit=STATEMENT_PAGE):
+        return self._route("statement", public_key, since, until, cursor, limit)
+
+    def summary(self, public_key):
+        return self._route("summary", public_key)
+
+    def leaderboard(self, k=10):
+        """Every shard's top ``k``, merged"""
+        tops = self._gather("leaderboard", k)
+        return list(itertools.islice(heapq.merge(*tops, key=lambda entry: -entry[1]), k))
+
+    def rank(self, public_key):
+        earned = self.summary(public_key)["earned"]
+        if not earned:
+            return None
+        return sum(self._gather("wallets_ahead", earned)) + 1
+
+    def credit_many(self, credits):
+        balances = {}
+        deadline = time.monotonic() + MIGRATION_TIMEOUT
+        while credits:
+            by_shard = defaultdict(list)
+            for credit in credits:
+                by_shard[self._map.owner(credit[0])].append(credit)
+            futures = [(self._clients[shard].submit("credit_many", batch), batch)
+                       for shard, batch in by_shard.items()]
+            credits = []
+            for future, batch in futures:
+                try:
+                    balances.update(future.result())
+                except WrongShard:
+                    credits.extend(batch)
+            if credits:
+                if time.monotonic() > deadline:
+                    raise WrongShard("Slots stayed in migration for too long.")
+                time.sleep(RETRY_DELAY)
+                self._reload_map()
+        return balances
+
+    def earned_txs(self, since):
+        return [tx for txs in self._gather("earned_txs", since) for tx in txs]
+
+    def stock_taken(self):
+        taken = Counter()
+        for shard_taken in self._gather("stock_taken"):
+            taken.update(shard_taken)
+        return dict(taken)
+
+    def wallet_logs(self):
+        """``(labels, logs)``: every shard's activity logs, with label codes merged into one table"""
+        merged = StringTable()
+        logs = []
+        for labels, wallets in self._gather("dump"):
+            codes = array("I", [merged.code(label) for label in labels])
+            for public_key, n, buf in wallets:
+                log = ActivityLog.from_bytes(buf, n)
+                log.types = array("I", map(codes.__getitem__, log.types))
+                log.rewards = array("I", map(codes.__getitem__, log.rewards))
+                logs.append((public_key, log))
+        return merged.strings, logs
+
+    def checkpoint(self):
+        self._gather("checkpoint")
+
+    def reshard(self, shards):
+        """Move slots so the pool has ``shards`` shards, starting or stopping workers as needed"""
+        old = self._map
+        new = old.rebalanced(shards)
+        for shard in range(old.shards, shards):
+            self._start_worker(shard)
+            self._connect(shard)
+        moves = defaultdict(list)
+        for slot, (src, dst) in enumerate(zip(old.owners, new.owners)):
+            if src != dst:
+                moves[src, dst].append(slot)
+        done = []
+        try:
+            for (src, dst), slots in moves.items():
+                labels, wallets = self._clients[src].call("export_slots", slots)
+                done.append((src, dst, slots))
+                self._clients[dst].call("import_slots", slots, labels, wallets)
+            new.save(self._map_path)
+        except BaseException:
+            # The old map still stands: sources serve their slots again, and
+            # destinations discard whatever copies they imported
+            for src, dst, slots in done:
+                self._clients[dst].call("drop_slots", slots)
+                self._clients[src].call("thaw_slots", slots)
+            raise
+        self._map = new
+        for (src, _), slots in moves.items():
+            self._clients[src].call("drop_slots", slots)
+        for shard in range(shards, old.shards):
+            self._stop_worker(shard)
+        return sum(len(slots) for slots in moves.values())
+
+    def _stop_worker(self, shard):
+        client = self._clients.pop(shard)
+        try:
+            client.call("close")
+        except ConnectionError:
+            pass
+        process = self._processes.pop(shard, None)
+        if process is not None:
+            process.join(timeout=10)
+
+    def close(self):
+        """Close the connections, and the pool too if this router started it"""
+        for shard in list(self._clients):
+            if shard in self._processes:
+                self._stop_worker(shard)
+            else:
+                self._clients.pop(shard).close()
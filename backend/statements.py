@@ -0,0 +1,157 @@
+"""Streaming statement export of a wallet's activity history.
+
+A statement is every activity of one wallet in a time range, oldest
+first, as CSV, JSON Lines or Parquet. It is read from the ledger a page
+of columns at a time (``Ledger.statement``). Each page is encoded and
+handed on before the next is read, so a statement of any length is
+produced with a bounded amount of memory. The generators here are meant
+for a ``StreamingResponse``, which sends each chunk as it is produced
+with chunked transfer encoding and waits while the client is slow to
+read it.
+
+The range is fixed when the first page is read. Activities recorded while
+a statement is being streamed are not part of it.
+"""
+import csv
+import io
+import json
+
+from .activity import TX_SIZE
+from .lazy import lazy_import
+
+# Imported on first use; see lazy.py
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COLUMNS = ("timestamp", "type", "reward", "points", "tx")
+# Activities encoded at a time: one chunk of CSV or JSON Lines, one Parquet row group
+CHUNK_ROWS = 10_000
+ROW_GROUP_ROWS = 100_000
+
+
+def pages(ledger, public_key, since=None, until=None, limit=CHUNK_ROWS):
+    """Yield a wallet's activities in ``[since, until]`` as pages of columns, oldest first"""
+    cursor = None
+    while True:
+        page, cursor = ledger.statement(public_key, since, until, cursor, limit)
+        if page is not None and page[0]:
+            yield page
+        if cursor is None:
+            return
+
+
+def _tx_hex(txs):
+    hexed = txs.hex()
+    width = 2 * TX_SIZE
+    return [hexed[i:i + width] for i in range(0, len(hexed), width)]
+
+
+def _csv_field(label):
+    if label is None:
+        return ""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow([label])
+    return buffer.getvalue()
+
+
+def _labelled_pages(ledger, public_key, since, until, encode):
+    # Labels are few and repeat on every row, so each is encoded once per statement
+    encoded = {}
+    for timestamps, points, types, rewards, txs, labels in pages(ledger, public_key, since, until):
+        for code, label in labels.items():
+            if code not in encoded:
+                encoded[code] = encode(label)
+        yield zip(timestamps, map(encoded.__getitem__, types), map(encoded.__getitem__, rewards), points,
+                  _tx_hex(txs))
+
+
+def csv_chunks(ledger, public_key, since=None, until=None):
+    yield (",".join(COLUMNS) + "\n").encode()
+    for rows in _labelled_pages(ledger, public_key, since, until, _csv_field):
+        yield "".join([f"{timestamp},{type_},{reward},{points},{tx}\n"
+                       for timestamp, type_, reward, points, tx in rows]).encode()
+
+
+def jsonl_chunks(ledger, public_key, since=None, until=None):
+    for rows in _labelled_pages(ledger, public_key, since, until, json.dumps):
+        yield "".join([
+            f'{{"timestamp":{timestamp},"type":{type_},"reward":{reward},"points":{points},"tx":"{tx}"}}\n'
+            for timestamp, type_, reward, points, tx in rows
+        ]).encode()
+
+
+class _Sink(io.RawIOBase):
+    """A write-only stream whose contents are taken out as they are written"""
+
+    def __init__(self):
+        self._parts = []
+        self._written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _schema():
+    return pa.schema([
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("type", pa.string()),
+        ("reward", pa.string()),
+        ("points", pa.int64()),
+        ("tx", pa.binary(TX_SIZE)),
+    ])
+
+
+def _labels_column(codes, labels):
+    # Only the codes on this page are known, so the dictionary is padded where codes are unused
+    values = [None] * (max(labels) + 1)
+    for code, label in labels.items():
+        values[code] = label
+    indices = pa.Array.from_buffers(pa.uint32(), len(codes), [None, pa.py_buffer(codes)]).cast(pa.int32())
+    return pa.DictionaryArray.from_arrays(indices, pa.array(values, pa.string())).dictionary_decode()
+
+
+def parquet_chunks(ledger, public_key, since=None, until=None):
+    schema = _schema()
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for timestamps, points, types, rewards, txs, labels in pages(
+                ledger, public_key, since, until, ROW_GROUP_ROWS):
+            n = len(timestamps)
+            writer.write_table(pa.table([
+                pa.Array.from_buffers(pa.int64(), n, [None, pa.py_buffer(timestamps)]).cast(schema.field(0).type),
+                _labels_column(types, labels),
+                _labels_column(rewards, labels),
+                pa.Array.from_buffers(pa.int64(), n, [None, pa.py_buffer(points)]),
+                pa.Array.from_buffers(pa.binary(TX_SIZE), n, [None, pa.py_buffer(txs)]),
+            ], schema=schema), row_group_size=n)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_ENCODERS = {"csv": csv_chunks, "jsonl": jsonl_chunks, "parquet": parquet_chunks}
+
+
+def export(ledger, public_key, fmt, since=None, until=None):
+    """Yield a wallet's statement in ``fmt`` (a key of ``FORMATS``) as chunks of bytes"""
+    return _ENCODERS[fmt](ledger, public_key, since, until)
@@ -0,0 +1,382 @@
+"""Durable ledger storage: write-ahead log, snapshots and recovery.
+
+Every ledger mutation is appended to a write-ahead log before the API
+answers. With group commit, a flusher thread writes whatever has queued
+up since its last pass and covers the whole batch with a single fsync,
+so concurrent writers share the cost of each flush.
+
+The log is split into numbered segments. A checkpoint rotates to a new
+segment and writes a compact binary snapshot of every wallet, after which
+the segments it covers are deleted. Recovery loads the newest snapshot
+and replays only the segments written after it.
+
+On-disk layout inside the storage directory::
+
+    wal-00000003.log        records appended after snapshot 3
+    snapshot-00000003.bin   state as of the start of segment 3
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+
+from .activity import ActivityLog
+from .metrics import Histogram
+
+REDEEM = 1
+DEBIT = 2
+EARN = 3
+
+# Records between automatic checkpoints
+SNAPSHOT_EVERY = 1_000_000
+
+_FRAME = struct.Struct("<II")  # payload length, crc32
+_RECORD = struct.Struct("<Bqq32s")  # kind, timestamp, points, tx
+_STR = struct.Struct("<H")
+_SNAPSHOT_MAGIC = b"SZLSNAP2"
+_SNAPSHOT_HEADER = struct.Struct("<II")  # labels, wallets
+_WALLET = struct.Struct("<qqIII")  # sol, tokens, activities, idempotency keys, rewards taken from stock
+_KEY_INDEX = struct.Struct("<I")
+_UNITS = struct.Struct("<I")
+
+WAL_FLUSH_SECONDS = Histogram("wal_flush_seconds", "Time to write and fsync one batch of log records")
+WAL_FLUSH_RECORDS = Histogram("wal_flush_records", "Log records written per flush",
+                              buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096))
+
+
+class CorruptSnapshot(Exception):
+    """Raised when a snapshot file fails its integrity check"""
+
+
+def _pack_str(s):
+    data = (s or "").encode()
+    return _STR.pack(len(data)) + data
+
+
+def _unpack_str(buf, offset):
+    (n,) = _STR.unpack_from(buf, offset)
+    offset += _STR.size
+    return bytes(buf[offset:offset + n]).decode(), offset + n
+
+
+def encode_record(kind, public_key, timestamp, points, type_=None, reward=None, tx=bytes(32),
+                  idempotency_key=None, reward_id=None):
+    payload = b"".join((
+        _RECORD.pack(kind, timestamp, points, tx),
+        _pack_str(public_key),
+        _pack_str(type_),
+        _pack_str(reward),
+        _pack_str(idempotency_key),
+        _pack_str(reward_id),
+    ))
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_earnings(timestamp, earnings):
+    """Encode ``(public_key, type, points, tx)`` EARN records back to back
+
+    Equivalent to concatenating ``encode_record`` for each, packing every
+    distinct string only once.
+    """
+    packed = {}
+    tail = _pack_str(None) * 2
+    out = []
+    for public_key, type_, points, tx in earnings:
+        key = packed.get(public_key)
+        if key is None:
+            key = packed[public_key] = _pack_str(public_key)
+        label = packed.get(type_)
+        if label is None:
+            label = packed[type_] = _pack_str(type_)
+        payload = b"".join((_RECORD.pack(EARN, timestamp, points, tx), key, label, tail))
+        out.append(_FRAME.pack(len(payload), zlib.crc32(payload)))
+        out.append(payload)
+    return b"".join(out)
+
+
+def iter_records(buf):
+    """Yield ``(end_offset, record)`` for each intact record in ``buf``
+
+    Stops at the first torn or corrupt frame, which is where a crash
+    interrupted the last write.
+    """
+    offset = 0
+    while offset + _FRAME.size <= len(buf):
+        length, crc = _FRAME.unpack_from(buf, offset)
+        start = offset + _FRAME.size
+        payload = buf[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        kind, timestamp, points, tx = _RECORD.unpack_from(payload)
+        pos = _RECORD.size
+        public_key, pos = _unpack_str(payload, pos)
+        type_, pos = _unpack_str(payload, pos)
+        reward, pos = _unpack_str(payload, pos)
+        key, pos = _unpack_str(payload, pos)
+        # Earnings end before the catalog reward id
+        reward_id, pos = _unpack_str(payload, pos) if pos < length else ("", pos)
+        offset = start + length
+        yield offset, (kind, public_key, timestamp, points, type_ or None, reward or None, tx, key or None,
+                       reward_id or None)
+
+
+class WriteAheadLog:
+    """Append-only record log with optional group commit
+
+    ``append`` queues a record and returns a sequence number; ``wait``
+    blocks until that record is on disk. Without group commit every
+    append is written and fsynced before it returns.
+    """
+
+    def __init__(self, path, group_commit=True):
+        self.group_commit = group_commit
+        self._file = open(path, "ab", buffering=0)
+        self._io_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0
+        self._durable = 0
+        self._closed = False
+        if group_commit:
+            self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+            self._flusher.start()
+
+    def append(self, record):
+        if not self.group_commit:
+            with self._io_lock:
+                start = time.perf_counter()
+                self._file.write(record)
+                os.fsync(self._file.fileno())
+                WAL_FLUSH_SECONDS.observe(time.perf_counter() - start)
+                WAL_FLUSH_RECORDS.observe(1)
+                with self._cond:
+                    self._appended += 1
+                    self._durable = self._appended
+                    return self._appended
+        with self._cond:
+            self._pending.append(record)
+            self._appended += 1
+            self._cond.notify_all()
+            return self._appended
+
+    def wait(self, seq):
+        with self._cond:
+            while self._durable < seq:
+                self._cond.wait()
+
+    def tail(self):
+        with self._cond:
+            return self._appended
+
+    def _write_pending(self):
+        # Caller holds _io_lock, which keeps batches in append order
+        with self._cond:
+            batch, self._pending = self._pending, []
+            upto = self._appended
+        if batch:
+            start = time.perf_counter()
+            self._file.write(b"".join(batch))
+            os.fsync(self._file.fileno())
+            WAL_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            WAL_FLUSH_RECORDS.observe(len(batch))
+        with self._cond:
+            self._durable = upto
+            self._cond.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            with self._io_lock:
+                self._write_pending()
+
+    def rotate(self, path):
+        """Flush everything queued so far and continue in a new file"""
+        with self._io_lock:
+            self._write_pending()
+            self._file.close()
+            self._file = open(path, "ab", buffering=0)
+
+    def close(self):
+        with self._io_lock:
+            self._write_pending()
+            self._file.close()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class LedgerStorage:
+    """Owns the storage directory for one ``Ledger``"""
+
+    def __init__(self, directory, group_commit=True, snapshot_every=SNAPSHOT_EVERY):
+        self.directory = directory
+        self.group_commit = group_commit
+        self.snapshot_every = snapshot_every
+        self.segment = 0
+        self.wal = None
+        self._since_snapshot = 0
+        self._checkpoint_due = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def _name(self, kind, segment):
+        ext = "log" if kind == "wal" else "bin"
+        return f"{kind}-{segment:08d}.{ext}"
+
+    def _path(self, kind, segment):
+        return os.path.join(self.directory, self._name(kind, segment))
+
+    def _segments(self, kind):
+        found = []
+        for name in os.listdir(self.directory):
+            prefix, _, rest = name.partition("-")
+            if prefix == kind and rest[:8].isdigit() and name == self._name(kind, int(rest[:8])):
+                found.append(int(rest[:8]))
+        return sorted(found)
+
+    def recover(self, ledger):
+        """Load the newest snapshot, replay later WAL segments and open the log"""
+        snapshots = self._segments("snapshot")
+        if snapshots:
+            self.segment = snapshots[-1]
+            self._load_snapshot(ledger, self._path("snapshot", self.segment))
+
+        for segment in self._segments("wal"):
+            if segment < self.segment:
+                continue
+            path = self._path("wal", segment)
+            with open(path, "rb") as f:
+                buf = f.read()
+            end = 0
+            for end, record in iter_records(buf):
+                ledger._apply(*record)
+                self._since_snapshot += 1
+            if end < len(buf):
+                # Drop the torn tail left by a crash mid-write
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+            self.segment = segment
+
+        self.wal = WriteAheadLog(self._path("wal", self.segment), self.group_commit)
+        threading.Thread(target=self._checkpoint_loop, args=(ledger,), name="ledger-checkpoint",
+                         daemon=True).start()
+
+    def append(self, record, count=1):
+        """Queue ``count`` encoded records (concatenated) as one write"""
+        seq = self.wal.append(record)
+        self._since_snapshot += count
+        if self._since_snapshot >= self.snapshot_every:
+            self._checkpoint_due.set()
+        return seq
+
+    def wait(self, seq):
+        self.wal.wait(seq)
+
+    def tail(self):
+        """Sequence number of the most recently appended record"""
+        return self.wal.tail()
+
+    def rotate(self):
+        """Start a new WAL segment, returning its number"""
+        self.segment += 1
+        self.wal.rotate(self._path("wal", self.segment))
+        self._since_snapshot = 0
+        return self.segment
+
+    def _checkpoint_loop(self, ledger):
+        while True:
+            self._checkpoint_due.wait()
+            self._checkpoint_due.clear()
+            ledger.checkpoint()
+
+    def write_snapshot(self, segment, labels, wallets):
+        """Write the state captured at the start of ``segment`` and prune older files
+
+        ``wallets`` is a list of ``(public_key, sol, tokens, log, n, keys,
+        taken)`` where only the first ``n`` entries of ``log`` belong to the
+        snapshot and ``taken`` counts the units of each catalog reward the
+        wallet's redemptions took from stock.
+        """
+        path = self._path("snapshot", segment)
+        tmp = path + ".tmp"
+        crc = 0
+        with open(tmp, "wb") as f:
+            def write(chunk):
+                nonlocal crc
+                crc = zlib.crc32(chunk, crc)
+                f.write(chunk)
+
+            f.write(_SNAPSHOT_MAGIC)
+            write(_SNAPSHOT_HEADER.pack(len(labels) - 1, len(wallets)))
+            for label in labels[1:]:
+                write(_pack_str(label))
+            for public_key, sol, tokens, log, n, keys, taken in wallets:
+                write(_pack_str(public_key))
+                write(_WALLET.pack(sol, tokens, n, len(keys), len(taken)))
+                write(log.to_bytes(n))
+                for key, index in keys.items():
+                    write(_pack_str(key) + _KEY_INDEX.pack(index))
+                for reward_id, units in taken.items():
+                    write(_pack_str(reward_id) + _UNITS.pack(units))
+            f.write(struct.pack("<I", crc))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        for old in self._segments("snapshot"):
+            if old < segment:
+                os.remove(self._path("snapshot", old))
+        for old in self._segments("wal"):
+            if old < segment:
+                os.remove(self._path("wal", old))
+
+    def _load_snapshot(self, ledger, path):
+        with open(path, "rb") as f:
+            buf = memoryview(f.read())
+        if bytes(buf[:len(_SNAPSHOT_MAGIC)]) != _SNAPSHOT_MAGIC:
+            raise CorruptSnapshot(f"{path} is not a ledger snapshot")
+        body = buf[len(_SNAPSHOT_MAGIC):-4]
+        if zlib.crc32(body) != struct.unpack("<I", buf[-4:])[0]:
+            raise CorruptSnapshot(f"{path} failed its checksum")
+
+        n_labels, n_wallets = _SNAPSHOT_HEADER.unpack_from(body)
+        offset = _SNAPSHOT_HEADER.size
+        labels = []
+        for _ in range(n_labels):
+            label, offset = _unpack_str(body, offset)
+            labels.append(label)
+        ledger._restore_labels(labels)
+
+        wallets = []
+        for _ in range(n_wallets):
+            public_key, offset = _unpack_str(body, offset)
+            sol, tokens, n, n_keys, n_taken = _WALLET.unpack_from(body, offset)
+            offset += _WALLET.size
+            size = ActivityLog.encoded_size(n)
+            log = ActivityLog.from_bytes(body[offset:offset + size], n)
+            offset += size
+            keys = {}
+            for _ in range(n_keys):
+                key, offset = _unpack_str(body, offset)
+                (keys[key],) = _KEY_INDEX.unpack_from(body, offset)
+                offset += _KEY_INDEX.size
+            taken = {}
+            for _ in range(n_taken):
+                reward_id, offset = _unpack_str(body, offset)
+                (taken[reward_id],) = _UNITS.unpack_from(body, offset)
+                offset += _UNITS.size
+            wallets.append((public_key, sol, tokens, log, keys, taken))
+        ledger._restore_wallets(wallets)
+
+    def close(self):
+        if self.wal is not None:
+            self.wal.close()
@@ -0,0 +1,260 @@
+"""Account-subscription hub pushing balance and activity updates to dashboards.
+
+Dashboards connect to ``ws://<host>:<port>/wallets/<public_key>`` and
+receive JSON messages instead of re-polling the API:
+
+    {"type": "balance", "public_key": ..., "sol": ..., "slot": ...}
+    {"type": "tokens", "public_key": ..., "tokens": ...}
+    {"type": "activity", "public_key": ..., "tokens": ..., "activity": {...}}
+
+A dashboard process following many wallets connects to
+``ws://<host>:<port>/wallets`` instead and carries all of them on that one
+connection. It sends ``{"op": "subscribe", "public_key": ...}`` and
+``{"op": "unsubscribe", "public_key": ...}``. Each subscribe is answered
+with ``{"type": "subscribed", "public_key": ...}`` once the wallet's
+updates are being sent, so a balance read after that answer misses
+nothing.
+
+Balance messages come from the validator. Each watched account is
+subscribed once with ``accountSubscribe``, no matter how many dashboards
+follow it, and accounts are spread by key hash over a small fixed pool of
+upstream connections. Activity messages come from the ledger through
+``publish``. Every message is encoded once and written to all of a
+wallet's dashboards with ``websockets.broadcast``, which never waits on a
+slow reader.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import zlib
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import broadcast, serve
+from websockets.exceptions import ConnectionClosed
+
+from .lazy import lazy_import
+
+# Only needed once a wallet is forwarded to a validator
+pubkey = lazy_import("solders.pubkey")
+solana_rpc = lazy_import(".rpc", __package__)
+
+UPSTREAM_CONNECTIONS = 4
+PATH_PREFIX = "/wallets/"
+MULTIPLEX_PATH = "/wallets"
+# Wallets one multiplexed connection may follow at once
+MAX_SUBSCRIPTIONS = 100_000
+
+logger = logging.getLogger(__name__)
+
+
+def _is_account(public_key):
+    try:
+        pubkey.Pubkey.from_string(public_key)
+    except ValueError:
+        return False
+    return True
+
+
+class Upstream:
+    """One validator connection carrying a share of the account subscriptions"""
+
+    def __init__(self, url, on_notification):
+        self.url = url
+        self.accounts = set()
+        self._on_notification = on_notification
+        self._subscriptions = {}  # subscription id -> account
+        self._by_account = {}  # account -> subscription id
+        self._requests = {}  # request id -> (method, account)
+        self._ids = itertools.count(1)
+        self._ws = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def _run(self):
+        # connect() used as an iterator reconnects with backoff after failures
+        async for ws in connect(self.url, max_queue=1024):
+            self._ws = ws
+            self._subscriptions.clear()
+            self._by_account.clear()
+            self._requests.clear()
+            try:
+                for account in list(self.accounts):
+                    await self._subscribe(account)
+                async for message in ws:
+                    self._dispatch(json.loads(message))
+            except ConnectionClosed:
+                logger.warning("Validator connection to %s closed; reconnecting", self.url)
+            finally:
+                self._ws = None
+
+    async def watch(self, account):
+        self.accounts.add(account)
+        if self._ws is not None:
+            await self._subscribe(account)
+
+    async def unwatch(self, account):
+        self.accounts.discard(account)
+        subscription = self._by_account.pop(account, None)
+        if subscription is not None:
+            del self._subscriptions[subscription]
+            await self._call("accountUnsubscribe", [subscription], account)
+
+    async def _subscribe(self, account):
+        await self._call("accountSubscribe", [account, {"encoding": "base64", "commitment": "confirmed"}], account)
+
+    async def _call(self, method, params, account):
+        if self._ws is None:
+            return
+        request_id = next(self._ids)
+        self._requests[request_id] = (method, account)
+        try:
+            await self._ws.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}))
+        except ConnectionClosed:
+            # The reconnect loop re-subscribes everything in self.accounts
+            pass
+
+    def _dispatch(self, message):
+        if "id" in message:
+            method, account = self._requests.pop(message["id"], (None, None))
+            if method == "accountSubscribe" and "result" in message:
+                subscription = message["result"]
+                if account in self.accounts:
+                    self._subscriptions[subscription] = account
+                    self._by_account[account] = subscription
+                else:
+                    # Every dashboard left while the subscription was in flight
+                    asyncio.create_task(self._call("accountUnsubscribe", [subscription], account))
+            elif "error" in message:
+                logger.warning("%s for %s failed: %s", method, account, message["error"])
+            return
+        if message.get("method") == "accountNotification":
+            params = message["params"]
+            account = self._subscriptions.get(params["subscription"])
+            if account is not None:
+                result = params["result"]
+                self._on_notification(account, result["context"]["slot"], result["value"]["lamports"])
+
+
+class SubscriptionHub:
+    def __init__(self, validator_url=None, upstream_connections=UPSTREAM_CONNECTIONS, on_account_update=None):
+        self._clients = {}  # public_key -> set of dashboard connections
+        self._upstreams = [
+            Upstream(validator_url, self._on_account) for _ in range(upstream_connections)
+        ] if validator_url else []
+        self._on_account_update = on_account_update
+        self._loop = None
+        self._server = None
+
+    async def serve(self, host, port):
+        """Start accepting dashboards and open the validator connections"""
+        self._loop = asyncio.get_running_loop()
+        for upstream in self._upstreams:
+            upstream.start()
+        self._server = await serve(self._handle, host, port, max_queue=1)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for upstream in self._upstreams:
+            await upstream.close()
+
+    def subscriber_count(self):
+        return sum(len(clients) for clients in self._clients.values())
+
+    async def _handle(self, connection):
+        path = connection.request.path
+        if path == MULTIPLEX_PATH:
+            return await self._handle_multiplexed(connection)
+        if not path.startswith(PATH_PREFIX) or len(path) == len(PATH_PREFIX):
+            await connection.close(1008, "Expected /wallets or /wallets/<public_key>")
+            return
+        public_key = path[len(PATH_PREFIX):]
+        await self._add(public_key, connection)
+        try:
+            await connection.wait_closed()
+        finally:
+            await self._remove(public_key, connection)
+
+    async def _handle_multiplexed(self, connection):
+        subscribed = set()
+        try:
+            async for message in connection:
+                try:
+                    request = json.loads(message)
+                    op, public_key = request["op"], request["public_key"]
+                except (ValueError, TypeError, KeyError):
+                    await connection.close(1008, "Expected {\"op\": ..., \"public_key\": ...}")
+                    return
+                if op == "subscribe":
+                    if public_key not in subscribed:
+                        if len(subscribed) >= MAX_SUBSCRIPTIONS:
+                            await connection.close(1008, "Too many subscriptions")
+                            return
+                        subscribed.add(public_key)
+                        await self._add(public_key, connection)
+                    await connection.send(json.dumps({"type": "subscribed", "public_key": public_key}))
+                elif op == "unsubscribe" and public_key in subscribed:
+                    subscribed.discard(public_key)
+                    await self._remove(public_key, connection)
+        except ConnectionClosed:
+            pass
+        finally:
+            for public_key in subscribed:
+                await self._remove(public_key, connection)
+
+    async def _add(self, public_key, connection):
+        clients = self._clients.setdefault(public_key, set())
+        clients.add(connection)
+        if len(clients) == 1:
+            await self._watch(public_key)
+
+    async def _remove(self, public_key, connection):
+        clients = self._clients.get(public_key)
+        if clients is None:
+            return
+        clients.discard(connection)
+        if not clients:
+            del self._clients[public_key]
+            await self._unwatch(public_key)
+
+    def _upstream(self, public_key):
+        return self._upstreams[zlib.crc32(public_key.encode()) % len(self._upstreams)]
+
+    async def _watch(self, public_key):
+        if self._upstreams and _is_account(public_key):
+            await self._upstream(public_key).watch(public_key)
+
+    async def _unwatch(self, public_key):
+        if self._upstreams and _is_account(public_key):
+            await self._upstream(public_key).unwatch(public_key)
+
+    def _on_account(self, public_key, slot, lamports):
+        if self._on_account_update is not None:
+            self._on_account_update(public_key, slot)
+        self._broadcast(public_key, {
+            "type": "balance",
+            "public_key": public_key,
+            "sol": lamports / solana_rpc.LAMPORTS_PER_SOL,
+            "slot": slot,
+        })
+
+    def _broadcast(self, public_key, message):
+        clients = self._clients.get(public_key)
+        if clients:
+            broadcast(clients, json.dumps(message))
+
+    def publish(self, public_key, message):
+        """Push a ledger-side update to a wallet's dashboards (safe from any thread)"""
+        if self._loop is not None and public_key in self._clients:
+            self._loop.call_soon_threadsafe(self._broadcast, public_key, message)
@@ -0,0 +1,68 @@
+"""Activity-feed query latency as a wallet's history grows.
+
+Times the newest page, a deep cursor page, a time-range page and a
+type-filtered page for wallets of increasing size, against the old
+approach of re-parsing and sorting every entry.
+
+    python benchmarks/bench_activity_feed.py --sizes 1000 100000 3000000
+"""
+import argparse
+import os
+import random
+import secrets
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.ledger import Ledger  # noqa: E402
+
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell", "Redemption"]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def build(n):
+    ledger = Ledger(default_tokens=10**12)
+    wallet = ledger._wallet("wallet")
+    tx = secrets.token_bytes(32)
+    start = int(time.time()) - n
+    for i in range(n):
+        ledger._record(wallet, start + i, random.choice(PLATFORMS), None, 100, tx, None)
+    return ledger, start
+
+
+def baseline(n):
+    today = datetime.now()
+    rows = [{"date": (today - timedelta(seconds=i)).strftime("%Y-%m-%d"), "type": "MedFit Tracker"}
+            for i in range(n)]
+    return lambda: sorted(rows, key=lambda x: datetime.strptime(x["date"], "%Y-%m-%d"), reverse=True)[:20]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'entries':>10} {'newest':>10} {'deep page':>10} {'range':>10} {'type':>10} {'strptime sort':>14}  (us)")
+    for n in args.sizes:
+        ledger, start = build(n)
+        newest = timed(lambda: ledger.activities("wallet", 20), args.repeat)
+        page = timed(lambda: ledger.activities("wallet", 20, cursor=n // 2), args.repeat)
+        ranged = timed(lambda: ledger.activities("wallet", 20, since=start + n // 4, until=start + n // 3),
+                       args.repeat)
+        ledger.activities("wallet", 20, types=["NutriPoints"])  # builds the type index once
+        typed = timed(lambda: ledger.activities("wallet", 20, types=["NutriPoints", "Redemption"]), args.repeat)
+        old = timed(baseline(n), 1) if n <= 100_000 else float("nan")
+        print(f"{n:>10,} {newest:>10.1f} {page:>10.1f} {ranged:>10.1f} {typed:>10.1f} {old:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Dashboard render time as activity history grows.
+
+Runs both apps headless with Streamlit's ``AppTest`` against histories of
+each ``--sizes`` entry and reports the median script time of a full
+rerun and of paging to older activities. Both apps read the history from
+a ledger service whose data directory is pre-written with that many
+redemptions for one wallet (the apps talk to the service on its fixed
+ports, 8000/8001); ``app2.py`` is pointed at it as its demo wallet.
+
+    python benchmarks/bench_activity_window.py --sizes 100 10000 1000000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+FRONTEND = os.path.join(ROOT, "frontend")
+sys.path.insert(0, ROOT)
+
+from backend.storage import REDEEM, encode_record  # noqa: E402
+
+# The dashboard only accepts valid public keys
+WALLET = "8SvmVL7R7nhGqiP2CYQVPC21E17bSQ7zoybG62E5FnKm"
+
+
+def timed_runs(at, reruns, action=None):
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        (action(at) if action else at).run()
+        times.append(time.perf_counter() - start)
+        assert not at.exception, at.exception
+    return statistics.median(times)
+
+
+def older(at):
+    return at.button(key=next(b.key for b in at.button if b.key and b.key.endswith("-older")))
+
+
+def write_history(directory, size):
+    now = int(time.time())
+    with open(os.path.join(directory, "wal-00000000.log"), "wb") as f:
+        for i in range(size):
+            f.write(encode_record(REDEEM, WALLET, now - size + i, 0, "Redemption", f"Reward {i % 7}",
+                                  i.to_bytes(32, "little")))
+
+
+def bench_app(name, reruns):
+    at = AppTest.from_file(os.path.join(FRONTEND, name), default_timeout=600)
+    at.session_state.user_public_key = WALLET
+    at.run()
+    return timed_runs(at, reruns), timed_runs(at, 1, older)
+
+
+def bench_size(size, reruns):
+    data = tempfile.mkdtemp(prefix="window-bench-")
+    write_history(data, size)
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT,
+                               env=dict(os.environ, LEDGER_DATA_DIR=data, HOST="127.0.0.1"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(600):
+            try:
+                httpx.get("http://127.0.0.1:8000/docs")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        return bench_app("app.py", reruns) + bench_app("app2.py", reruns)
+    finally:
+        backend.terminate()
+        backend.wait()
+        shutil.rmtree(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 1_000_000])
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, FRONTEND)
+    os.environ["DEMO_WALLET"] = WALLET
+    print(f"{'entries':>10}  {'app.py rerun':>13}  {'app.py older':>13}  {'app2.py rerun':>14}  {'app2.py older':>14}")
+    for size in args.sizes:
+        app_rerun, app_older, app2_rerun, app2_older = bench_size(size, args.reruns)
+        print(f"{size:>10,}  {app_rerun * 1000:>11.1f}ms  {app_older * 1000:>11.1f}ms  "
+              f"{app2_rerun * 1000:>12.1f}ms  {app2_older * 1000:>12.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
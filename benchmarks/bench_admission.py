@@ -0,0 +1,207 @@
+"""Goodput and tail latency of redemptions under overload, with and without admission control.
+
+Starts the ledger service on a fresh data directory twice, first with
+``ADMISSION_CONTROL=0`` and then with it on. Against each it runs:
+
+1. ``--capacity-seconds`` of closed-loop redemptions from ``--connections``
+   clients, to find how many the service completes a second. The first
+   run's figure is used for both.
+2. ``--seconds`` of open-loop redemptions at ``--overload`` times that
+   rate. Requests arrive on a Poisson schedule whether or not earlier
+   ones have finished, as clicks and scripts do. An ``--interactive``
+   share comes from dashboard users (with a dashboard's bearer token) spread
+   over ``--wallets`` wallets. The rest is a batch client cycling through
+   ``--batch-wallets`` wallets.
+
+For each class it reports goodput, meaning redemptions completed within
+``--slo`` seconds, per second. It also counts requests turned away with
+429 or timed out after ``--timeout`` seconds, and gives the p50/p99
+latency of the completed ones.
+
+Requests go out over a minimal keep-alive HTTP/1.1 client. On a small
+machine the client shares the CPU with the service, and httpx would use
+most of it.
+
+The service uses its fixed ports, so nothing else may be listening on
+8000/8001.
+
+    python benchmarks/bench_admission.py --overload 2 --seconds 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+HOST, PORT = "127.0.0.1", 8000
+API_URL = f"http://{HOST}:{PORT}"
+BODY = {"reward": "Bench reward", "points": 1}
+DASHBOARD_TOKEN = "bench-dashboard"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+class Connections:
+    """Keep-alive connections to the service, at most ``limit`` open at once"""
+
+    def __init__(self, limit):
+        self._idle = []
+        self._slots = asyncio.Semaphore(limit)
+
+    async def post(self, path, body, headers=None):
+        """POST ``body`` as JSON and return the response status"""
+        payload = json.dumps(body).encode()
+        head = [f"POST {path} HTTP/1.1", f"Host: {HOST}", "Content-Type: application/json",
+                f"Content-Length: {len(payload)}"]
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        request = ("\r\n".join(head) + "\r\n\r\n").encode() + payload
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await asyncio.open_connection(HOST, PORT)
+            try:
+                writer.write(request)
+                lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+                length = next(int(line.split(":", 1)[1]) for line in lines
+                              if line.lower().startswith("content-length:"))
+                await reader.readexactly(length)
+            except BaseException:
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+            return int(lines[0].split()[1])
+
+
+def start_backend(directory, admission):
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT,
+                               env=dict(os.environ, LEDGER_DATA_DIR=directory, HOST="127.0.0.1",
+                                        ADMISSION_CONTROL="1" if admission else "0",
+                                        INTERACTIVE_TOKENS=DASHBOARD_TOKEN),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(600):
+        try:
+            httpx.get(f"{API_URL}/docs")
+            return backend
+        except httpx.TransportError:
+            time.sleep(0.1)
+    backend.terminate()
+    raise RuntimeError("the ledger service did not start")
+
+
+async def capacity(args):
+    done = 0
+
+    async def client(client_id, deadline):
+        nonlocal done
+        n = 0
+        while time.perf_counter() < deadline:
+            # A fresh wallet per request keeps per-wallet limits out of the measurement
+            status = await connections.post(f"/wallets/capacity-{client_id}-{n}/redemptions", BODY)
+            n += 1
+            if status == 201:
+                done += 1
+
+    connections = Connections(args.connections)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i, start + args.capacity_seconds) for i in range(args.connections)))
+    return done / (time.perf_counter() - start)
+
+
+async def overload(rate, args):
+    rng = random.Random(0)
+    outcomes = {"interactive": [], "batch": []}
+
+    async def redeem(kind, public_key, scheduled):
+        headers = {"Idempotency-Key": uuid.uuid4().hex}
+        if kind == "interactive":
+            headers["Authorization"] = f"Bearer {DASHBOARD_TOKEN}"
+        try:
+            status = await asyncio.wait_for(
+                connections.post(f"/wallets/{public_key}/redemptions", BODY, headers), args.timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except (OSError, asyncio.IncompleteReadError):
+            status = "error"
+        # Latency counts from when the request was due, including any wait for a connection
+        outcomes[kind].append((status, time.perf_counter() - scheduled))
+
+    connections = Connections(args.max_connections)
+    tasks = []
+    start = time.perf_counter()
+    due = start
+    batch = 0
+    while due < start + args.seconds:
+        due += rng.expovariate(rate)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rng.random() < args.interactive:
+            kind, public_key = "interactive", f"user-{rng.randrange(args.wallets)}"
+        else:
+            kind, public_key = "batch", f"batch-{batch % args.batch_wallets}"
+            batch += 1
+        tasks.append(asyncio.ensure_future(redeem(kind, public_key, due)))
+    await asyncio.gather(*tasks)
+    return outcomes
+
+
+def report(label, outcomes, args):
+    print(label)
+    for kind, results in outcomes.items():
+        statuses = Counter(status for status, _ in results)
+        completed = [latency for status, latency in results if status == 201]
+        goodput = sum(latency <= args.slo for latency in completed) / args.seconds
+        print(f"  {kind:12} offered {len(results) / args.seconds:7.0f}/s  goodput {goodput:7.0f}/s  "
+              f"429 {statuses[429] / args.seconds:6.0f}/s  timeouts {statuses['timeout'] + statuses['error']:5}  "
+              f"p50 {percentile(completed, 0.5) * 1e3:7.1f}ms  p99 {percentile(completed, 0.99) * 1e3:7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--overload", type=float, default=2.0)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--capacity-seconds", type=float, default=5)
+    parser.add_argument("--connections", type=int, default=32, help="closed-loop clients for the capacity run")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--interactive", type=float, default=0.2)
+    parser.add_argument("--wallets", type=int, default=5000)
+    parser.add_argument("--batch-wallets", type=int, default=2000)
+    parser.add_argument("--slo", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    rate = None
+    for admission in (False, True):
+        data = tempfile.mkdtemp(prefix="admission-bench-")
+        backend = start_backend(data, admission)
+        try:
+            if rate is None:
+                completed = asyncio.run(capacity(args))
+                rate = completed * args.overload
+                print(f"capacity {completed:,.0f} redemptions/s; offering {rate:,.0f}/s")
+            used = time.process_time()
+            outcomes = asyncio.run(overload(rate, args))
+            print(f"  (load generator CPU {(time.process_time() - used) / args.seconds:.0%})")
+            report(f"admission control {'on' if admission else 'off'}", outcomes, args)
+            for line in httpx.get(f"{API_URL}/metrics").text.splitlines():
+                if line.startswith("admission_rejected_total"):
+                    print(f"    {line}")
+        finally:
+            backend.terminate()
+            backend.wait()
+            shutil.rmtree(data)
+
+
+if __name__ == "__main__":
+    main()
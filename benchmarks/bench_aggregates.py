@@ -0,0 +1,180 @@
+"""Wallet summaries and the leaderboard at scale: running aggregates against scans.
+
+Loads ``--wallets`` wallets into an in-memory ledger, with
+``--activities`` earnings each on average (Zipf-skewed, over the five
+platforms and ``--days`` days) plus a redemption for one wallet in ten.
+It then compares, per read:
+
+- a wallet summary (earned, redeemed, per-platform points, streak) from
+  a scan of the wallet's activity, against the ledger's running totals;
+- the top ``--top`` earners, from a scan of every wallet's totals and from
+  the columnar analytics table, against the leaderboard;
+- a wallet's rank, from a scan against the leaderboard.
+
+It also reports bulk-credit throughput with the aggregates kept, the
+cost of moving one wallet on the leaderboard (with the read that applies
+the move), how long rebuilding every wallet's totals from its log takes
+and how long re-ranking every wallet takes after recovery.
+
+    python benchmarks/bench_aggregates.py --wallets 1000000
+"""
+import argparse
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+import timeit
+from operator import itemgetter
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend import analytics  # noqa: E402
+from backend.aggregates import SECONDS_PER_DAY, Leaderboard, WalletTotals  # noqa: E402
+from backend.ledger import Ledger  # noqa: E402
+
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell"]
+BATCH = 20_000
+
+
+def earnings(args):
+    """``(public_key, platform, points, tx, day)`` credits, in day order"""
+    rng = np.random.default_rng(0)
+    n = args.wallets * args.activities
+    wallets = (rng.zipf(1.3, n) - 1) % args.wallets
+    days = np.sort(rng.integers(0, args.days, n))
+    points = rng.integers(10, 500, n)
+    platforms = rng.integers(0, len(PLATFORMS), n)
+    keys = [f"wallet-{i}" for i in range(args.wallets)]
+    return [(keys[w], PLATFORMS[p], int(pts), os.urandom(32), int(d))
+            for w, p, pts, d in zip(wallets.tolist(), platforms.tolist(), points.tolist(), days.tolist())]
+
+
+def load(ledger, credits, start_day):
+    """Apply ``credits`` day by day, in ``BATCH``-sized bulk credits; seconds taken"""
+    elapsed = 0.0
+    now = time.time
+    try:
+        for day, group in itertools.groupby(credits, key=itemgetter(4)):
+            batch = [c[:4] for c in group]
+            # credit_many stamps the wall clock; pin it to the simulated day
+            time.time = lambda: (start_day + day) * SECONDS_PER_DAY
+            start = time.perf_counter()
+            for i in range(0, len(batch), BATCH):
+                ledger.credit_many(batch[i:i + BATCH])
+            elapsed += time.perf_counter() - start
+    finally:
+        time.time = now
+    return elapsed
+
+
+def scan_summary(ledger, public_key):
+    """What a dashboard computes from a wallet's full history without aggregates"""
+    earned = redeemed = 0
+    platforms = {}
+    days = set()
+    history, _ = ledger.activities(public_key, limit=sys.maxsize)
+    for activity in history:
+        points = activity["points"]
+        if points < 0:
+            redeemed -= points
+            continue
+        earned += points
+        platforms[activity["type"]] = platforms.get(activity["type"], 0) + points
+        days.add(activity["timestamp"] // SECONDS_PER_DAY)
+    streak = longest = 0
+    previous = None
+    for day in sorted(days):
+        streak = streak + 1 if previous is not None and day == previous + 1 else 1
+        longest = max(longest, streak)
+        previous = day
+    return earned, redeemed, platforms, longest
+
+
+def scan_earned(ledger):
+    return [(public_key, sum(p for p in log.points if p > 0)) for public_key, log in ledger.wallet_logs()[1]]
+
+
+def scan_top(ledger, k):
+    return heapq.nlargest(k, scan_earned(ledger), key=itemgetter(1))
+
+
+def scan_rank(ledger, public_key):
+    earned = dict(scan_earned(ledger))
+    return 1 + sum(1 for score in earned.values() if score > earned[public_key])
+
+
+def move(board, wallets):
+    # Moves are queued until the next read, so time the read that applies one
+    public_key = f"wallet-{random.randrange(wallets)}"
+    board.update(public_key, random.randrange(1, 10**6))
+    return board.rank(public_key)
+
+
+def per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+def report(label, seconds):
+    print(f"  {label:<38} {seconds * 1e6:14,.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--activities", type=int, default=3)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--scans", type=int, default=1, help="repetitions of each full scan")
+    args = parser.parse_args()
+
+    credits = earnings(args)
+    start_day = int(time.time()) // SECONDS_PER_DAY - args.days + 1
+    ledger = Ledger()
+    applied = load(ledger, credits, start_day)
+    for i in range(0, args.wallets, 10):
+        ledger.redeem(f"wallet-{i}", "Gym Membership", 100)
+    print(f"{args.wallets:,} wallets, {len(credits):,} earnings over {args.days} days")
+
+    print("writes")
+    print(f"  {'bulk credits, aggregates kept':<38} {len(credits) / applied:14,.0f} earnings/s")
+    logs = [log for _, log in ledger.wallet_logs()[1]]
+    start = time.perf_counter()
+    WalletTotals.from_logs(logs)
+    print(f"  {'rebuild all wallet totals from logs':<38} {time.perf_counter() - start:14.2f} s")
+    board = Leaderboard()
+    scores = [(f"wallet-{i}", random.randrange(1, 10**6)) for i in range(args.wallets)]
+    start = time.perf_counter()
+    board.rebuild(scores)
+    print(f"  {'re-rank every wallet after recovery':<38} {time.perf_counter() - start:14.2f} s")
+    report("move one wallet, then read its rank", per_call(lambda: move(board, args.wallets), 20_000))
+
+    top_wallet = ledger.leaderboard(1)[0][0]
+    assert scan_summary(ledger, top_wallet) == tuple(
+        ledger.summary(top_wallet)[k] for k in ("earned", "redeemed", "platforms", "longest_streak")
+    )
+    # Tied wallets may be listed in either order
+    assert [e[1] for e in scan_top(ledger, args.top)] == [e[1] for e in ledger.leaderboard(args.top)]
+    probe, _ = ledger.leaderboard(100)[-1]
+    assert scan_rank(ledger, probe) == ledger.rank(probe)
+
+    print("reads")
+    report("summary: scan history", per_call(lambda: scan_summary(ledger, top_wallet), args.scans))
+    report("summary: running totals", per_call(lambda: ledger.summary(top_wallet), 20_000))
+    report(f"top {args.top}: scan every wallet", per_call(lambda: scan_top(ledger, args.top), args.scans))
+    table = analytics.ledger_table(ledger)
+    report(f"top {args.top}: analytics table (built)", per_call(
+        lambda: analytics.top_earners(table, args.top), args.scans
+    ))
+    report(f"top {args.top}: leaderboard", per_call(lambda: ledger.leaderboard(args.top), 20_000))
+    report("rank: scan every wallet", per_call(lambda: scan_rank(ledger, top_wallet), args.scans))
+    report("rank: leaderboard", per_call(
+        lambda: ledger.rank(f"wallet-{random.randrange(args.wallets)}"), 20_000
+    ))
+
+
+if __name__ == "__main__":
+    main()
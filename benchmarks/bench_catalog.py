@@ -0,0 +1,155 @@
+"""Rewards catalog lookup, listing and inventory throughput.
+
+Builds a catalog of ``--rewards`` synthetic items across a handful of
+categories and measures, in process:
+
+- points-range lookups through the price index against a linear scan;
+- listings served from the per-version cache against re-serializing;
+- ``--threads`` threads redeeming one reward with ``--stock`` units from
+  separate wallets through ``Ledger.redeem``, checking that exactly
+  ``--stock`` succeed and every failed attempt was refunded.
+
+With ``--url``, it also measures ``GET /rewards`` against a running
+service, both as full downloads and as ``If-None-Match`` revalidations.
+
+    python benchmarks/bench_catalog.py --rewards 10000 --threads 32
+    python benchmarks/bench_catalog.py --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import timeit
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.catalog import Catalog, OutOfStock, Reward  # noqa: E402
+from backend.ledger import DEFAULT_TOKENS, Ledger  # noqa: E402
+
+CATEGORIES = ["checkups", "wellness", "coverage", "fitness", "nutrition", "mental-health"]
+
+
+def rate(fn, number):
+    return number / min(timeit.repeat(fn, number=number, repeat=3))
+
+
+def synthetic_catalog(n):
+    rng = random.Random(0)
+    return Catalog(
+        Reward(f"reward-{i}", f"Reward {i}", rng.choice(CATEGORIES), rng.randrange(100, 50_000, 50),
+               "", "", rng.randrange(0, 1000))
+        for i in range(n)
+    )
+
+
+def bench_lookups(catalog, number):
+    rewards = list(catalog._rewards.values())
+    ranges = [(lo, lo + 2500) for lo in range(0, 50_000, 2500)]
+    it = iter(range(10**12))
+
+    def indexed():
+        lo, hi = ranges[next(it) % len(ranges)]
+        return catalog.find("wellness", lo, hi)
+
+    def scan():
+        lo, hi = ranges[next(it) % len(ranges)]
+        return sorted((r for r in rewards if r.category == "wellness" and lo <= r.points <= hi),
+                      key=lambda r: (r.points, r.id))
+
+    print("points-range lookups in one category (lookups/s)")
+    print(f"  linear scan                 {rate(scan, max(1, number // 100)):12,.0f}")
+    print(f"  price index                 {rate(indexed, number):12,.0f}")
+
+
+def bench_listings(catalog, number):
+    def uncached():
+        catalog._listings.clear()
+        return catalog.listing("wellness")
+
+    print("listings of one category (responses/s)")
+    print(f"  serialized per request      {rate(uncached, max(1, number // 100)):12,.0f}")
+    print(f"  per-version cache           {rate(lambda: catalog.listing('wellness'), number):12,.0f}")
+
+
+def bench_inventory(n_threads, stock, attempts):
+    catalog = Catalog([Reward("limited", "Limited Reward", "wellness", 100, "", "", stock)])
+    ledger = Ledger()
+    redeemed = []
+    barrier = threading.Barrier(n_threads)
+
+    def worker(n):
+        barrier.wait()
+        ok = 0
+        for i in range(attempts):
+            try:
+                ledger.redeem(f"wallet-{n}", "Limited Reward", 100, f"{n}-{i}", catalog.stock("limited"))
+                ok += 1
+            except OutOfStock:
+                pass
+        redeemed.append(ok)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    charged = sum(DEFAULT_TOKENS - ledger.balances(f"wallet-{n}")[1] for n in range(n_threads))
+    assert sum(redeemed) == stock, (sum(redeemed), stock)
+    assert catalog.get("limited").stock == 0
+    assert charged == 100 * stock, charged
+    print(f"inventory: {n_threads} threads x {attempts} attempts on {stock:,} units")
+    print(f"  {n_threads * attempts / elapsed:,.0f} attempts/s; {sum(redeemed):,} redeemed, "
+          f"stock 0, only redemptions charged")
+
+
+async def bench_http(url, requests, connections):
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        etag = (await client.get("/rewards")).headers["ETag"]
+        slots = asyncio.Semaphore(connections)
+
+        async def fetch(headers, expect):
+            async with slots:
+                response = await client.get("/rewards", headers=headers)
+                assert response.status_code == expect, response.status_code
+                return len(response.content)
+
+        print(f"GET /rewards ({requests:,} requests, {connections} connections)")
+        for label, headers, expect in [("full download", {}, 200),
+                                       ("If-None-Match revalidation", {"If-None-Match": etag}, 304)]:
+            start = time.perf_counter()
+            sizes = await asyncio.gather(*(fetch(headers, expect) for _ in range(requests)))
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<27} {requests / elapsed:10,.0f} req/s  {sizes[0]:>8,} B body")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rewards", type=int, default=10_000)
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--stock", type=int, default=10_000)
+    parser.add_argument("--attempts", type=int, default=1000)
+    parser.add_argument("--url")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=64)
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.rewards)
+    bench_lookups(catalog, args.number)
+    bench_listings(catalog, args.number)
+    bench_inventory(args.threads, args.stock, args.attempts)
+    if args.url:
+        asyncio.run(bench_http(args.url, args.requests, args.connections))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Columnar activity store versus lists of activity dicts.
+
+Builds ``--rows`` synthetic activities as an Arrow table, writes them as
+Arrow IPC and Parquet partitions, then times memory-mapped reads and the
+per-platform-per-day and top-earner aggregations. The list-of-dicts
+baseline is measured at ``--dict-rows`` and scaled linearly, since 50M
+dicts do not fit in memory on most machines.
+
+    python benchmarks/bench_columnar.py --rows 50000000 --dict-rows 1000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend import analytics  # noqa: E402
+
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell"]
+DAYS = 365
+
+
+def synthetic_table(rows, wallets, seed=0):
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    timestamps = np.sort(rng.integers(now - DAYS * 86400, now, rows))
+    return pa.table({
+        "wallet": pa.DictionaryArray.from_arrays(
+            rng.integers(0, wallets, rows, dtype=np.int32), pa.array([f"wallet-{i}" for i in range(wallets)])
+        ),
+        "timestamp": timestamps,
+        "type": pa.DictionaryArray.from_arrays(
+            rng.integers(0, len(PLATFORMS), rows, dtype=np.int32), pa.array(PLATFORMS)
+        ),
+        "reward": pa.DictionaryArray.from_arrays(pa.nulls(rows, pa.int32()), pa.array([], pa.string())),
+        "points": rng.integers(50, 1000, rows),
+        "tx": pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(32), rows, [None, pa.py_buffer(rng.bytes(32 * rows))]
+        ),
+    }, schema=analytics.ACTIVITY_SCHEMA)
+
+
+def dict_baseline(table):
+    tracemalloc.start()
+    rows = [
+        {
+            "date": datetime.fromtimestamp(r["timestamp"]).strftime("%Y-%m-%d"),
+            "type": r["type"],
+            "wallet": r["wallet"],
+            "points": r["points"],
+            "tx": r["tx"].hex(),
+        }
+        for r in table.to_pylist()
+    ]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    per_day = defaultdict(int)
+    per_wallet = defaultdict(int)
+    for r in rows:
+        if r["points"] > 0:
+            per_day[(r["type"], r["date"])] += r["points"]
+            per_wallet[r["wallet"]] += r["points"]
+    sorted(per_wallet.items(), key=lambda item: item[1], reverse=True)[:10]
+    return memory, time.perf_counter() - start
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--dict-rows", type=int, default=500_000)
+    parser.add_argument("--wallets", type=int, default=100_000)
+    args = parser.parse_args()
+
+    scale = args.rows / args.dict_rows
+    memory, aggregate = dict_baseline(synthetic_table(args.dict_rows, args.wallets))
+    print(f"list of dicts ({args.dict_rows:,} rows, scaled x{scale:g}):")
+    print(f"  memory {memory * scale / 2**30:8.2f} GiB   aggregations {aggregate * scale:8.2f}s")
+
+    table, build = timed(lambda: synthetic_table(args.rows, args.wallets))
+    print(f"arrow table ({args.rows:,} rows, built in {build:.1f}s):")
+    print(f"  memory {table.nbytes / 2**30:8.2f} GiB")
+    root = tempfile.mkdtemp(prefix="columnar-bench-")
+    try:
+        for fmt in analytics.FORMATS:
+            store = analytics.ActivityStore(os.path.join(root, fmt), fmt)
+            _, write = timed(lambda: store.append(table, rows_per_partition=5_000_000))
+            size = sum(os.path.getsize(p) for p in store.partitions())
+            loaded, read = timed(store.read)
+            _, per_day = timed(lambda: analytics.points_per_platform_per_day(loaded))
+            _, top = timed(lambda: analytics.top_earners(loaded, 10))
+            print(f"  {fmt:<8} {size / 2**30:6.2f} GiB on disk  write {write:6.2f}s  read {read:6.2f}s  "
+                  f"per-platform-per-day {per_day:6.2f}s  top-10 {top:6.2f}s")
+            del loaded
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
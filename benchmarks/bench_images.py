@@ -0,0 +1,185 @@
+"""Bytes and time to render the rewards section's images.
+
+Serves the catalog's image URLs (path and query, so the host's ``?w=``
+resizing applies) from a local stand-in for the image host, with
+synthetic photos and ``--origin-latency`` added per request, and
+compares:
+
+- the old cards, which download those images and crop them in CSS;
+- the ledger service's thumbnails, started with a copy of the catalog
+  pointing at the stand-in and fetched once it has prewarmed them, at
+  the narrowest (1x) and widest (2x) width it published.
+
+Each side downloads the section's images over ``--connections`` parallel
+connections, like a browser, then decodes and fits them to the 200px
+card box; the sum is reported as time to render. After the service has
+prewarmed, the stand-in host is stopped to check that cards still render
+without it.
+
+The service runs on its fixed ports, so nothing else may be listening on
+8000/8001.
+
+    python benchmarks/bench_images.py --origin-latency 80
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse, urlunparse
+
+import httpx
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+CATALOG_PATH = os.path.join(ROOT, "backend", "catalog.json")
+API_URL = "http://127.0.0.1:8000"
+CARD_BOX = (400, 200)
+# Decoding is timed as the best of several passes over the downloaded images
+DECODE_PASSES = 5
+
+
+def synthetic_photo(seed, size=(2400, 1600)):
+    """Smooth noise over a gradient: compresses roughly like a photograph"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+    grain = Image.fromarray(rng.integers(0, 40, (size[1], size[0], 3), dtype=np.uint8))
+    return Image.blend(image, grain.filter(ImageFilter.GaussianBlur(1)), 0.15)
+
+
+def jpeg(image, width=None, quality=80):
+    if width is not None:
+        image = image.resize((width, image.height * width // image.width), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def start_origin(photos, latency):
+    """Stand-in image host: ``photos`` maps a path to its original, and ``?w=`` asks for a resized copy"""
+    resized = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            photo = photos.get(url.path)
+            if photo is None:
+                self.send_error(404)
+                return
+            width = parse_qs(url.query).get("w")
+            if width:
+                key = (url.path, int(width[0]))
+                if key not in resized:
+                    resized[key] = jpeg(photo, int(width[0]), quality=60)
+                body = resized[key]
+            else:
+                body = jpeg(photo)
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def render_section(urls, connections):
+    """Download every image in parallel, then decode and fit each one to the card box"""
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.get(url) for url in urls))
+        downloaded = time.perf_counter() - start
+    for response in responses:
+        response.raise_for_status()
+    decoded = float("inf")
+    for _ in range(DECODE_PASSES):
+        start = time.perf_counter()
+        for response in responses:
+            with Image.open(io.BytesIO(response.content)) as image:
+                ImageOps.fit(image.convert("RGB"), CARD_BOX)
+        decoded = min(decoded, time.perf_counter() - start)
+    return sum(len(r.content) for r in responses), downloaded, decoded
+
+
+def report(label, sizes_and_times):
+    size, downloaded, decoded = sizes_and_times
+    print(f"  {label:<26} {size / 1024:9.1f} KiB  download {downloaded * 1000:7.1f}ms  "
+          f"decode {decoded * 1000:6.1f}ms  render {(downloaded + decoded) * 1000:7.1f}ms")
+
+
+def wait_for_thumbnails(count):
+    for _ in range(600):
+        try:
+            rewards = httpx.get(f"{API_URL}/rewards").json()["rewards"]
+            if sum(1 for r in rewards if r["thumbnails"]) == count:
+                return rewards
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("Thumbnails were not prewarmed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--origin-latency", type=float, default=80, help="milliseconds")
+    parser.add_argument("--connections", type=int, default=6)
+    args = parser.parse_args()
+
+    with open(args.catalog) as f:
+        rewards = json.load(f)
+    sources = [urlparse(reward["image"]) for reward in rewards]
+    photos = {source.path: synthetic_photo(i) for i, source in enumerate(sources)}
+    origin = start_origin(photos, args.origin_latency / 1000)
+    # The catalog's own URLs, with the stand-in in place of the host
+    urls = [urlunparse(source._replace(scheme="http", netloc=f"127.0.0.1:{origin.server_port}"))
+            for source in sources]
+    work = tempfile.mkdtemp(prefix="images-bench-")
+    catalog_path = os.path.join(work, "catalog.json")
+    with open(catalog_path, "w") as f:
+        json.dump([dict(reward, image=url) for reward, url in zip(rewards, urls)], f)
+    env = dict(os.environ, HOST="127.0.0.1", CATALOG_PATH=catalog_path,
+               LEDGER_DATA_DIR=os.path.join(work, "ledger"), IMAGE_CACHE_DIR=os.path.join(work, "images"))
+
+    print(f"rewards section, {len(rewards)} cards, {args.origin_latency:.0f}ms image host latency")
+    report("host images (as listed)", asyncio.run(render_section(urls, args.connections)))
+
+    start = time.perf_counter()
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        rewards = wait_for_thumbnails(len(rewards))
+        print(f"  service startup + prewarm  {time.perf_counter() - start:9.2f}s (once)")
+        origin.shutdown()
+        for ext in rewards[0]["thumbnails"]:
+            for index, label in [(0, "1x"), (-1, "2x")]:
+                sizes = [r["thumbnails"][ext][index] for r in rewards]
+                widths = "/".join(sorted({str(width) for width, _ in sizes}))
+                urls = [f"{API_URL}/images/{name}" for _, name in sizes]
+                report(f"{ext} {label} ({widths}w)", asyncio.run(render_section(urls, args.connections)))
+        headers = httpx.get(urls[0]).headers
+        print(f"  host stopped; thumbnails served with Cache-Control: {headers['cache-control']}")
+    finally:
+        backend.terminate()
+        backend.wait()
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
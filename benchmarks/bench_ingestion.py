@@ -0,0 +1,153 @@
+"""Sustained platform-event ingestion through the ledger service.
+
+Starts ``python -m backend`` on a fresh data directory and runs
+``--generators`` event-generator processes. Together they offer
+``--rate`` earn events per second for ``--seconds`` seconds, in batches
+of ``--batch`` events spread over ``--wallets`` wallets and the five
+connected platforms. A ``--duplicate-rate`` fraction of events repeats an
+earlier event id. Generators back off for the ``Retry-After`` the service
+asks for on 429.
+
+Once the offered load is in, it waits for the applier to drain. It then
+reports the accepted and applied rates, the 429s and the duplicates
+dropped, and checks that the ledger credited exactly the fresh events.
+
+The service runs on its fixed ports, so nothing else may be listening on
+8000/8001.
+
+    python benchmarks/bench_ingestion.py --rate 50000 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+API_URL = "http://127.0.0.1:8000"
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell"]
+POINTS = 10
+
+
+def make_batches(generator, n_batches, batch, wallets, duplicate_rate):
+    """Encoded request bodies and the number of distinct events among them"""
+    rng = random.Random(generator)
+    sent = {platform: [] for platform in PLATFORMS}
+    bodies = []
+    for b in range(n_batches):
+        platform = PLATFORMS[b % len(PLATFORMS)]
+        earlier = sent[platform]
+        events = []
+        for i in range(batch):
+            if earlier and rng.random() < duplicate_rate:
+                event_id = rng.choice(earlier)
+            else:
+                event_id = f"g{generator}-b{b}-e{i}"
+                earlier.append(event_id)
+            events.append({"event_id": event_id, "public_key": f"wallet-{rng.randrange(wallets)}",
+                           "points": POINTS})
+        bodies.append(json.dumps({"platform": platform, "events": events}).encode())
+    return bodies, sum(len(ids) for ids in sent.values())
+
+
+async def offer(bodies, seconds):
+    interval = seconds / len(bodies)
+    throttled = 0
+    async with httpx.AsyncClient(base_url=API_URL, timeout=30,
+                                 headers={"Content-Type": "application/json"}) as client:
+        start = time.perf_counter()
+        for n, body in enumerate(bodies):
+            delay = start + n * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            while True:
+                response = await client.post("/ingest/events", content=body)
+                if response.status_code != 429:
+                    response.raise_for_status()
+                    break
+                throttled += 1
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+        return throttled, time.perf_counter() - start
+
+
+def generator(index, args, results):
+    n_batches = max(1, int(args.rate * args.seconds / args.generators / args.batch))
+    bodies, distinct = make_batches(index, n_batches, args.batch, args.wallets, args.duplicate_rate)
+    results.put(("ready", index))
+    throttled, elapsed = asyncio.run(offer(bodies, args.seconds))
+    results.put(("done", n_batches * args.batch, distinct, throttled, elapsed))
+
+
+def wait_for(url):
+    for _ in range(300):
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=50_000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--generators", type=int, default=2)
+    parser.add_argument("--wallets", type=int, default=100_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    data = tempfile.mkdtemp(prefix="ingest-bench-")
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT,
+                               env=dict(os.environ, LEDGER_DATA_DIR=data, HOST="127.0.0.1"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(f"{API_URL}/docs")
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=generator, args=(i, args, results))
+                   for i in range(args.generators)]
+        for w in workers:
+            w.start()
+        for _ in workers:
+            assert results.get()[0] == "ready"
+        start = time.perf_counter()
+        done = [results.get() for _ in workers]
+        offered_for = time.perf_counter() - start
+        sent = sum(d[1] for d in done)
+        distinct = sum(d[2] for d in done)
+        throttled = sum(d[3] for d in done)
+        while True:
+            stats = httpx.get(f"{API_URL}/ingest/stats").json()
+            if stats["applied"] + stats["duplicates"] >= stats["received"] and not stats["queued_batches"]:
+                break
+            time.sleep(0.05)
+        drained = time.perf_counter() - start
+        for w in workers:
+            w.join()
+
+        print(f"offered {sent:,} events ({args.rate:,}/s target) from {args.generators} generators")
+        print(f"  accepted in        {offered_for:8.2f}s  {sent / offered_for:10,.0f} events/s")
+        print(f"  applied by         {drained:8.2f}s  {stats['applied'] / drained:10,.0f} events/s")
+        print(f"  applier busy       {stats['apply_seconds']:8.2f}s  "
+              f"{stats['applied'] / max(stats['apply_seconds'], 1e-9):10,.0f} events/s while applying")
+        print(f"  429 responses      {throttled:8,}")
+        print(f"  duplicates dropped {stats['duplicates']:8,}")
+        assert stats["applied"] == distinct, (stats["applied"], distinct)
+        print(f"  ledger credited exactly the {distinct:,} distinct events")
+    finally:
+        backend.terminate()
+        backend.wait()
+        shutil.rmtree(data)
+
+
+if __name__ == "__main__":
+    main()
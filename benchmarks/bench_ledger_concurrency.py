@@ -0,0 +1,121 @@
+"""Hammer a single wallet from many threads and processes.
+
+Threads share one ``Ledger`` directly; processes go through a running
+points-ledger service (``python -m backend``). Each worker redeems more
+points than the wallet holds and replays every idempotency key once, so
+the run checks both that the balance never goes negative and that
+retries are not debited twice. Start the service with
+``ADMISSION_CONTROL=0``; otherwise its per-wallet limit turns most
+attempts away before they reach the ledger.
+
+    python benchmarks/bench_ledger_concurrency.py --threads 32
+    python benchmarks/bench_ledger_concurrency.py --processes 8 --url http://localhost:8000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.ledger import InsufficientPoints, Ledger  # noqa: E402
+
+POINTS = 10
+
+
+def hammer_ledger(ledger, public_key, attempts, results):
+    ok = 0
+    for _ in range(attempts):
+        key = uuid.uuid4().hex
+        try:
+            first = ledger.redeem(public_key, "bench", POINTS, key)
+        except InsufficientPoints:
+            continue
+        assert ledger.redeem(public_key, "bench", POINTS, key) == first
+        ok += 1
+    results.append(ok)
+
+
+def run_threads(n_threads, attempts, balance):
+    ledger = Ledger(default_tokens=balance)
+    results = []
+    threads = [
+        threading.Thread(target=hammer_ledger, args=(ledger, "hot-wallet", attempts, results))
+        for _ in range(n_threads)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    succeeded = sum(results)
+    final = ledger.balances("hot-wallet")[1]
+    ops = n_threads * attempts * 2
+    print(f"threads={n_threads} ops={ops} in {elapsed:.2f}s ({ops / elapsed:,.0f} ops/s)")
+    print(f"  succeeded={succeeded} final_balance={final} expected={balance - succeeded * POINTS}")
+    assert final == balance - succeeded * POINTS and final >= 0
+
+
+def hammer_api(url, public_key, attempts, queue):
+    import httpx
+
+    ok = 0
+    with httpx.Client(base_url=url) as client:
+        for _ in range(attempts):
+            headers = {"Idempotency-Key": uuid.uuid4().hex}
+            body = {"reward": "bench", "points": POINTS}
+            first = client.post(f"/wallets/{public_key}/redemptions", json=body, headers=headers)
+            if first.status_code == 409:
+                continue
+            first.raise_for_status()
+            retry = client.post(f"/wallets/{public_key}/redemptions", json=body, headers=headers)
+            assert retry.json()["tx"] == first.json()["tx"]
+            ok += 1
+    queue.put(ok)
+
+
+def run_processes(url, n_processes, attempts):
+    import httpx
+
+    public_key = f"hot-wallet-{uuid.uuid4().hex[:8]}"
+    balance = httpx.get(f"{url}/wallets/{public_key}/balances").json()["tokens"]
+    queue = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=hammer_api, args=(url, public_key, attempts, queue))
+        for _ in range(n_processes)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    succeeded = sum(queue.get() for _ in procs)
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+    final = httpx.get(f"{url}/wallets/{public_key}/balances").json()["tokens"]
+    ops = n_processes * attempts * 2
+    print(f"processes={n_processes} requests~{ops} in {elapsed:.2f}s ({ops / elapsed:,.0f} req/s)")
+    print(f"  succeeded={succeeded} final_balance={final} expected={balance - succeeded * POINTS}")
+    assert final == balance - succeeded * POINTS and final >= 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--processes", type=int, default=0)
+    parser.add_argument("--attempts", type=int, default=2000, help="redemptions per worker")
+    parser.add_argument("--balance", type=int, default=150000)
+    parser.add_argument("--url", default="http://localhost:8000")
+    args = parser.parse_args()
+
+    if args.threads:
+        run_threads(args.threads, args.attempts, args.balance)
+    if args.processes:
+        run_processes(args.url, args.processes, args.attempts // 10)
+
+
+if __name__ == "__main__":
+    main()
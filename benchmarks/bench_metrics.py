@@ -0,0 +1,116 @@
+"""Cost of the service's instrumentation: spans, histograms and the sampling profiler.
+
+Measures in process:
+
+- recording one histogram value, and one top-level and one nested span;
+- bulk credits to an in-memory ledger (the hottest write path) with no
+  profiler, and with ``SamplingProfiler`` at each ``--hz`` rate, while
+  ``--idle-threads`` threads sit waiting as a server's pools do.
+
+With ``--url``, it also times ``--requests`` balance reads against a
+running service and reports the span breakdown the service recorded for
+them from its ``/metrics``.
+
+    python benchmarks/bench_metrics.py --hz 10 100
+    python benchmarks/bench_metrics.py --url http://localhost:8000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import timeit
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.ledger import Ledger  # noqa: E402
+from backend.metrics import Histogram, SamplingProfiler, span  # noqa: E402
+
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell"]
+
+
+def per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def bench_primitives():
+    histogram = Histogram("bench_seconds", "benchmark", ["op"])
+    child = histogram.labels("x")
+
+    def top():
+        with span("bench.top"):
+            pass
+
+    def nested():
+        with span("bench.outer"):
+            with span("bench.inner"):
+                pass
+
+    print("instrumentation primitives")
+    print(f"  histogram observe                  {per_call(lambda: child.observe(0.001), 200_000) * 1e9:8,.0f} ns")
+    print(f"  top-level span                     {per_call(top, 200_000) * 1e9:8,.0f} ns")
+    print(f"  span with one child                {per_call(nested, 100_000) * 1e9:8,.0f} ns")
+
+
+def credit_rate(events, wallets):
+    credits = [(f"wallet-{i % wallets}", PLATFORMS[i % len(PLATFORMS)], 10, os.urandom(32))
+               for i in range(events)]
+    ledger = Ledger()
+    start = time.perf_counter()
+    for i in range(0, len(credits), 10_000):
+        ledger.credit_many(credits[i:i + 10_000])
+    return events / (time.perf_counter() - start)
+
+
+def bench_profiler(args):
+    stop = threading.Event()
+    idle = [threading.Thread(target=stop.wait, daemon=True) for _ in range(args.idle_threads)]
+    for t in idle:
+        t.start()
+    try:
+        base = max(credit_rate(args.events, args.wallets) for _ in range(3))
+        print(f"bulk credits with {args.idle_threads} idle threads (events/s)")
+        print(f"  no profiler                        {base:12,.0f}")
+        for hz in args.hz:
+            profiler = SamplingProfiler(hz).start()
+            rate = max(credit_rate(args.events, args.wallets) for _ in range(3))
+            profiler.stop()
+            print(f"  profiler at {hz:>5g} Hz                {rate:12,.0f}  ({rate / base - 1:+.1%}, "
+                  f"{profiler.samples} samples)")
+    finally:
+        stop.set()
+
+
+def bench_service(url, requests):
+    with httpx.Client(base_url=url) as client:
+        start = time.perf_counter()
+        for i in range(requests):
+            client.get(f"/wallets/metrics-bench-{i % 100}/balances").raise_for_status()
+        elapsed = time.perf_counter() - start
+        metrics = client.get("/metrics").text
+    print(f"{requests} balance reads against {url}: {requests / elapsed:,.0f} req/s")
+    for line in metrics.splitlines():
+        if line.startswith(("span_seconds_sum", "span_seconds_count")) and "balances" in line:
+            print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hz", type=float, nargs="+", default=[10, 100])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--wallets", type=int, default=10_000)
+    parser.add_argument("--idle-threads", type=int, default=40)
+    parser.add_argument("--url")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    bench_primitives()
+    bench_profiler(args)
+    if args.url:
+        bench_service(args.url, args.requests)
+
+
+if __name__ == "__main__":
+    main()
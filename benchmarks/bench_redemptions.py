@@ -0,0 +1,110 @@
+"""Redemptions per second across concurrent sessions, settled by the ledger service.
+
+Starts the ledger service on a fresh data directory, then has
+``--sessions`` sessions each submit ``--per-session`` redemptions to a
+``RedemptionPipeline`` and wait for all of them. Every redemption is
+settled by ``settle_redemption`` through a ``WalletState``, exactly as
+``app.py`` does, so each one is a real POST that the service writes to
+its log. Runs once with a single settle thread, as if each redemption
+were settled in turn, and once with ``--threads``. Reports redemptions
+per second and the p50/p99 from submit to settled.
+
+The service's admission control is off unless ``--admission`` is given;
+with it on, per-wallet limits turn redemptions away with 429 and the
+pipeline retries them when the service says to.
+
+The service uses its fixed ports, so nothing else may be listening on
+8000/8001.
+
+    python benchmarks/bench_redemptions.py --sessions 100 --per-session 20
+"""
+import argparse
+import functools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "frontend"))
+
+from redemptions import CONFIRMED, SETTLE_THREADS, RedemptionPipeline, settle_redemption  # noqa: E402
+from wallet_state import WalletState  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+API_URL = "http://127.0.0.1:8000"
+REWARD = ("Bench reward", 1)
+
+
+def start_backend(directory, admission):
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT,
+                               env=dict(os.environ, LEDGER_DATA_DIR=directory, HOST="127.0.0.1",
+                                        ADMISSION_CONTROL="1" if admission else "0"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(600):
+        try:
+            httpx.get(f"{API_URL}/docs")
+            return backend
+        except httpx.TransportError:
+            time.sleep(0.1)
+    backend.terminate()
+    raise RuntimeError("the ledger service did not start")
+
+
+def run_pipeline(label, sessions, per_session, threads):
+    pipeline = RedemptionPipeline(settle=functools.partial(settle_redemption, WalletState(API_URL)),
+                                  settle_threads=threads)
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def session(n):
+        ids = [pipeline.submit(f"session-{threads}-{n}", *REWARD) for _ in range(per_session)]
+        for redemption_id in ids:
+            r = pipeline.wait(redemption_id)
+            with lock:
+                if r.status == CONFIRMED:
+                    latencies.append(r.settled_at - r.submitted_at)
+                else:
+                    failures.append(r.error)
+
+    workers = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"  {label:20} {len(latencies) / elapsed:10.1f} redemptions/s  "
+          f"p50={latencies[len(latencies) // 2]:.3f}s p99={latencies[int(len(latencies) * 0.99)]:.3f}s"
+          + (f"  {len(failures)} failed ({failures[0]})" if failures else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--per-session", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=SETTLE_THREADS, help="settle threads in the pipeline")
+    parser.add_argument("--admission", action="store_true", help="leave the service's admission control on")
+    args = parser.parse_args()
+
+    data = tempfile.mkdtemp(prefix="redemptions-bench-")
+    backend = start_backend(data, args.admission)
+    try:
+        print(f"sessions={args.sessions} per_session={args.per_session} "
+              f"admission={'on' if args.admission else 'off'}")
+        run_pipeline("1 settle thread", args.sessions, args.per_session, 1)
+        run_pipeline(f"{args.threads} settle threads", args.sessions, args.per_session, args.threads)
+    finally:
+        backend.terminate()
+        backend.wait()
+        shutil.rmtree(data)
+
+
+if __name__ == "__main__":
+    main()
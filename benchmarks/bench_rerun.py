@@ -0,0 +1,131 @@
+"""Script execution time and bytes sent per Streamlit rerun.
+
+Starts the ledger service with ``--rows`` redemptions recorded for one
+wallet and ``streamlit run frontend/app.py`` showing all of them, then
+drives the app over Streamlit's own WebSocket protocol the way a browser
+would: it enters the wallet in the sidebar and requests ``--reruns``
+reruns, timing each from request to ``script_finished`` and counting the
+bytes the server sent for it.
+
+The app talks to the service on its fixed ports, so nothing else may be
+listening on 8000/8001. The service runs without admission control, which
+would turn most of the seeding redemptions away.
+
+    python benchmarks/bench_rerun.py --rows 1000 --reruns 20
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.asyncio.client import connect
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+# The dashboard only accepts valid public keys
+WALLET = "8SvmVL7R7nhGqiP2CYQVPC21E17bSQ7zoybG62E5FnKm"
+
+
+def wait_for(url):
+    for _ in range(100):
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def seed(rows):
+    async with httpx.AsyncClient(base_url="http://127.0.0.1:8000", timeout=30) as client:
+        slots = asyncio.Semaphore(32)
+
+        async def redeem(i):
+            async with slots:
+                response = await client.post(f"/wallets/{WALLET}/redemptions",
+                                             json={"reward": f"Reward {i % 7}", "points": 1})
+                response.raise_for_status()
+
+        await asyncio.gather(*(redeem(i) for i in range(rows)))
+
+
+async def rerun(ws, widget_id=None):
+    """Request a rerun; return (seconds, bytes received, forward messages)"""
+    msg = BackMsg()
+    msg.rerun_script.query_string = ""
+    if widget_id is not None:
+        widget = msg.rerun_script.widget_states.widgets.add()
+        widget.id = widget_id
+        widget.string_value = WALLET
+    start = time.perf_counter()
+    await ws.send(msg.SerializeToString())
+    received = []
+    size = 0
+    while True:
+        payload = await ws.recv()
+        size += len(payload)
+        forward = ForwardMsg()
+        forward.ParseFromString(payload)
+        received.append(forward)
+        if forward.WhichOneof("type") == "script_finished":
+            return time.perf_counter() - start, size, received
+
+
+def text_input_id(messages):
+    for forward in messages:
+        if forward.WhichOneof("type") == "delta" and forward.delta.WhichOneof("type") == "new_element":
+            element = forward.delta.new_element
+            if element.WhichOneof("type") == "text_input":
+                return element.text_input.id
+    raise RuntimeError("The sidebar public key input was not rendered")
+
+
+async def drive(port, reruns):
+    async with connect(f"ws://127.0.0.1:{port}/_stcore/stream", max_size=None) as ws:
+        _, _, messages = await rerun(ws)
+        widget_id = text_input_id(messages)
+        first, first_bytes, _ = await rerun(ws, widget_id)
+        timings = [await rerun(ws, widget_id) for _ in range(reruns)]
+    times = sorted(t for t, _, _ in timings)
+    sizes = sorted(s for _, s, _ in timings)
+    print(f"first render with the wallet: {first * 1000:8.1f}ms  {first_bytes / 1024:8.1f} KiB")
+    print(f"steady reruns ({reruns}):       {times[len(times) // 2] * 1000:8.1f}ms  "
+          f"{sizes[len(sizes) // 2] / 1024:8.1f} KiB  (medians)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8599)
+    args = parser.parse_args()
+
+    data = tempfile.mkdtemp(prefix="rerun-bench-")
+    env = dict(os.environ, LEDGER_DATA_DIR=data, HOST="127.0.0.1", ACTIVITY_PAGE_SIZE=str(args.rows),
+               ADMISSION_CONTROL="0")
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    app = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", "frontend/app.py", "--server.headless", "true",
+        "--server.port", str(args.port), "--browser.gatherUsageStats", "false",
+    ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for("http://127.0.0.1:8000/docs")
+        asyncio.run(seed(args.rows))
+        wait_for(f"http://127.0.0.1:{args.port}/_stcore/health")
+        asyncio.run(drive(args.port, args.reruns))
+    finally:
+        for process in (app, backend):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Balance lookups per second through the batched RPC client.
+
+Starts ``stub_rpc.py`` in a subprocess, then looks up ``--wallets``
+random accounts concurrently: once with one ``getBalance`` request per
+wallet (on a ``--naive-sample`` subset), once through ``SolanaRPC``
+with a cold cache and once more with the cache warm.
+
+    python benchmarks/bench_rpc.py --wallets 10000 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from solders.pubkey import Pubkey
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.rpc import SolanaRPC  # noqa: E402
+
+
+async def unbatched(url, keys, connections):
+    limits = httpx.Limits(max_connections=connections)
+    slots = asyncio.Semaphore(connections)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def lookup(n, key):
+            async with slots:
+                response = await client.post(url, json={
+                    "jsonrpc": "2.0", "id": n, "method": "getBalance", "params": [key],
+                })
+            return response.json()["result"]["value"]
+
+        return await asyncio.gather(*(lookup(n, key) for n, key in enumerate(keys)))
+
+
+async def run(url, wallets, connections, naive_sample):
+    keys = [str(Pubkey.new_unique()) for _ in range(wallets)]
+
+    sample = keys[:naive_sample]
+    start = time.perf_counter()
+    expected = await unbatched(url, sample, connections)
+    naive = time.perf_counter() - start
+
+    rpc = SolanaRPC(url, max_connections=connections, cache_ttl=60)
+    start = time.perf_counter()
+    cold = await rpc.get_balances(keys)
+    batched = time.perf_counter() - start
+    cold_requests = rpc.requests_sent
+    assert [cold[k] for k in sample] == expected
+
+    start = time.perf_counter()
+    await rpc.get_balances(keys)
+    warm = time.perf_counter() - start
+    await rpc.close()
+
+    print(f"{wallets:,} wallets")
+    print(f"  one getBalance per wallet: {len(sample) / naive:10,.0f} lookups/s  ({len(sample):,} requests)")
+    print(f"  batched, cold cache:       {wallets / batched:10,.0f} lookups/s  ({cold_requests:,} requests)")
+    print(f"  batched, warm cache:       {wallets / warm:10,.0f} lookups/s  "
+          f"({rpc.requests_sent - cold_requests:,} requests)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=10_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--naive-sample", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8899)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(__file__), "stub_rpc.py"),
+        "--port", str(args.port), "--latency", str(args.latency),
+    ])
+    url = f"http://127.0.0.1:{args.port}/"
+    try:
+        for _ in range(50):
+            try:
+                httpx.get(f"{url}stats")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        asyncio.run(run(url, args.wallets, args.connections, args.naive_sample))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
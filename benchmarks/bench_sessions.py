@@ -0,0 +1,194 @@
+"""Dashboard sessions at scale: per-session state against the shared WalletState.
+
+Starts the ledger service on a data directory pre-written with
+``--wallets`` wallets and ``--activities`` earnings each, then simulates
+``--sessions`` concurrent dashboard sessions, each viewing a wallet drawn
+from a Zipf distribution (a few wallets are watched by many sessions, as
+with a shared demo wallet or a team account). A session rerun reads what
+a dashboard renders: balances, the wallet summary, the first activity
+page and the leaderboard. Two modes are compared:
+
+- per-session: each session fetches its own copy of everything and keeps
+  it in its session state, as the dashboards used to;
+- shared: each session keeps only its wallet, pending redemptions and
+  page cursors, and reads through one process-wide ``WalletState``.
+
+Reported per mode: memory held per session (traced after one rerun of
+every session, the shared cache included), then reruns per second, p50
+and p99 rerun latency and backend requests per rerun with ``--threads``
+threads rerunning random sessions for ``--seconds`` seconds. The service
+runs on its fixed ports, 8000/8001.
+
+    python benchmarks/bench_sessions.py --sessions 5000 --wallets 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import requests
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "frontend"))
+
+from backend.storage import EARN, encode_record  # noqa: E402
+from wallet_state import WalletState  # noqa: E402
+
+API_URL = "http://127.0.0.1:8000"
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell"]
+PAGE_SIZE = 20
+LEADERBOARD_SIZE = 10
+
+
+def write_history(directory, wallets, activities):
+    now = int(time.time())
+    rng = random.Random(0)
+    with open(os.path.join(directory, "wal-00000000.log"), "wb") as f:
+        for i in range(wallets * activities):
+            f.write(encode_record(EARN, f"wallet-{i % wallets}", now - wallets * activities + i,
+                                  rng.randrange(10, 500), rng.choice(PLATFORMS), None, os.urandom(32)))
+
+
+def session_wallets(sessions, wallets):
+    rng = np.random.default_rng(0)
+    return [f"wallet-{w}" for w in ((rng.zipf(1.2, sessions) - 1) % wallets).tolist()]
+
+
+class PerSession:
+    """Every session fetches and keeps its own copy of the dashboard's data"""
+
+    def __init__(self):
+        self.requests = 0
+        self._http = threading.local()
+        self._lock = threading.Lock()
+
+    def _get(self, path, **params):
+        session = getattr(self._http, "session", None)
+        if session is None:
+            session = self._http.session = requests.Session()
+        response = session.get(f"{API_URL}{path}", params=params, timeout=10)
+        response.raise_for_status()
+        with self._lock:
+            self.requests += 1
+        return response.json()
+
+    def new_session(self, public_key):
+        return {"user_public_key": public_key}
+
+    def rerun(self, session):
+        public_key = session["user_public_key"]
+        session["balances"] = self._get(f"/wallets/{public_key}/balances")
+        session["summary"] = self._get(f"/wallets/{public_key}/summary")
+        page = self._get(f"/wallets/{public_key}/activities", limit=PAGE_SIZE)
+        for item in page["items"]:
+            item["tx"] = bytes.fromhex(item["tx"])
+        session["activities"] = page["items"]
+        session["leaderboard"] = self._get("/leaderboard", k=LEADERBOARD_SIZE)
+
+
+class Shared:
+    """Sessions keep their own choices only and read through one WalletState"""
+
+    def __init__(self):
+        self.state = WalletState(API_URL)
+
+    @property
+    def requests(self):
+        return self.state.stats().misses
+
+    def new_session(self, public_key):
+        return {"user_public_key": public_key, "pending_redemptions": [], "activity-pages": [None]}
+
+    def rerun(self, session):
+        public_key = session["user_public_key"]
+        self.state.balances(public_key)
+        self.state.summary(public_key)
+        self.state.activities(public_key, session["activity-pages"][-1], PAGE_SIZE)
+        self.state.leaderboard(LEADERBOARD_SIZE)
+
+
+def held_per_session(mode, wallets):
+    """Bytes still allocated after creating and rerunning every session, per session"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [mode.new_session(public_key) for public_key in wallets]
+    for session in sessions:
+        mode.rerun(session)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return sessions, held / len(sessions)
+
+
+def load(mode, sessions, threads, seconds):
+    """``(reruns per second, p50, p99, backend requests per rerun)``"""
+    latencies = []
+    requests_before = mode.requests
+    deadline = time.perf_counter() + seconds
+
+    def run(seed):
+        rng = random.Random(seed)
+        times = []
+        while time.perf_counter() < deadline:
+            session = sessions[rng.randrange(len(sessions))]
+            start = time.perf_counter()
+            mode.rerun(session)
+            times.append(time.perf_counter() - start)
+        latencies.extend(times)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(run, range(threads)))
+    latencies.sort()
+    return (len(latencies) / seconds, statistics.median(latencies), latencies[int(len(latencies) * 0.99)],
+            (mode.requests - requests_before) / len(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--wallets", type=int, default=2000)
+    parser.add_argument("--activities", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    data = tempfile.mkdtemp(prefix="sessions-bench-")
+    write_history(data, args.wallets, args.activities)
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT,
+                               env=dict(os.environ, LEDGER_DATA_DIR=data, HOST="127.0.0.1",
+                                        ADMISSION_CONTROL="0"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(600):
+            try:
+                httpx.get(f"{API_URL}/docs")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        wallets = session_wallets(args.sessions, args.wallets)
+        print(f"{args.sessions:,} sessions over {len(set(wallets)):,} distinct wallets, "
+              f"{args.threads} threads for {args.seconds:g}s")
+        print(f"  {'mode':<12} {'held/session':>13} {'reruns/s':>10} {'p50':>9} {'p99':>9} {'requests/rerun':>15}")
+        for name, mode in (("per-session", PerSession()), ("shared", Shared())):
+            sessions, held = held_per_session(mode, wallets)
+            rate, p50, p99, per_rerun = load(mode, sessions, args.threads, args.seconds)
+            print(f"  {name:<12} {held / 1024:>10.1f} KiB {rate:>10,.0f} {p50 * 1000:>7.2f}ms "
+                  f"{p99 * 1000:>7.2f}ms {per_rerun:>15.2f}")
+    finally:
+        backend.terminate()
+        backend.wait()
+        shutil.rmtree(data)
+
+
+if __name__ == "__main__":
+    main()
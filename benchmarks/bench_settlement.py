@@ -0,0 +1,104 @@
+"""Settlement throughput and confirmation latency for a redemption spike.
+
+Starts ``stub_rpc.py`` in a subprocess as a stand-in validator, submits
+``--redemptions`` ledger transaction ids at once (everyone redeeming the
+same reward) and waits for every one to settle. The baseline sends one
+transaction per redemption and waits for it before the next, as
+``redeem_reward`` used to; it runs on a ``--baseline-sample`` subset.
+
+    python benchmarks/bench_settlement.py --redemptions 20000 --tx-failure-rate 0.02 --drop-rate 0.02
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from solders.keypair import Keypair
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.rpc import SolanaRPC  # noqa: E402
+from backend.settlement import CONFIRMED, SettlementSubmitter  # noqa: E402
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def settle(url, count, **options):
+    rpc = SolanaRPC(url)
+    submitter = SettlementSubmitter(rpc, Keypair(), **options)
+    submitter.start()
+    txs = [os.urandom(32) for _ in range(count)]
+    start = time.perf_counter()
+    for tx in txs:
+        submitter.submit(tx)
+    await asyncio.sleep(0)
+    while submitter.pending():
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    await submitter.close()
+    await rpc.close()
+
+    settlements = [submitter.status(tx) for tx in txs]
+    latencies = sorted(s.settled_at - s.submitted_at for s in settlements)
+    confirmed = sum(s.status == CONFIRMED for s in settlements)
+    return elapsed, latencies, confirmed, submitter
+
+
+def report(label, count, elapsed, latencies, confirmed, submitter):
+    print(f"{label}: {count / elapsed:10,.0f} redemptions/s  "
+          f"({confirmed:,}/{count:,} confirmed, {submitter.transactions_sent:,} transactions, "
+          f"{submitter.requeued:,} re-queued)")
+    print(f"  confirmation latency p50 {percentile(latencies, 0.5):6.2f}s  "
+          f"p99 {percentile(latencies, 0.99):6.2f}s  max {latencies[-1]:6.2f}s")
+
+
+async def run(url, args):
+    # Blockhashes in the stand-in expire after --blockhash-validity slots
+    options = {"poll_interval": args.poll_interval, "blockhash_ttl": args.blockhash_validity * 0.4 / 4}
+    result = await settle(url, args.baseline_sample, window=1, max_entries_per_transaction=1, **options)
+    report("one transaction per redemption", args.baseline_sample, *result)
+    result = await settle(url, args.redemptions, window=args.window, **options)
+    report(f"batched, window of {args.window}", args.redemptions, *result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redemptions", type=int, default=20_000)
+    parser.add_argument("--baseline-sample", type=int, default=20)
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--confirm-latency", type=float, default=0.8)
+    parser.add_argument("--tx-failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--blockhash-validity", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8899)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(__file__), "stub_rpc.py"),
+        "--port", str(args.port), "--latency", str(args.latency),
+        "--confirm-latency", str(args.confirm_latency), "--tx-failure-rate", str(args.tx_failure_rate),
+        "--drop-rate", str(args.drop_rate), "--blockhash-validity", str(args.blockhash_validity),
+    ])
+    url = f"http://127.0.0.1:{args.port}/"
+    try:
+        for _ in range(50):
+            try:
+                httpx.get(f"{url}stats")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        asyncio.run(run(url, args))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
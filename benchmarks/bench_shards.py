@@ -0,0 +1,136 @@
+"""Ledger throughput against the number of shard worker processes.
+
+For each count in ``--shards``, starts a sharded ledger on a fresh data
+directory and seeds ``--wallets`` wallets. ``--clients`` client processes
+then attach their own routers, as API workers would, and each runs
+``--threads`` threads for ``--seconds`` seconds. Each thread picks random
+wallets and makes a ``--write-ratio`` share of debits; the rest are
+balance reads. Reported: operations per second, and the same per shard.
+
+Afterwards the last pool is resharded to ``--reshard`` shards while the
+clients keep going. The run checks that no points were lost or doubled
+by the move (the wallets' total fell by exactly the debits made), and
+that the new layout survives a restart.
+
+Scaling needs as many free cores as shards plus clients; on fewer cores,
+the processes only take turns.
+
+    python benchmarks/bench_shards.py --shards 1 2 4 --clients 4 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.shards import ShardedLedger  # noqa: E402
+
+
+def client(directory, authkey, args, seed, start, results):
+    ledger = ShardedLedger(directory, authkey=authkey, spawn=False)
+    counts = []
+    debits = []
+
+    def run(thread):
+        rng = random.Random(seed * 1000 + thread)
+        done = debited = 0
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            public_key = f"wallet-{rng.randrange(args.wallets)}"
+            if rng.random() < args.write_ratio:
+                ledger.debit(public_key, 1)
+                debited += 1
+            else:
+                ledger.balances(public_key)
+            done += 1
+        counts.append(done)
+        debits.append(debited)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(args.threads)]
+    start.wait()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ledger.close()
+    results.put((sum(counts), sum(debits)))
+
+
+def load(directory, authkey, args):
+    """Run the clients against the pool in ``directory``; ``(operations per second, debits)``"""
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=client, args=(directory, authkey, args, i, start, results))
+               for i in range(args.clients)]
+    for c in clients:
+        c.start()
+    time.sleep(1)  # let every router connect before the clock starts
+    start.set()
+    done = [results.get() for _ in clients]
+    for c in clients:
+        c.join()
+    return sum(d[0] for d in done) / args.seconds, sum(d[1] for d in done)
+
+
+def snapshot(ledger, wallets):
+    return {f"wallet-{i}": (ledger.balances(f"wallet-{i}"), ledger.activities(f"wallet-{i}"))
+            for i in range(wallets)}
+
+
+def total_tokens(state):
+    return sum(tokens for (_, tokens), _ in state.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--wallets", type=int, default=10_000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--reshard", type=int, default=None, help="default: twice the last count")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} clients x {args.threads} threads, "
+          f"{args.write_ratio:.0%} debits over {args.wallets:,} wallets")
+    for shards in args.shards:
+        directory = tempfile.mkdtemp(prefix="shards-bench-")
+        ledger = ShardedLedger(directory, shards)
+        try:
+            ledger.credit_many([(f"wallet-{i}", "seed", 0, os.urandom(32)) for i in range(args.wallets)])
+            rate, _ = load(directory, ledger.authkey, args)
+            print(f"  {shards:3} shards  {rate:10,.0f} ops/s  {rate / shards:10,.0f} ops/s per shard")
+            if shards != args.shards[-1]:
+                continue
+            target = args.reshard or shards * 2
+            before = snapshot(ledger, args.wallets)
+            during = []
+            mover = threading.Thread(target=lambda: during.append(load(directory, ledger.authkey, args)))
+            mover.start()
+            time.sleep(1 + args.seconds / 2)
+            start = time.perf_counter()
+            moved = ledger.reshard(target)
+            took = time.perf_counter() - start
+            mover.join()
+            after = snapshot(ledger, args.wallets)
+            debits = during[0][1]
+            assert total_tokens(after) == total_tokens(before) - debits
+            ledger.close()
+            ledger = ShardedLedger(directory)
+            assert snapshot(ledger, args.wallets) == after
+            print(f"  resharded {shards} -> {target} under load: {moved} slots in {took:.2f}s, "
+                  f"{debits:,} concurrent debits all accounted for, layout intact across restart")
+        finally:
+            ledger.close()
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
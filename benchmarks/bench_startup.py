@@ -0,0 +1,156 @@
+"""Cold start of the ledger service and the dashboard: time to first answer and memory.
+
+For the working tree, and with ``--baseline REV`` also for an earlier
+commit checked out in a temporary git worktree, each of ``--runs`` runs:
+
+- starts ``python -m backend`` on a log of ``--rows`` records and times it
+  from spawn to its first answered ``/rewards`` request, reading its
+  resident memory then and again ``--settle`` seconds later, after the
+  background prewarm;
+- starts ``streamlit run frontend/app.py`` against it and, driving it as a
+  browser would (see ``bench_rerun.py``), times it from spawn to the end
+  of the first page render, then the first render with a wallet entered,
+  and reads the dashboard's resident memory after that.
+
+Medians are reported. The apps use their fixed ports, so nothing else
+may be listening on 8000/8001.
+
+    python benchmarks/bench_startup.py --baseline HEAD~1 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from websockets.asyncio.client import connect
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import bench_rerun  # noqa: E402
+from backend.storage import EARN, REDEEM, encode_record  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+API_URL = "http://127.0.0.1:8000"
+PLATFORMS = ["MedFit Tracker", "WellnessRewards", "HealthCheck+", "NutriPoints", "MentalWell"]
+
+
+def seed(directory, rows):
+    """``rows`` records for the wallet ``bench_rerun`` enters, one in five a redemption"""
+    now = int(time.time())
+    with open(os.path.join(directory, "wal-00000000.log"), "wb") as f:
+        for i in range(rows):
+            kind, points = (REDEEM, 100) if i % 5 == 4 else (EARN, 100 + i % 400)
+            f.write(encode_record(kind, bench_rerun.WALLET, now - rows + i, points,
+                                  "Redemption" if kind == REDEEM else PLATFORMS[i % len(PLATFORMS)],
+                                  f"Reward {i % 7}" if kind == REDEEM else None, os.urandom(32)))
+
+
+def rss_mib(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def wait_until_up(url, process):
+    while process.poll() is None:
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def first_renders(port):
+    """Seconds to the first page's ``script_finished``, and the first render with a wallet"""
+    async with connect(f"ws://127.0.0.1:{port}/_stcore/stream", max_size=None) as ws:
+        _, _, messages = await bench_rerun.rerun(ws)
+        page = time.perf_counter()
+        wallet, _, _ = await bench_rerun.rerun(ws, bench_rerun.text_input_id(messages))
+    return page, wallet
+
+
+def run_once(tree, log, args):
+    data = tempfile.mkdtemp(prefix="startup-bench-")
+    shutil.copy(log, os.path.join(data, "wal-00000000.log"))
+    env = dict(os.environ, LEDGER_DATA_DIR=data, HOST="127.0.0.1")
+    processes = []
+    try:
+        start = time.perf_counter()
+        backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=tree, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(backend)
+        wait_until_up(f"{API_URL}/rewards", backend)
+        result = {"backend_s": time.perf_counter() - start, "backend_rss_mib": rss_mib(backend.pid)}
+        time.sleep(args.settle)
+        result["backend_settled_rss_mib"] = rss_mib(backend.pid)
+
+        start = time.perf_counter()
+        app = subprocess.Popen([
+            sys.executable, "-m", "streamlit", "run", "frontend/app.py", "--server.headless", "true",
+            "--server.port", str(args.port), "--browser.gatherUsageStats", "false",
+        ], cwd=tree, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(app)
+        wait_until_up(f"http://127.0.0.1:{args.port}/_stcore/health", app)
+        page, wallet = asyncio.run(first_renders(args.port))
+        result["first_page_s"] = page - start
+        result["first_wallet_render_s"] = wallet
+        result["dashboard_rss_mib"] = rss_mib(app.pid)
+        return result
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(data)
+
+
+def measure(label, tree, log, args):
+    runs = [run_once(tree, log, args) for _ in range(args.runs)]
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    print(f"{label}")
+    print(f"  service: first answer      {result['backend_s'] * 1000:8.0f} ms   "
+          f"{result['backend_rss_mib']:6.1f} MiB, {result['backend_settled_rss_mib']:6.1f} MiB settled")
+    print(f"  dashboard: first page      {result['first_page_s'] * 1000:8.0f} ms   "
+          f"{result['dashboard_rss_mib']:6.1f} MiB")
+    print(f"  dashboard: wallet render   {result['first_wallet_render_s'] * 1000:8.0f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", help="git revision to compare with")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--settle", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8599)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="startup-bench-")
+    try:
+        seed(scratch, args.rows)
+        log = os.path.join(scratch, "wal-00000000.log")
+        if args.baseline:
+            worktree = os.path.join(scratch, "baseline")
+            subprocess.run(["git", "worktree", "add", "--detach", "--quiet", worktree, args.baseline],
+                           cwd=ROOT, check=True)
+            try:
+                measure(f"baseline ({args.baseline})", worktree, log, args)
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=ROOT, check=True)
+        measure("working tree", ROOT, log, args)
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Statement export: rows per second and peak memory per format.
+
+Loads ``--rows`` activities into one wallet of an in-memory ledger, then
+exports its whole history in each format through the same generators the
+``/wallets/{public_key}/statement`` endpoint streams. The chunks are
+counted and dropped, as a client reading the response would. Reported
+per format:
+
+- rows per second and megabytes of output per second;
+- the largest chunk, and how far the process's peak resident memory rose
+  above what the ledger already held. A streaming export should stay
+  about the same however many rows are exported. pyarrow's one-time
+  setup is measured on its own, by a small Parquet export beforehand.
+
+With ``--url`` the statement of ``--wallet`` is also downloaded from a
+running service, to include HTTP and chunked transfer in the figures.
+
+    python benchmarks/bench_statements.py --rows 10000000
+    python benchmarks/bench_statements.py --rows 0 --url http://localhost:8000 --wallet <public_key>
+"""
+import argparse
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.activity import TX_SIZE  # noqa: E402
+from backend.ledger import Ledger  # noqa: E402
+from backend.statements import FORMATS, export  # noqa: E402
+
+WALLET = "statement-bench"
+LABELS = [None, "MedFit Tracker", "WellnessRewards", "HealthCheck+", "Redemption", "Reward 1", "Reward 2"]
+
+
+def seeded_ledger(rows):
+    """A ledger whose one wallet holds ``rows`` activities, one in five a redemption"""
+    rng = np.random.default_rng(0)
+    redeem = np.arange(rows) % 5 == 4
+    timestamps = int(time.time()) - rows + np.arange(rows, dtype=np.int64)
+    points = np.where(redeem, -100, rng.integers(100, 500, rows)).astype(np.int64)
+    types = np.where(redeem, 4, 1 + np.arange(rows) % 3).astype(np.uint32)
+    rewards = np.where(redeem, 5 + np.arange(rows) % 2, 0).astype(np.uint32)
+    txs = rng.bytes(rows * TX_SIZE)
+    buf = b"".join((timestamps.tobytes(), points.tobytes(), types.tobytes(), rewards.tobytes(), txs))
+    del timestamps, points, types, rewards, txs
+    ledger = Ledger()
+    ledger.import_wallets(LABELS, [(WALLET, 0, 0, buf, rows, {}, {})])
+    return ledger
+
+
+def _status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak():
+    """Start the process's peak resident memory (VmHWM) over from its current size"""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def measure(fmt, ledger, rows):
+    reset_peak()
+    base = _status("VmRSS:")
+    start = time.perf_counter()
+    size = largest = 0
+    for chunk in export(ledger, WALLET, fmt):
+        size += len(chunk)
+        largest = max(largest, len(chunk))
+    elapsed = time.perf_counter() - start
+    extra = _status("VmHWM:") - base
+    print(f"  {fmt:8} {rows / elapsed:12,.0f} rows/s  {size / elapsed / 1e6:7.1f} MB/s  "
+          f"{size / 1e6:8.1f} MB  largest chunk {largest / 1e6:6.2f} MB  peak +{extra / 2**20:6.1f} MiB")
+
+
+def download(url, wallet, fmt):
+    start = time.perf_counter()
+    size = lines = 0
+    with httpx.stream("GET", f"{url}/wallets/{wallet}/statement", params={"format": fmt}, timeout=None) as r:
+        r.raise_for_status()
+        for chunk in r.iter_raw():
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+    elapsed = time.perf_counter() - start
+    # Row counts are only read off the text formats; Parquet reports throughput in bytes
+    rows = f"{(lines - (fmt == 'csv')) / elapsed:12,.0f} rows/s" if fmt != "parquet" else f"{'':19}"
+    print(f"  {fmt:8} {rows}  {size / elapsed / 1e6:7.1f} MB/s  {size / 1e6:8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--format", choices=list(FORMATS), action="append",
+                        help="formats to export (default: all)")
+    parser.add_argument("--url", help="also download statements from a running service")
+    parser.add_argument("--wallet", help="wallet to download with --url")
+    args = parser.parse_args()
+    formats = args.format or list(FORMATS)
+
+    if args.rows:
+        start = time.perf_counter()
+        ledger = seeded_ledger(args.rows)
+        print(f"{args.rows:,} activities loaded in {time.perf_counter() - start:.1f}s; "
+              f"resident {_status('VmRSS:') / 2**20:.0f} MiB")
+        if "parquet" in formats:
+            # pyarrow's import and allocator pools are set up once per process, not per export
+            reset_peak()
+            base = _status("VmRSS:")
+            for _ in export(seeded_ledger(1000), WALLET, "parquet"):
+                pass
+            print(f"  (pyarrow set up on first Parquet export: +{(_status('VmHWM:') - base) / 2**20:.1f} MiB)")
+        for fmt in formats:
+            measure(fmt, ledger, args.rows)
+    if args.url:
+        print(f"{args.url}, wallet {args.wallet}")
+        for fmt in formats:
+            download(args.url, args.wallet, fmt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Ledger storage: write throughput and restart time.
+
+Measures durable redemptions per second from concurrent writers with
+and without group commit, then builds a ledger with ``--entries``
+activities, checkpoints it and times a cold restart (snapshot load plus
+WAL replay).
+
+    python benchmarks/bench_storage.py --threads 32 --entries 10000000
+"""
+import argparse
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.ledger import Ledger  # noqa: E402
+from backend.storage import LedgerStorage  # noqa: E402
+
+
+def write_throughput(directory, group_commit, n_threads, per_thread):
+    ledger = Ledger(default_tokens=10**12, storage=LedgerStorage(directory, group_commit=group_commit))
+
+    def writer(n):
+        for i in range(per_thread):
+            ledger.redeem(f"wallet-{n}", "Annual Health Checkup", 5000, f"{n}-{i}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ledger.close()
+    return n_threads * per_thread / elapsed
+
+
+def restart_time(directory, entries, wallets, wal_tail):
+    ledger = Ledger(default_tokens=10**12, storage=LedgerStorage(directory, snapshot_every=10**12))
+    tx = secrets.token_bytes(32)
+    now = int(time.time())
+    start = time.perf_counter()
+    for i in range(entries):
+        wallet = ledger._wallet(f"wallet-{i % wallets}")
+        wallet.tokens -= 100
+        ledger._record(wallet, now - entries + i, "Redemption", "Annual Health Checkup", -100, tx, None)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ledger.checkpoint()
+    snapshot = time.perf_counter() - start
+    for i in range(wal_tail):
+        ledger.redeem(f"wallet-{i % wallets}", "Wellness Subscription", 7500)
+    ledger.close()
+    size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+
+    start = time.perf_counter()
+    restored = Ledger(default_tokens=10**12, storage=LedgerStorage(directory, snapshot_every=10**12))
+    recovery = time.perf_counter() - start
+    assert sum(len(w.activities) for w in restored._wallets.values()) == entries + wal_tail
+    restored.close()
+    return build, snapshot, recovery, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=200, help="redemptions per thread")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--wallets", type=int, default=100_000)
+    parser.add_argument("--wal-tail", type=int, default=10_000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="ledger-bench-")
+    try:
+        for group_commit in (False, True):
+            directory = os.path.join(root, f"writes-{group_commit}")
+            rate = write_throughput(directory, group_commit, args.threads, args.writes)
+            label = "group commit" if group_commit else "fsync per write"
+            print(f"{label:<16} {args.threads} threads: {rate:10,.0f} durable writes/s")
+
+        build, snapshot, recovery, size = restart_time(
+            os.path.join(root, "restart"), args.entries, args.wallets, args.wal_tail
+        )
+        print(f"{args.entries:,} entries over {args.wallets:,} wallets (+{args.wal_tail:,} in WAL): "
+              f"{size / 2**20:,.0f} MiB on disk")
+        print(f"  build {build:.1f}s  snapshot {snapshot:.2f}s  restart {recovery:.2f}s")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
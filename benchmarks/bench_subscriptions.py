@@ -0,0 +1,133 @@
+"""Push latency from a mock validator feed to dashboards through the hub.
+
+Runs ``mock_validator.MockValidator`` and a ``SubscriptionHub`` in this
+process, then opens ``--clients`` dashboard connections spread over
+``--wallets`` accounts from ``--processes`` client processes. Once every
+account is subscribed upstream, the validator sends ``--notifications``
+balance changes at ``--rate`` per second; each client measures the time
+from the validator's send to its own receive.
+
+    python benchmarks/bench_subscriptions.py --clients 10000 --wallets 2000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from solders.pubkey import Pubkey
+from websockets.asyncio.client import connect
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.rpc import LAMPORTS_PER_SOL  # noqa: E402
+from backend.subscriptions import SubscriptionHub  # noqa: E402
+from mock_validator import MockValidator  # noqa: E402
+
+
+async def dashboards(url, keys, ready, done):
+    latencies = []
+
+    async def dashboard(key):
+        try:
+            ws = await connect(f"{url}/wallets/{key}", max_queue=1024, open_timeout=60)
+        except (OSError, asyncio.TimeoutError):
+            ready.put(0)
+            return
+        async with ws:
+            ready.put(1)
+            async for message in ws:
+                received = time.time_ns() // 1000
+                update = json.loads(message)
+                if update["type"] == "balance":
+                    latencies.append(received - round(update["sol"] * LAMPORTS_PER_SOL))
+
+    tasks = []
+    for key in keys:
+        tasks.append(asyncio.create_task(dashboard(key)))
+        if len(tasks) % 100 == 0:
+            # Pace the handshakes so the hub's listen backlog does not overflow
+            await asyncio.sleep(0.01)
+    while not done.is_set():
+        await asyncio.sleep(0.1)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies
+
+
+def client_process(url, keys, ready, done, results):
+    results.put(asyncio.run(dashboards(url, keys, ready, done)))
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+async def run(args):
+    validator = MockValidator()
+    validator_server = await validator.serve("127.0.0.1", args.validator_port)
+    hub = SubscriptionHub(f"ws://127.0.0.1:{args.validator_port}", upstream_connections=args.upstreams)
+    await hub.serve("127.0.0.1", args.port)
+
+    wallets = [str(Pubkey.new_unique()) for _ in range(args.wallets)]
+    keys = [wallets[i % len(wallets)] for i in range(args.clients)]
+    context = multiprocessing.get_context("spawn")
+    ready, done, results = context.Queue(), context.Event(), context.Queue()
+    workers = [
+        context.Process(target=client_process,
+                        args=(f"ws://127.0.0.1:{args.port}", keys[i::args.processes], ready, done, results))
+        for i in range(args.processes)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    loop = asyncio.get_running_loop()
+    connected = 0
+    for _ in range(args.clients):
+        connected += await loop.run_in_executor(None, ready.get)
+    while len(validator.subscriptions) < len(wallets) or hub.subscriber_count() < connected:
+        await asyncio.sleep(0.05)
+    print(f"{connected:,} of {args.clients:,} dashboards on {len(wallets):,} accounts connected in "
+          f"{time.perf_counter() - start:.1f}s over {args.upstreams} validator connections")
+
+    start = time.perf_counter()
+    await validator.feed(args.rate, args.notifications)
+    await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+    done.set()
+    latencies = []
+    for _ in workers:
+        latencies.extend(await loop.run_in_executor(None, results.get))
+    for worker in workers:
+        worker.join()
+    await hub.close()
+    validator_server.close()
+
+    latencies.sort()
+    expected = validator.sent * connected / len(wallets)
+    print(f"{validator.sent:,} notifications -> {len(latencies):,} pushes "
+          f"({len(latencies) / expected:.1%} of expected, {len(latencies) / elapsed:,.0f}/s)")
+    print(f"  push latency p50 {percentile(latencies, 0.5) / 1000:7.2f}ms  "
+          f"p99 {percentile(latencies, 0.99) / 1000:7.2f}ms  max {latencies[-1] / 1000 if latencies else 0:7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--wallets", type=int, default=2_000)
+    parser.add_argument("--notifications", type=int, default=5_000)
+    parser.add_argument("--rate", type=float, default=500, help="validator notifications per second")
+    parser.add_argument("--upstreams", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--validator-port", type=int, default=8900)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Transaction-id generation, encoding and storage cost.
+
+Compares the old ``random.choices`` hex strings with 32-byte ids from
+``frontend/txids.py``: ids generated per second, base58/hex encodes per
+second (cold and through the render-time cache), and the memory held by
+``--ids`` ids as 64-character strings, as ``bytes`` objects and packed
+into one buffer as the ledger's activity log stores them.
+
+    python benchmarks/bench_txids.py --ids 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import string
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "frontend"))
+
+import txids  # noqa: E402
+
+
+def rate(fn, number):
+    return number / min(timeit.repeat(fn, number=number, repeat=3))
+
+
+def held(build):
+    tracemalloc.start()
+    value = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ids", type=int, default=1_000_000)
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+    n = args.number
+
+    print("generation (ids/s)")
+    print(f"  random.choices hex string   {rate(lambda: ''.join(random.choices(string.hexdigits, k=64)).lower(), n):12,.0f}")
+    print(f"  new_tx_id (secrets)         {rate(txids.new_tx_id, n):12,.0f}")
+    print(f"  derive_tx_id (blake2b)      {rate(lambda: txids.derive_tx_id('wallet', 'MedFit Tracker', 20000), n):12,.0f}")
+
+    ids = [txids.new_tx_id() for _ in range(n)]
+    it = itertools.cycle(ids)
+    print("encoding (ids/s)")
+    print(f"  hex, uncached               {rate(lambda: next(it).hex(), n):12,.0f}")
+    print(f"  base58, uncached            {rate(lambda: txids.to_base58.__wrapped__(next(it)), n):12,.0f}")
+    page = ids[:20]
+    print(f"  base58, cached page rerun   {rate(lambda: [txids.to_base58(tx) for tx in page], n // 20) * 20:12,.0f}")
+
+    count = args.ids
+    strings = held(lambda: [os.urandom(32).hex() for _ in range(count)])
+    objects = held(lambda: [os.urandom(32) for _ in range(count)])
+    packed = held(lambda: bytearray(os.urandom(32 * count)))
+    print(f"memory for {count:,} ids")
+    print(f"  64-char strings             {strings / 2**20:9.1f} MiB  ({strings / count:5.1f} B/id)")
+    print(f"  bytes objects               {objects / 2**20:9.1f} MiB  ({objects / count:5.1f} B/id)")
+    print(f"  packed bytearray            {packed / 2**20:9.1f} MiB  ({packed / count:5.1f} B/id)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Synthetic earn and redeem traffic for capacity planning.
+
+Generates ``--events`` activities for ``--wallets`` wallets over the
+``--days`` days up to ``--end`` (Unix seconds, default now), built with NumPy a chunk of about ``--chunk`` events at a
+time, in time order:
+
+- wallets: each event's wallet is drawn from a Zipf distribution with
+  exponent ``--zipf`` over wallet ranks, so a few wallets are very busy
+  and most are seldom seen (0 draws them uniformly). Ranks are shuffled
+  onto wallets, and every wallet has a random valid public key.
+- time: each minute's share of the events follows a daily cycle of
+  relative amplitude ``--diurnal``. Bursts start in a ``--burst-share`` of
+  minutes, last ``--burst-minutes`` on average (geometrically
+  distributed) and multiply the rate by ``--burst-factor``.
+- kind: ``--redeem-share`` of the events redeem one of the catalog's
+  rewards, cheaper ones more often, for its price in points. The rest earn
+  points on one of the five platforms, in log-normally distributed amounts
+  around a per-platform mean.
+
+Everything is drawn from ``--seed``. The same arguments always give the
+same events, whatever is done with them. Output goes to one of:
+
+- ``--arrow DIR``: partitions of an ``analytics.ActivityStore``, one per
+  chunk (``--format parquet`` for Parquet), as ``/analytics`` reads them.
+  Chunks are written as they are made, so any number of events fits.
+- ``--ledger DIR``: a ledger data directory to start the service on
+  (``LEDGER_DATA_DIR=DIR python -m backend``), through the same bulk
+  import that resharding uses. Each wallet starts from the ledger's
+  default balance, moved by its events and floored at zero. The whole
+  dataset is held in memory for this, about 200 bytes per event.
+- neither: events are only generated, to time the generator.
+
+    python benchmarks/generate_traffic.py --wallets 1000000 --events 100000000 --arrow traffic
+    python benchmarks/generate_traffic.py --wallets 100000 --events 5000000 --ledger ledger-data
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pyarrow as pa
+from solders.pubkey import Pubkey
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.activity import TX_SIZE  # noqa: E402
+from backend.analytics import ACTIVITY_SCHEMA, ActivityStore  # noqa: E402
+from backend.catalog import CATALOG_PATH, Catalog  # noqa: E402
+from backend.ledger import DEFAULT_SOL, DEFAULT_TOKENS, Ledger  # noqa: E402
+from backend.storage import LedgerStorage  # noqa: E402
+
+# (platform, share of earn events, mean points per event)
+PLATFORMS = [
+    ("MedFit Tracker", 0.35, 500),
+    ("WellnessRewards", 0.25, 250),
+    ("HealthCheck+", 0.15, 1000),
+    ("NutriPoints", 0.15, 750),
+    ("MentalWell", 0.10, 300),
+]
+REDEMPTION = "Redemption"
+POINTS_SIGMA = 0.5
+# Wallet ranks drawn from an exact Zipf CDF; rarer ones from its continuous approximation
+HEAD_RANKS = 4096
+MINUTE = 60
+SECONDS_PER_DAY = 86400
+
+
+@dataclass
+class Chunk:
+    """Events in time order; ``types``/``rewards`` are codes into ``TrafficGenerator.labels``"""
+    wallets: np.ndarray  # index into TrafficGenerator.public_keys
+    timestamps: np.ndarray
+    types: np.ndarray
+    rewards: np.ndarray
+    points: np.ndarray
+    txs: bytes
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class TrafficGenerator:
+    """A seeded model of the service's traffic; see the module docstring"""
+
+    def __init__(self, wallets, events, days=30, end=None, zipf=0.7, diurnal=0.6, burst_share=0.002,
+                 burst_minutes=10, burst_factor=8.0, redeem_share=0.03, rewards=None, seed=0):
+        self.wallet_count = wallets
+        self.events = events
+        self.zipf = zipf
+        self.redeem_share = redeem_share
+        self.seed = seed
+        rewards = rewards if rewards is not None else Catalog.load(CATALOG_PATH).find()
+        self.reward_points = np.array([reward.points for reward in rewards], np.int64)
+        self.reward_ids = [reward.id for reward in rewards]
+        # Cheaper rewards are redeemed more often
+        self.reward_weights = 1 / self.reward_points / (1 / self.reward_points).sum()
+        self.platform_weights = np.array([share for _, share, _ in PLATFORMS])
+        self.platform_means = np.array([mean for _, _, mean in PLATFORMS], np.float64)
+        # Code 0 is the ledger's None label
+        self.labels = [None, *(name for name, _, _ in PLATFORMS), REDEMPTION, *(reward.name for reward in rewards)]
+        self._redemption_code = 1 + len(PLATFORMS)
+
+        rng = np.random.default_rng(seed)
+        end = int(time.time()) if end is None else end
+        minutes = days * SECONDS_PER_DAY // MINUTE
+        self.start = end - minutes * MINUTE
+        self.per_minute = rng.multinomial(events, self._minute_rates(rng, minutes, diurnal, burst_share,
+                                                                     burst_minutes, burst_factor))
+        # Wallet rank r (0 busiest) is wallet ranks[r]
+        self._ranks = rng.permutation(wallets)
+        if zipf:
+            # Searching a CDF of millions of ranks misses the cache on every draw, so only
+            # the busiest ranks get one; the rest invert the integral of x ** -zipf
+            head = min(wallets, HEAD_RANKS)
+            weights = np.arange(1, head + 1, dtype=np.float64) ** -zipf
+            self._tail = (self._integral(head + 0.5), self._integral(wallets + 0.5))
+            self._head_cdf = np.cumsum(weights) / (weights.sum() + self._tail[1] - self._tail[0])
+        self._keys = rng.bytes(wallets * TX_SIZE)
+
+    def _minute_rates(self, rng, minutes, diurnal, burst_share, burst_minutes, burst_factor):
+        t = self.start + MINUTE * np.arange(minutes)
+        # Quietest at 04:00 UTC, busiest at 16:00
+        rate = 1 + diurnal * np.sin(2 * np.pi * ((t % SECONDS_PER_DAY) / SECONDS_PER_DAY - 0.417))
+        starts = np.flatnonzero(rng.random(minutes) < burst_share)
+        ends = np.minimum(starts + rng.geometric(1 / burst_minutes, len(starts)), minutes)
+        bursting = np.zeros(minutes + 1, np.int64)
+        np.add.at(bursting, starts, 1)
+        np.add.at(bursting, ends, -1)
+        rate *= np.where(np.cumsum(bursting[:-1]) > 0, burst_factor, 1.0)
+        return rate / rate.sum()
+
+    def public_keys(self):
+        """Every wallet's base58 public key, by wallet index"""
+        keys = self._keys
+        return [str(Pubkey(keys[i * TX_SIZE:(i + 1) * TX_SIZE])) for i in range(self.wallet_count)]
+
+    def _integral(self, x):
+        return np.log(x) if self.zipf == 1 else x ** (1 - self.zipf) / (1 - self.zipf)
+
+    def _inverse_integral(self, y):
+        return np.exp(y) if self.zipf == 1 else (y * (1 - self.zipf)) ** (1 / (1 - self.zipf))
+
+    def _wallets(self, rng, n):
+        if not self.zipf:
+            return rng.integers(0, self.wallet_count, n)
+        u = rng.random(n)
+        ranks = np.searchsorted(self._head_cdf, u, side="right")
+        tail = np.flatnonzero(ranks == len(self._head_cdf))
+        if len(tail):
+            head_mass = self._head_cdf[-1]
+            low, high = self._tail
+            x = self._inverse_integral(low + (u[tail] - head_mass) / (1 - head_mass) * (high - low))
+            ranks[tail] = np.rint(x).astype(np.int64) - 1
+        return self._ranks[np.clip(ranks, 0, self.wallet_count - 1)]
+
+    def chunks(self, chunk_events=10_000_000):
+        """Yield the events as ``Chunk``s of whole minutes, about ``chunk_events`` each"""
+        ends = np.cumsum(self.per_minute)
+        # The first minute of each chunk after the first
+        cuts = np.searchsorted(ends, np.arange(chunk_events, self.events, chunk_events), side="right")
+        bounds = [0, *sorted(set(cuts.tolist()) - {0}), len(self.per_minute)]
+        for index, (first, last) in enumerate(zip(bounds, bounds[1:])):
+            counts = self.per_minute[first:last]
+            n = int(counts.sum())
+            if n:
+                yield self._chunk(np.random.default_rng([self.seed, index]), first, counts, n)
+
+    def _chunk(self, rng, first, counts, n):
+        minutes = np.repeat(np.arange(first, first + len(counts), dtype=np.int64), counts)
+        timestamps = np.sort(self.start + MINUTE * minutes + rng.integers(0, MINUTE, n))
+        redeem = rng.random(n) < self.redeem_share
+        platform = rng.choice(len(PLATFORMS), n, p=self.platform_weights)
+        reward = rng.choice(len(self.reward_points), n, p=self.reward_weights)
+        earned = np.maximum(1, np.rint(self.platform_means[platform] * rng.lognormal(0, POINTS_SIGMA, n)))
+        return Chunk(
+            wallets=self._wallets(rng, n),
+            timestamps=timestamps,
+            types=np.where(redeem, self._redemption_code, 1 + platform).astype(np.uint32),
+            rewards=np.where(redeem, self._redemption_code + 1 + reward, 0).astype(np.uint32),
+            points=np.where(redeem, -self.reward_points[reward], earned.astype(np.int64)),
+            txs=rng.bytes(n * TX_SIZE),
+        )
+
+
+def _labels_column(codes, labels):
+    # Code 0 (None) is masked, as in analytics.ledger_table
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codes.astype(np.int32), mask=codes == 0), pa.array(["", *labels[1:]], pa.string()))
+
+
+def chunk_table(chunk, labels, public_keys):
+    """A ``Chunk`` as an ``ACTIVITY_SCHEMA`` table, its wallet dictionary holding only its own wallets"""
+    present, codes = np.unique(chunk.wallets, return_inverse=True)
+    n = len(chunk)
+    return pa.table({
+        "wallet": pa.DictionaryArray.from_arrays(codes.astype(np.int32), public_keys.take(present)),
+        "timestamp": chunk.timestamps,
+        "type": _labels_column(chunk.types, labels),
+        "reward": _labels_column(chunk.rewards, labels),
+        "points": chunk.points,
+        "tx": pa.FixedSizeBinaryArray.from_buffers(pa.binary(TX_SIZE), n, [None, pa.py_buffer(chunk.txs)]),
+    }, schema=ACTIVITY_SCHEMA)
+
+
+def write_arrow(generator, directory, format="arrow", chunk_events=10_000_000):
+    """Append every chunk to the ``ActivityStore`` in ``directory``; returns the events written"""
+    store = ActivityStore(directory, format)
+    public_keys = pa.array(generator.public_keys(), pa.string())
+    written = 0
+    for chunk in generator.chunks(chunk_events):
+        store.append(chunk_table(chunk, generator.labels, public_keys), rows_per_partition=len(chunk))
+        written += len(chunk)
+    return written
+
+
+def load_ledger(generator, ledger, chunk_events=10_000_000):
+    """Import every event into ``ledger``, one wallet at a time; returns the wallets imported"""
+    chunks = list(generator.chunks(chunk_events))
+    wallets = np.concatenate([chunk.wallets for chunk in chunks])
+    # A stable sort keeps each wallet's events in time order
+    order = np.argsort(wallets, kind="stable")
+    timestamps = np.concatenate([chunk.timestamps for chunk in chunks])[order]
+    points = np.concatenate([chunk.points for chunk in chunks])[order]
+    types = np.concatenate([chunk.types for chunk in chunks])[order]
+    rewards = np.concatenate([chunk.rewards for chunk in chunks])[order]
+    txs = np.frombuffer(b"".join(chunk.txs for chunk in chunks), np.uint8).reshape(-1, TX_SIZE)[order]
+    del chunks
+    # Each redemption takes a unit of its catalog reward's stock
+    first_reward = generator.labels.index(REDEMPTION) + 1
+    redeemed = rewards >= first_reward
+    pairs, units = np.unique(wallets[order][redeemed] * len(generator.reward_ids)
+                             + (rewards[redeemed] - first_reward), return_counts=True)
+    taken = {}
+    for pair, n in zip(pairs.tolist(), units.tolist()):
+        wallet, reward = divmod(pair, len(generator.reward_ids))
+        taken.setdefault(wallet, {})[generator.reward_ids[reward]] = n
+    del pairs, units, redeemed
+    counts = np.bincount(wallets, minlength=generator.wallet_count)
+    tokens = np.maximum(0, DEFAULT_TOKENS + np.bincount(wallets, points, generator.wallet_count)).astype(np.int64)
+    del wallets
+    ends = np.cumsum(counts)
+    public_keys = generator.public_keys()
+    exported = []
+    for wallet in np.flatnonzero(counts).tolist():
+        end = int(ends[wallet])
+        start = end - int(counts[wallet])
+        buf = b"".join((timestamps[start:end].tobytes(), points[start:end].tobytes(), types[start:end].tobytes(),
+                        rewards[start:end].tobytes(), txs[start:end].tobytes()))
+        exported.append((public_keys[wallet], DEFAULT_SOL, int(tokens[wallet]), buf, end - start, {},
+                         taken.get(wallet, {})))
+    ledger.import_wallets(generator.labels, exported)
+    return len(exported)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--end", type=int, help="Unix time of the last minute's end (default: now)")
+    parser.add_argument("--zipf", type=float, default=0.7, help="wallet skew exponent; 0 for uniform")
+    parser.add_argument("--diurnal", type=float, default=0.6, help="relative amplitude of the daily cycle")
+    parser.add_argument("--burst-share", type=float, default=0.002, help="chance a burst starts in a minute")
+    parser.add_argument("--burst-minutes", type=float, default=10)
+    parser.add_argument("--burst-factor", type=float, default=8.0)
+    parser.add_argument("--redeem-share", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=10_000_000, help="events generated at a time")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--arrow", metavar="DIR", help="write ActivityStore partitions here")
+    output.add_argument("--ledger", metavar="DIR", help="write a ledger data directory here")
+    parser.add_argument("--format", choices=["arrow", "parquet"], default="arrow", help="partition format for --arrow")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generator = TrafficGenerator(args.wallets, args.events, args.days, args.end, zipf=args.zipf, diurnal=args.diurnal,
+                                 burst_share=args.burst_share, burst_minutes=args.burst_minutes,
+                                 burst_factor=args.burst_factor, redeem_share=args.redeem_share, seed=args.seed)
+    busiest = generator.per_minute.max() / (args.events / len(generator.per_minute))
+    print(f"{args.events:,} events for {args.wallets:,} wallets over {args.days} days; "
+          f"busiest minute {busiest:.1f}x the mean")
+    if args.arrow:
+        write_arrow(generator, args.arrow, args.format, args.chunk)
+        size = sum(os.path.getsize(path) for path in ActivityStore(args.arrow, args.format).partitions())
+        print(f"  wrote {size / 1e9:.2f} GB of {args.format} partitions to {args.arrow}")
+    elif args.ledger:
+        ledger = Ledger(storage=LedgerStorage(args.ledger))
+        try:
+            imported = load_ledger(generator, ledger, args.chunk)
+        finally:
+            ledger.close()
+        print(f"  imported {imported:,} wallets into {args.ledger}")
+    else:
+        for _ in generator.chunks(args.chunk):
+            pass
+    elapsed = time.perf_counter() - start
+    print(f"  {elapsed:.1f}s, {args.events / elapsed:,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
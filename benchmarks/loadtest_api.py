@@ -0,0 +1,81 @@
+"""Load test for the points-ledger API.
+
+Simulates many wallets hitting a running server (``python -m backend``)
+with a mix of balance lookups, activity reads and redemptions, then
+reports throughput and p50/p99 latency per endpoint.
+
+    python benchmarks/loadtest_api.py --wallets 5000 --requests 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def wallet_session(client, public_key, n_requests, latencies, errors):
+    for _ in range(n_requests):
+        roll = random.random()
+        if roll < 0.7:
+            name, request = "balances", client.get(f"/wallets/{public_key}/balances")
+        elif roll < 0.9:
+            name, request = "activities", client.get(f"/wallets/{public_key}/activities")
+        else:
+            name, request = "redemptions", client.post(
+                f"/wallets/{public_key}/redemptions",
+                json={"reward": "Annual Health Checkup", "points": 5000},
+            )
+        start = time.perf_counter()
+        try:
+            response = await request
+            if response.status_code >= 500:
+                errors[name] += 1
+        except httpx.HTTPError:
+            errors[name] += 1
+            continue
+        latencies[name].append(time.perf_counter() - start)
+
+
+async def run(url, wallets, n_requests, connections):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            wallet_session(client, f"wallet-{n}", n_requests, latencies, errors)
+            for n in range(wallets)
+        ))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--wallets", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=10, help="requests per wallet")
+    parser.add_argument("--connections", type=int, default=64)
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(run(args.url, args.wallets, args.requests, args.connections))
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.wallets} wallets, {total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    for name, values in sorted(latencies.items()):
+        print(
+            f"  {name:<12} n={len(values):<7} mean={statistics.mean(values) * 1e3:7.2f}ms "
+            f"p50={percentile(values, 0.50) * 1e3:7.2f}ms p99={percentile(values, 0.99) * 1e3:7.2f}ms "
+            f"errors={errors[name]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
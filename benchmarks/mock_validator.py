@@ -0,0 +1,115 @@
+"""Local stand-in for a Solana validator's WebSocket subscription feed.
+
+Accepts ``accountSubscribe``/``accountUnsubscribe`` and emits
+``accountNotification`` messages for random subscribed accounts at
+``--rate`` per second. The lamport balance in each notification is the
+send time in microseconds, so a receiver can measure push latency from
+the balance alone.
+
+    python benchmarks/mock_validator.py --port 8900 --rate 1000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from websockets.asyncio.server import serve
+
+SLOT_SECONDS = 0.4
+
+
+class MockValidator:
+    def __init__(self):
+        self.subscriptions = {}  # subscription id -> (connection, account)
+        self.sent = 0
+        self._live = None
+        self._ids = itertools.count(1)
+        self._genesis = time.time()
+
+    def slot(self):
+        return int((time.time() - self._genesis) / SLOT_SECONDS)
+
+    async def handle(self, connection):
+        owned = []
+        try:
+            async for message in connection:
+                call = json.loads(message)
+                if call["method"] == "accountSubscribe":
+                    subscription = next(self._ids)
+                    self.subscriptions[subscription] = (connection, call["params"][0])
+                    owned.append(subscription)
+                    self._live = None
+                    result = subscription
+                elif call["method"] == "accountUnsubscribe":
+                    result = self.subscriptions.pop(call["params"][0], None) is not None
+                    self._live = None
+                else:
+                    await connection.send(json.dumps({
+                        "jsonrpc": "2.0", "id": call["id"],
+                        "error": {"code": -32601, "message": "Method not found"},
+                    }))
+                    continue
+                await connection.send(json.dumps({"jsonrpc": "2.0", "id": call["id"], "result": result}))
+        finally:
+            for subscription in owned:
+                self.subscriptions.pop(subscription, None)
+            self._live = None
+
+    async def notify(self, subscription):
+        entry = self.subscriptions.get(subscription)
+        if entry is None:
+            return
+        connection, _ = entry
+        await connection.send(json.dumps({
+            "jsonrpc": "2.0",
+            "method": "accountNotification",
+            "params": {
+                "subscription": subscription,
+                "result": {
+                    "context": {"slot": self.slot()},
+                    "value": {
+                        "lamports": time.time_ns() // 1000,
+                        "owner": "11111111111111111111111111111111",
+                        "data": ["", "base64"], "executable": False, "rentEpoch": 0,
+                    },
+                },
+            },
+        }))
+        self.sent += 1
+
+    async def feed(self, rate, count=None):
+        """Notify random subscriptions at ``rate`` per second, ``count`` times or forever"""
+        interval = 1 / rate
+        next_at = time.perf_counter()
+        for _ in itertools.repeat(None) if count is None else range(count):
+            next_at += interval
+            if self._live is None:
+                self._live = list(self.subscriptions)
+            if self._live:
+                await self.notify(random.choice(self._live))
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def serve(self, host, port):
+        return await serve(self.handle, host, port, max_queue=1024)
+
+
+async def run(port, rate):
+    validator = MockValidator()
+    async with await validator.serve("127.0.0.1", port):
+        await validator.feed(rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--rate", type=float, default=1000, help="notifications per second")
+    args = parser.parse_args()
+    asyncio.run(run(args.port, args.rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Local stand-in for a Solana JSON-RPC node.
+
+Answers ``getMultipleAccounts`` and ``getBalance`` (single or batched
+requests) with deterministic lamport balances, a slot that advances every
+400ms, configurable latency and an optional rate of 503 failures.
+
+Transactions sent with ``sendTransaction`` are checked against the packet
+size limit and confirm after roughly ``--confirm-latency`` seconds, as
+reported by ``getSignatureStatuses``. ``--tx-failure-rate`` of them fail
+at a random instruction and ``--drop-rate`` never land at all.
+
+    python benchmarks/stub_rpc.py --port 8899 --latency 0.02
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import time
+
+import uvicorn
+from solders.hash import Hash
+from solders.transaction import Transaction
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+SLOT_SECONDS = 0.4
+GENESIS = time.time()
+PACKET_DATA_SIZE = 1232
+
+
+def lamports(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=6).digest(), "little")
+
+
+def slot():
+    return int((time.time() - GENESIS) / SLOT_SECONDS)
+
+
+class Chain:
+    """Transactions the stub has accepted and when each of them lands"""
+
+    def __init__(self, confirm_latency=0.8, tx_failure_rate=0.0, drop_rate=0.0, blockhash_validity=150):
+        self.confirm_latency = confirm_latency
+        self.tx_failure_rate = tx_failure_rate
+        self.drop_rate = drop_rate
+        self.blockhash_validity = blockhash_validity
+        self.signatures = {}  # signature -> (lands_at, err), lands_at None if dropped
+
+    def send(self, encoded):
+        raw = base64.b64decode(encoded)
+        if len(raw) > PACKET_DATA_SIZE:
+            raise ValueError(f"transaction too large: {len(raw)} > {PACKET_DATA_SIZE}")
+        transaction = Transaction.from_bytes(raw)
+        signature = str(transaction.signatures[0])
+        if signature not in self.signatures:
+            err = None
+            if random.random() < self.tx_failure_rate:
+                err = {"InstructionError": [random.randrange(len(transaction.message.instructions)), {"Custom": 1}]}
+            lands_at = None
+            if random.random() >= self.drop_rate:
+                lands_at = time.time() + self.confirm_latency * random.uniform(0.5, 1.5)
+            self.signatures[signature] = (lands_at, err)
+        return signature
+
+    def status(self, signature):
+        lands_at, err = self.signatures.get(signature, (None, None))
+        if lands_at is None or lands_at > time.time():
+            return None
+        return {"slot": slot(), "confirmations": None, "err": err, "confirmationStatus": "confirmed"}
+
+    def latest_blockhash(self):
+        current = slot()
+        blockhash = Hash(hashlib.blake2b(current.to_bytes(8, "little"), digest_size=32).digest())
+        return {"blockhash": str(blockhash), "lastValidBlockHeight": current + self.blockhash_validity}
+
+
+def answer(call, chain):
+    method, params = call.get("method"), call.get("params", [])
+    context = {"slot": slot()}
+    if method == "sendTransaction":
+        try:
+            return {"jsonrpc": "2.0", "id": call.get("id"), "result": chain.send(params[0])}
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32602, "message": str(e)}}
+    if method == "getSignatureStatuses":
+        value = [chain.status(signature) for signature in params[0]]
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": {"context": context, "value": value}}
+    if method == "getLatestBlockhash":
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": {"context": context, "value": chain.latest_blockhash()}}
+    if method == "getBlockHeight":
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": slot()}
+    if method == "getMultipleAccounts":
+        value = [{"lamports": lamports(key), "owner": "11111111111111111111111111111111",
+                  "data": ["", "base64"], "executable": False, "rentEpoch": 0} for key in params[0]]
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": {"context": context, "value": value}}
+    if method == "getBalance":
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": {"context": context, "value": lamports(params[0])}}
+    return {"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+
+
+def create_app(latency=0.0, failure_rate=0.0, chain=None):
+    stats = {"requests": 0, "calls": 0}
+    chain = chain or Chain()
+
+    async def rpc(request: Request):
+        stats["requests"] += 1
+        body = await request.json()
+        if latency:
+            await asyncio.sleep(latency)
+        if failure_rate and random.random() < failure_rate:
+            return Response(status_code=503)
+        calls = body if isinstance(body, list) else [body]
+        stats["calls"] += len(calls)
+        results = [answer(call, chain) for call in calls]
+        return JSONResponse(results if isinstance(body, list) else results[0])
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    return Starlette(routes=[Route("/", rpc, methods=["POST"]), Route("/stats", get_stats)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--confirm-latency", type=float, default=0.8, help="seconds until a transaction lands")
+    parser.add_argument("--tx-failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--blockhash-validity", type=int, default=150, help="slots a blockhash stays valid")
+    args = parser.parse_args()
+    chain = Chain(args.confirm_latency, args.tx_failure_rate, args.drop_rate, args.blockhash_validity)
+    uvicorn.run(create_app(args.latency, args.failure_rate, chain), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
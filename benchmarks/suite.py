@@ -0,0 +1,333 @@
+"""Headless benchmark suite for the dashboards, redemptions and the ledger.
+
+Starts the ledger service (on its fixed ports, 8000/8001, which the apps
+use) with a data directory pre-written with ``--wallets`` wallets and a
+``--history``-entry history for one of them, then runs these scenarios
+(the service's admission control is off, so they measure what it can do
+flat out):
+
+- render: both apps under Streamlit's ``AppTest``; script time per full
+  rerun and per click to an older activity page;
+- redemption: from a click on "Redeem" in ``app.py`` to the page showing
+  it confirmed, and ``--users`` simulated users redeeming through the
+  API at once;
+- api: ``loadtest_api``'s mix of balance reads, activity reads and
+  redemptions from ``--users`` simulated users;
+- ledger: an on-disk ``Ledger`` in this process, debited from
+  ``--threads`` threads and bulk-credited;
+- sessions: memory held per dashboard session and shared-state reruns
+  with ``--sessions`` sessions, as in ``bench_sessions``.
+
+Results go to ``--output`` as JSON, keyed by scenario and metric, with
+the commit they were measured at. ``--compare`` takes an earlier results
+file, prints the change in every metric and exits with status 1 if any
+got worse by more than ``--tolerance``. Metrics ending in ``_per_s`` are
+rates (higher is better); all others are costs (lower is better).
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --quick --only render ledger --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import httpx
+from solders.pubkey import Pubkey
+from streamlit.testing.v1 import AppTest
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+FRONTEND = os.path.join(ROOT, "frontend")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, FRONTEND)
+
+import bench_sessions  # noqa: E402
+import loadtest_api  # noqa: E402
+from backend.ledger import Ledger  # noqa: E402
+from backend.storage import EARN, REDEEM, LedgerStorage, encode_record  # noqa: E402
+
+API_URL = "http://127.0.0.1:8000"
+# The dashboard only accepts valid public keys
+WALLET = "5utqAZfBVLvcVaaFqE8tb8jXoKZaFP6z1zkqdZGUjcfj"
+PLATFORMS = bench_sessions.PLATFORMS
+REWARD = ("Annual Health Checkup", 5000)
+SCENARIOS = ["render", "redemption", "api", "ledger", "sessions"]
+QUICK = {"wallets": 500, "history": 1000, "reruns": 5, "clicks": 1, "users": 50, "requests": 5,
+         "threads": 8, "operations": 5_000, "sessions": 500, "seconds": 2}
+
+
+def percentile(values, q):
+    return loadtest_api.percentile(values, q)
+
+
+def ms(values):
+    """Median and p95 of ``values`` seconds, in milliseconds"""
+    return {"p50_ms": statistics.median(values) * 1e3, "p95_ms": percentile(values, 0.95) * 1e3}
+
+
+def seed(directory, args):
+    """Earnings for ``wallet-<n>`` (as ``bench_sessions`` expects) and ``WALLET``'s history"""
+    bench_sessions.write_history(directory, args.wallets, 5)
+    now = int(time.time())
+    with open(os.path.join(directory, "wal-00000001.log"), "wb") as f:
+        for i in range(args.history):
+            kind, points = (REDEEM, 100) if i % 5 == 4 else (EARN, 100 + i % 400)
+            f.write(encode_record(kind, WALLET, now - args.history + i, points,
+                                  "Redemption" if kind == REDEEM else PLATFORMS[i % len(PLATFORMS)],
+                                  f"Reward {i % 7}" if kind == REDEEM else None, os.urandom(32)))
+
+
+def start_backend(directory):
+    backend = subprocess.Popen([sys.executable, "-m", "backend"], cwd=ROOT,
+                               env=dict(os.environ, LEDGER_DATA_DIR=directory, HOST="127.0.0.1",
+                                        ADMISSION_CONTROL="0"),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(600):
+        try:
+            httpx.get(f"{API_URL}/docs")
+            return backend
+        except httpx.TransportError:
+            time.sleep(0.1)
+    backend.terminate()
+    raise RuntimeError("the ledger service did not start")
+
+
+def dashboard(name, public_key=WALLET):
+    at = AppTest.from_file(os.path.join(FRONTEND, name), default_timeout=600)
+    at.session_state.user_public_key = public_key
+    at.run()
+    assert not at.exception, at.exception
+    return at
+
+
+def timed(action):
+    start = time.perf_counter()
+    at = action.run()
+    elapsed = time.perf_counter() - start
+    assert not at.exception, at.exception
+    return elapsed
+
+
+def bench_render(args):
+    results = {}
+    for name in ("app.py", "app2.py"):
+        at = dashboard(name)
+        reruns = [timed(at) for _ in range(args.reruns)]
+        older = []
+        for _ in range(args.clicks):
+            button = next(b for b in at.button if b.key and b.key.endswith("-older"))
+            older.append(timed(button.click()))
+        app = name.removesuffix(".py")
+        results.update({f"{app}.rerun.{k}": v for k, v in ms(reruns).items()})
+        results.update({f"{app}.older_page.{k}": v for k, v in ms(older).items()})
+    return results
+
+
+def bench_redemption(args):
+    # Click to confirmation on the dashboard, through the pipeline and the ledger service
+    at = dashboard("app.py", str(Pubkey(os.urandom(32))))
+    clicks, confirmed = [], []
+    for _ in range(args.clicks):
+        button = next(b for b in at.button if b.label == f"Redeem for {REWARD[1]} points")
+        start = time.perf_counter()
+        clicks.append(timed(button.click()))
+        while not any("Successfully redeemed" in t.value for t in at.toast):
+            time.sleep(0.05)
+            at.run()
+        confirmed.append(time.perf_counter() - start)
+    results = {f"dashboard.click.{k}": v for k, v in ms(clicks).items()}
+    results["dashboard.confirmed.p50_ms"] = statistics.median(confirmed) * 1e3
+
+    async def redeem(client, public_key, latencies):
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = await client.post(
+                f"/wallets/{public_key}/redemptions",
+                json={"reward": REWARD[0], "points": REWARD[1]},
+                headers={"Idempotency-Key": uuid.uuid4().hex},
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        latencies = []
+        limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+        async with httpx.AsyncClient(base_url=API_URL, limits=limits, timeout=30) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(redeem(client, f"suite-user-{n}", latencies) for n in range(args.users)))
+            return latencies, time.perf_counter() - start
+
+    latencies, elapsed = asyncio.run(run())
+    results.update({f"api.{k}": v for k, v in ms(latencies).items()})
+    results["api.redemptions_per_s"] = len(latencies) / elapsed
+    return results
+
+
+def bench_api(args):
+    latencies, errors, elapsed = asyncio.run(loadtest_api.run(API_URL, args.users, args.requests, args.users))
+    assert not any(errors.values()), dict(errors)
+    results = {"requests_per_s": sum(len(v) for v in latencies.values()) / elapsed}
+    for endpoint, values in sorted(latencies.items()):
+        results.update({f"{endpoint}.{k}": v for k, v in ms(values).items()})
+    return results
+
+
+def bench_ledger(args):
+    directory = tempfile.mkdtemp(prefix="suite-ledger-")
+    ledger = Ledger(storage=LedgerStorage(directory))
+    try:
+        per_thread = args.operations // args.threads
+
+        def debit(thread):
+            rng = random.Random(thread)
+            for _ in range(per_thread):
+                ledger.debit(f"wallet-{rng.randrange(args.wallets)}", 1)
+
+        threads = [threading.Thread(target=debit, args=(t,)) for t in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        debits = per_thread * args.threads / (time.perf_counter() - start)
+
+        credits = [(f"wallet-{i % args.wallets}", PLATFORMS[i % len(PLATFORMS)], 10, os.urandom(32))
+                   for i in range(args.operations)]
+        start = time.perf_counter()
+        for i in range(0, len(credits), 1000):
+            ledger.credit_many(credits[i:i + 1000])
+        credited = len(credits) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(args.operations):
+            ledger.balances(f"wallet-{i % args.wallets}")
+        reads = args.operations / (time.perf_counter() - start)
+        return {"debits_per_s": debits, "credits_per_s": credited, "balance_reads_per_s": reads}
+    finally:
+        ledger.close()
+        shutil.rmtree(directory)
+
+
+def bench_session_state(args):
+    wallets = bench_sessions.session_wallets(args.sessions, args.wallets)
+    results = {}
+    for name, mode in (("per_session", bench_sessions.PerSession()), ("shared", bench_sessions.Shared())):
+        sessions, held = bench_sessions.held_per_session(mode, wallets)
+        rate, p50, p99, per_rerun = bench_sessions.load(mode, sessions, args.threads, args.seconds)
+        results.update({
+            f"{name}.held_per_session_kib": held / 1024,
+            f"{name}.reruns_per_s": rate,
+            f"{name}.rerun.p50_ms": p50 * 1e3,
+            f"{name}.rerun.p99_ms": p99 * 1e3,
+            f"{name}.requests_per_rerun": per_rerun,
+        })
+    return results
+
+
+RUNNERS = {
+    "render": bench_render,
+    "redemption": bench_redemption,
+    "api": bench_api,
+    "ledger": bench_ledger,
+    "sessions": bench_session_state,
+}
+
+
+def commit():
+    try:
+        head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+
+def compare(baseline, results, tolerance):
+    """Print every metric's change from ``baseline``; return how many got worse than ``tolerance``"""
+    print(f"against {baseline.get('commit') or 'baseline'} (tolerance {tolerance:.0%})")
+    regressions = 0
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(metric)
+            if not before:
+                continue
+            change = (value - before) / before
+            worse = -change if metric.endswith("_per_s") else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"  {scenario + '.' + metric:<48} {before:14,.2f} -> {value:14,.2f}  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--output", help="write results here as JSON")
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    parser.add_argument("--wallets", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=10_000, help="activities of the rendered wallet")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--clicks", type=int, default=3, help="page and redeem clicks per app")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10, help="requests per simulated user")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=50_000, help="ledger operations of each kind")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    if args.quick:
+        parser.set_defaults(**QUICK)
+        args = parser.parse_args()
+
+    data = tempfile.mkdtemp(prefix="suite-")
+    seed(data, args)
+    os.environ["DEMO_WALLET"] = WALLET
+    backend = start_backend(data)
+    results = {}
+    try:
+        for scenario in args.only:
+            start = time.perf_counter()
+            results[scenario] = RUNNERS[scenario](args)
+            print(f"{scenario:<11} done in {time.perf_counter() - start:6.1f}s", file=sys.stderr)
+    finally:
+        backend.terminate()
+        backend.wait()
+        shutil.rmtree(data)
+
+    report = {
+        "commit": commit(),
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "arguments": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
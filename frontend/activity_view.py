@@ -0,0 +1,25 @@
+"""Windowed activity list, one page of a wallet's history at a time"""
+import streamlit as st
+
+from rendering import activity_blocks, activity_row
+
+
+@st.fragment
+def activity_window(key, fetch_page, page_size):
+    """Render one page of ``fetch_page(cursor, limit)`` rows with Newest/Newer/Older paging"""
+    # Cursors of the pages visited so far; the buttons' callbacks move them, so a click reruns the list alone
+    pages = st.session_state.setdefault(key, [None])
+    rows, next_cursor = fetch_page(pages[-1], page_size)
+    for block in activity_blocks([activity_row(*row) for row in rows]):
+        st.markdown(block, unsafe_allow_html=True)
+
+    newest_col, newer_col, older_col = st.columns(3)
+    with newest_col:
+        if len(pages) > 2:
+            st.button("Newest activities", key=f"{key}-newest", on_click=pages.__delitem__, args=(slice(1, None),))
+    with newer_col:
+        if len(pages) > 1:
+            st.button("Newer activities", key=f"{key}-newer", on_click=pages.pop)
+    with older_col:
+        if next_cursor is not None:
+            st.button("Older activities", key=f"{key}-older", on_click=pages.append, args=(next_cursor,))
@@ -1,53 +1,147 @@
 import streamlit as st
-from datetime import datetime, timedelta
-import random
-import string
+from operator import itemgetter
+import os
 import time
-import requests
+from urllib.parse import quote
+from solders.pubkey import Pubkey
+from activity_view import activity_window
+from balance_feed import BalanceFeed
+from catalog_client import CatalogClient
+from redemptions import RedemptionPipeline, settle_redemption, CONFIRMED, FAILED
+from rendering import (
+    activity_date, leaderboard_row, platform_card, points_breakdown, reward_card, stylesheet
+)
+from timings import Timings
+from txids import derive_tx_id, short, to_hex
+from wallet_state import WalletState
 
 # API Configuration
 API_URL = "http://localhost:8000"
-
-# Global variables for account balances
-
-if 'USER1_ACC_SOL' not in st.session_state:
-    st.session_state.USER1_ACC_SOL = 8500
-if 'USER1_ACC_TOKEN' not in st.session_state:
-    st.session_state.USER1_ACC_TOKEN = 150000
+SUBSCRIPTIONS_URL = "ws://localhost:8001"
+ACTIVITY_PAGE_SIZE = int(os.environ.get("ACTIVITY_PAGE_SIZE", 20))
+LEADERBOARD_SIZE = 10
+# Full-history downloads, streamed by the ledger service straight to the browser
+STATEMENT_FORMATS = [("CSV", "csv"), ("JSON Lines", "jsonl"), ("Parquet", "parquet")]
+# Seconds between re-renders of the points card from the balance feed
+POINTS_REFRESH = 1.0
+# Serve this process's timings at http://localhost:<port>/metrics when set
+METRICS_PORT = os.environ.get("DASHBOARD_METRICS_PORT")
+
+render_started = time.perf_counter()
 
 # Session State Initialization
+# Wallet data lives in the shared WalletState; a session holds only its own choices
 if "user_public_key" not in st.session_state:
     st.session_state.user_public_key = ""
-if "redeemed_rewards" not in st.session_state:
-    st.session_state.redeemed_rewards = []
-if "transaction_history" not in st.session_state:
-    st.session_state.transaction_history = []
+if "pending_redemptions" not in st.session_state:
+    st.session_state.pending_redemptions = []
 
 # Utility Functions
-def generate_tx_hash():
-    """Generate a fake Solana transaction hash"""
-    return ''.join(random.choices(string.hexdigits, k=64)).lower()
-
-def simulate_transaction():
-    """Simulate a blockchain transaction with delay"""
-    with st.spinner('Processing transaction on Solana...'):
-        time.sleep(2)  # Simulate blockchain confirmation time
-    return generate_tx_hash()
+def valid_public_key(public_key):
+    """Whether ``public_key`` is a base58-encoded 32-byte Solana public key"""
+    try:
+        Pubkey.from_string(public_key)
+    except ValueError:
+        return False
+    return True
+
+@st.cache_resource
+def get_timings():
+    """Process-wide render and redemption timings"""
+    timings = Timings("app")
+    if METRICS_PORT:
+        timings.serve(int(METRICS_PORT))
+    return timings
+
+@st.cache_resource
+def get_balance_feed():
+    """Process-wide balance subscriptions shared by every session"""
+    return BalanceFeed(SUBSCRIPTIONS_URL)
+
+@st.cache_resource
+def get_state():
+    """Process-wide wallet state shared by every session"""
+    return WalletState(API_URL, feed=get_balance_feed())
+
+@st.cache_resource
+def get_redemption_pipeline():
+    """Process-wide redemption pipeline shared by every session"""
+    state, timings = get_state(), get_timings()
+
+    def settle(redemption):
+        with timings.span("redemption.settle"):
+            return settle_redemption(state, redemption)
+
+    return RedemptionPipeline(settle=settle)
+
+@st.cache_resource
+def get_catalog():
+    """Process-wide rewards catalog shared by every session"""
+    return CatalogClient(API_URL)
 
 def get_user_balances(public_key):
-    return st.session_state.USER1_ACC_SOL, st.session_state.USER1_ACC_TOKEN
+    """SOL and token balances, pushed by the ledger service once a wallet is followed"""
+    try:
+        return get_state().balances(public_key)
+    except Exception as e:
+        st.error(f"Error fetching balance: {str(e)}")
+        return 0, 0
 
-def update_balance(public_key, points_to_deduct):
-    """Update user balance in session state"""
+def get_activities(public_key, cursor=None, limit=ACTIVITY_PAGE_SIZE):
+    """Fetch one page of a wallet's activity history, returning (activities, next_cursor)"""
     try:
-        st.session_state.USER1_ACC_TOKEN -= points_to_deduct
-        return True
+        activities, next_cursor = get_state().activities(public_key, cursor, limit)
     except Exception as e:
-        st.error(f"Error updating balance: {str(e)}")
-        return False
+        st.error(f"Error fetching activities: {str(e)}")
+        return [], None
+    # The page is shared with other sessions; the demo entries go on a copy
+    return list(activities), next_cursor
+
+def get_wallet_summary(public_key):
+    """Lifetime totals, streak and leaderboard place, kept up to date by the ledger service"""
+    try:
+        return get_state().summary(public_key)
+    except Exception:
+        return None
+
+def get_leaderboard(k=LEADERBOARD_SIZE):
+    """The top earners"""
+    try:
+        return get_state().leaderboard(k)
+    except Exception:
+        return []
+
+def fetch_activity_page(cursor, limit):
+    """One page of recorded ledger activity; the demo platform entries sit on the first page"""
+    public_key = st.session_state.user_public_key
+    with get_timings().span("activities"):
+        activities, next_cursor = get_activities(public_key, cursor, limit) if public_key else ([], None)
+    if cursor is None:
+        now = int(time.time())
+        today = now // 86400
+        activities += [
+            {
+                "timestamp": now - x * 86400,
+                "type": app,
+                "points": points,
+                "tx": derive_tx_id(public_key, app, today - x)
+            }
+            for x, (app, points) in enumerate([
+                ("MedFit Tracker", 500),
+                ("WellnessRewards", 250),
+                ("HealthCheck+", 1000),
+                ("NutriPoints", 750),
+                ("MentalWell", 300)
+            ])
+        ]
+        # Sort activities by timestamp
+        activities.sort(key=itemgetter('timestamp'), reverse=True)
+        activities = activities[:limit]
+    rows = [(activity_date(a['timestamp']), a['type'], a['points'], a['tx']) for a in activities]
+    return rows, next_cursor
 
 def redeem_reward(reward):
-    """Handle reward redemption process"""
+    """Queue a reward redemption; the pipeline settles it in the background"""
     if not st.session_state.user_public_key:
         st.error("Please enter your public key in the sidebar.")
         return
@@ -58,36 +152,69 @@ def redeem_reward(reward):
         st.error(f"Insufficient points. You need {reward['points']} points but have {token_balance}.")
         return
 
-    status_placeholder = st.empty()
-    tx_hash = simulate_transaction()
-
-    if update_balance(st.session_state.user_public_key, reward['points']):
-        redemption = {
-            'reward': reward['name'],
-            'points': reward['points'],
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'tx_hash': tx_hash
-        }
-        st.session_state.redeemed_rewards.append(redemption)
-
-        # Add to transaction history
-        st.session_state.transaction_history.append({
-            'date': datetime.now().strftime("%Y-%m-%d"),
-            'type': 'Redemption',
-            'points': -reward['points'],
-            'tx': tx_hash
-        })
-
-        status_placeholder.success(f"""
-        ✅ Successfully redeemed: {reward['name']}
-        Points deducted: {reward['points']}
-        Transaction Hash: [{tx_hash[:8]}...{tx_hash[-8:]}](https://solscan.io/tx/{tx_hash})
-        """)
-
-        time.sleep(1)
+    if reward['stock'] == 0:
+        st.error(f"{reward['name']} is out of stock.")
+        return
+
+    redemption_id = get_redemption_pipeline().submit(
+        st.session_state.user_public_key, reward['name'], reward['points'], reward['id']
+    )
+    st.session_state.pending_redemptions.append(redemption_id)
+    get_timings().count("rerun.redeem")
+    st.rerun()
+
+def sync_redemptions():
+    """Apply settled redemptions to this session, returning True if any settled"""
+    pipeline = get_redemption_pipeline()
+    still_pending = []
+    settled = False
+
+    for redemption_id in st.session_state.pending_redemptions:
+        redemption = pipeline.status(redemption_id)
+        if redemption is None:
+            continue
+        if redemption.status == CONFIRMED:
+            get_timings().observe("redemption.confirmed", redemption.settled_at - redemption.submitted_at)
+            st.toast(f"✅ Successfully redeemed: {redemption.reward} ({short(to_hex(redemption.tx_hash))})")
+        elif redemption.status == FAILED:
+            st.toast(f"❌ Redemption of {redemption.reward} failed: {redemption.error}")
+        else:
+            still_pending.append(redemption_id)
+            continue
+        pipeline.forget(redemption_id)
+        settled = True
+
+    if settled:
+        get_catalog().invalidate()
+
+    st.session_state.pending_redemptions = still_pending
+    return settled
+
+@st.fragment(run_every=1)
+def pending_redemptions_status():
+    """Poll pending redemptions without blocking the rest of the page (only rendered while there are any)"""
+    if sync_redemptions():
+        get_timings().count("rerun.settled")
         st.rerun()
-    else:
-        status_placeholder.error("Transaction failed. Please try again.")
+    pipeline = get_redemption_pipeline()
+    for redemption_id in st.session_state.pending_redemptions:
+        redemption = pipeline.status(redemption_id)
+        if redemption is not None:
+            st.info(f"⏳ Redemption of {redemption.reward} is queued, pending confirmation...")
+
+def points_card(total_points, breakdown):
+    st.markdown(f"""
+        <div class='points-card'>
+            <h1 style='font-size: 2.8rem; color: #9945FF; margin: 0;'>{total_points}</h1>
+            <p style='font-size: 1rem; color: #fff; margin: 0;'>Total Healthcare Points Accumulated via Solana</p>{breakdown}
+        </div>
+    """, unsafe_allow_html=True)
+
+@st.fragment(run_every=POINTS_REFRESH)
+def live_points_card(public_key, total_points, breakdown):
+    """The points card, re-rendered with the balance feed's pushed tokens without rerunning the page"""
+    pushed = get_balance_feed().get(public_key)
+    points_card(total_points if pushed is None else pushed[1], breakdown)
 
 # Page Configuration
 st.set_page_config(
@@ -97,123 +224,24 @@ st.set_page_config(
 )
 
 # Custom CSS with dark theme improvements
-st.markdown("""
-    <style>
-    .main {
-        padding: 0rem 1rem;
-    }
-    .stButton>button {
-        width: 100%;
-        background-color: #9945FF;
-        color: white;
-        border-radius: 10px;
-        padding: 0.5rem;
-        transition: all 0.3s ease;
-    }
-    .stButton>button:hover {
-        background-color: #8935ee;
-        transform: translateY(-2px);
-    }
-    .points-card {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 15px;
-        text-align: center;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.2);
-        margin: 1rem 0;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    .title-section {
-        text-align: center;
-        padding: 1rem 0;
-        margin-bottom: 0.5rem;
-        color: white;
-    }
-    .section-title {
-        font-size: 1.8rem;
-        color: white;
-        margin: 2rem 0 1rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 2px solid #9945FF;
-        display: inline-block;
-    }
-    .reward-card {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 10px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.2);
-        margin-bottom: 1rem;
-        height: 400px;
-        display: flex;
-        flex-direction: column;
-        transition: transform 0.3s ease;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .reward-card:hover {
-        transform: translateY(-5px);
-        border: 1px solid rgba(153, 69, 255, 0.3);
-    }
-    .reward-image-container {
-        width: 100%;
-        height: 200px;
-        overflow: hidden;
-        border-radius: 8px;
-        margin-bottom: 1rem;
-    }
-    .reward-image {
-        width: 100%;
-        height: 100%;
-        object-fit: cover;
-    }
-    .activity-container {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1rem;
-        border-radius: 10px;
-        margin-bottom: 0.5rem;
-        transition: all 0.3s ease;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .activity-container:hover {
-        transform: translateX(5px);
-        border: 1px solid rgba(153, 69, 255, 0.3);
-    }
-    .platform-card {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1rem;
-        border-radius: 10px;
-        text-align: center;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.2);
-        margin: 0.5rem;
-        transition: all 0.3s ease;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .platform-card:hover {
-        transform: translateY(-2px);
-        border: 1px solid rgba(153, 69, 255, 0.3);
-    }
-    .footer {
-        text-align: center;
-        padding: 2rem 0;
-        color: rgba(255, 255, 255, 0.5);
-        font-size: 0.8rem;
-        margin-top: 2rem;
-    }
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(stylesheet(), unsafe_allow_html=True)
 
 # Sidebar
 st.sidebar.title("Account")
-st.session_state.user_public_key = st.sidebar.text_input(
+public_key = st.sidebar.text_input(
     "Your Public Key",
     value=st.session_state.user_public_key
 )
+if public_key and not valid_public_key(public_key):
+    # Nothing is read or redeemed for a mistyped key
+    st.sidebar.error("That is not a Solana public key (base58, 32 bytes).")
+    public_key = ""
+st.session_state.user_public_key = public_key
+
+# Start the page's reads in the background while the sections above them render
+get_catalog().prefetch()
+if st.session_state.user_public_key:
+    get_state().prefetch(st.session_state.user_public_key, ACTIVITY_PAGE_SIZE, leaderboard=LEADERBOARD_SIZE)
 
 # Main Page Title
 st.markdown("""
@@ -223,100 +251,75 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
+# Redemption Status
+sync_redemptions()
+if st.session_state.pending_redemptions:
+    # Sessions with nothing pending do not poll
+    pending_redemptions_status()
+
 # Points Summary
+summary = None
 if st.session_state.user_public_key:
-    sol_balance, token_balance = get_user_balances(st.session_state.user_public_key)
+    with get_timings().span("balances"):
+        sol_balance, token_balance = get_user_balances(st.session_state.user_public_key)
     total_points = token_balance
+    with get_timings().span("summary"):
+        summary = get_wallet_summary(st.session_state.user_public_key)
 else:
     total_points = 0
 
-st.markdown(f"""
-    <div class='points-card'>
-        <h1 style='font-size: 2.8rem; color: #9945FF; margin: 0;'>{total_points}</h1>
-        <p style='font-size: 1rem; color: #fff; margin: 0;'>Total Healthcare Points Accumulated via Solana</p>
-    </div>
-""", unsafe_allow_html=True)
+breakdown = points_breakdown(
+    summary['earned'], summary['redeemed'], summary['streak'], summary['rank']
+) if summary else ""
+if st.session_state.user_public_key:
+    live_points_card(st.session_state.user_public_key, total_points, breakdown)
+else:
+    points_card(total_points, breakdown)
 
 # Recent Activity Section
 st.markdown("<h2 class='section-title'>Recent Healthcare Activities</h2>", unsafe_allow_html=True)
 
-# Combine redeemed rewards with regular activities
-all_activities = st.session_state.transaction_history + [
-    {
-        "date": (datetime.now() - timedelta(days=x)).strftime("%Y-%m-%d"),
-        "type": app,
-        "points": points,
-        "tx": generate_tx_hash()
-    }
-    for x, (app, points) in enumerate([
-        ("MedFit Tracker", 500),
-        ("WellnessRewards", 250),
-        ("HealthCheck+", 1000),
-        ("NutriPoints", 750),
-        ("MentalWell", 300)
-    ])
-]
-
-# Sort activities by date
-all_activities.sort(key=lambda x: datetime.strptime(x['date'], "%Y-%m-%d"), reverse=True)
-
-for activity in all_activities:
-    with st.container():
-        st.markdown(f"""
-            <div class='activity-container'>
-                <div style='display: grid; grid-template-columns: 2fr 2fr 2fr 3fr; gap: 1rem; align-items: center;'>
-                    <div>{activity['date']}</div>
-                    <div>{activity['type']}</div>
-                    <div style='color: {"#FF4B4B" if activity.get("points", 0) < 0 else "#9945FF"}; font-weight: bold;'>
-                        {'+' if activity['points'] > 0 else ''}{activity['points']} pts
-                    </div>
-                    <div><a href='https://solscan.io/tx/{activity['tx']}' target='_blank' style='color: #9945FF;'>
-                        View on Solana
-                    </a></div>
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
+activity_window(
+    f"activity-pages-{st.session_state.user_public_key}", fetch_activity_page, ACTIVITY_PAGE_SIZE
+)
+if st.session_state.user_public_key:
+    statement_cols = st.columns(len(STATEMENT_FORMATS))
+    for col, (label, fmt) in zip(statement_cols, STATEMENT_FORMATS):
+        col.link_button(
+            f"Download statement ({label})",
+            f"{API_URL}/wallets/{quote(st.session_state.user_public_key, safe='')}/statement?format={fmt}",
+        )
 
 # Rewards Section
 st.markdown("<h2 class='section-title'>Available Healthcare Rewards</h2>", unsafe_allow_html=True)
 
-rewards = [
-    {
-        "name": "Annual Health Checkup",
-        "points": 5000,
-        "image": "https://images.unsplash.com/photo-1579684385127-1ef15d508118?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
-        "description": "Complete health screening package"
-    },
-    {
-        "name": "Wellness Subscription",
-        "points": 7500,
-        "image": "https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
-        "description": "3-month premium wellness app access"
-    },
-    {
-        "name": "Medical Coverage Boost",
-        "points": 10000,
-        "image": "https://images.unsplash.com/photo-1505751172876-fa1923c5c528?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
-        "description": "Additional medical coverage worth $500"
-    }
-]
+with get_timings().span("catalog"):
+    rewards = get_catalog().rewards()
 
-reward_cols = st.columns(3)
+reward_cols = st.columns(len(rewards))
 for idx, reward in enumerate(rewards):
     with reward_cols[idx]:
-        st.markdown(f"""
-            <div class='reward-card'>
-                <div class='reward-image-container'>
-                    <img src='{reward['image']}' class='reward-image' alt='{reward['name']}'>
-                </div>
-                <h4 style='margin: 0.5rem 0;'>{reward['name']}</h4>
-                <p style='color: rgba(255, 255, 255, 0.8); flex-grow: 1;'>{reward['description']}</p>
-                <p style='color: #9945FF; font-weight: bold; margin: 0.5rem 0;'>{reward['points']} points</p>
-            </div>
-        """, unsafe_allow_html=True)
-        if st.button(f"Redeem for {reward['points']} points", key=reward['name']):
+        st.markdown(
+            reward_card(
+                reward['name'], reward['points'], reward['image'], reward['description'],
+                reward['stock'], get_catalog().image_sources(reward)
+            ),
+            unsafe_allow_html=True
+        )
+        if st.button(f"Redeem for {reward['points']} points", key=reward['name'], disabled=reward['stock'] == 0):
             redeem_reward(reward)
 
+# Leaderboard Section
+with get_timings().span("leaderboard"):
+    leaders = get_leaderboard()
+if leaders:
+    st.markdown("<h2 class='section-title'>Top Earners</h2>", unsafe_allow_html=True)
+    st.markdown("".join(
+        leaderboard_row(entry['rank'], entry['public_key'], entry['earned'],
+                        entry['public_key'] == st.session_state.user_public_key)
+        for entry in leaders
+    ), unsafe_allow_html=True)
+
 # Connected Platforms Section
 st.markdown("<h2 class='section-title'>Connected Healthcare Platforms</h2>", unsafe_allow_html=True)
 app_cols = st.columns(5)
@@ -330,15 +333,7 @@ apps = [
 
 for i, (app_name, icon, connected) in enumerate(apps):
     with app_cols[i]:
-        st.markdown(f"""
-            <div class='platform-card'>
-                <div style='font-size: 1.5rem; margin-bottom: 0.5rem;'>{icon}</div>
-                <div style='font-weight: bold; margin-bottom: 0.3rem;'>{app_name}</div>
-                <div style='color: {"#28a745" if connected else "#dc3545"};'>
-                    {('✅ Connected' if connected else '❌ Not Connected')}
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
+        st.markdown(platform_card(app_name, icon, connected), unsafe_allow_html=True)
 
 # Footer
 st.markdown("""
@@ -346,3 +341,5 @@ st.markdown("""
         © 2024 John Ong and Sze Yu Sim from Team Hoshino Universiti Malaya
     </div>
 """, unsafe_allow_html=True)
+
+get_timings().observe("render", time.perf_counter() - render_started)
@@ -1,27 +1,53 @@
+import os
+import time
+from operator import itemgetter
+from urllib.parse import quote
+
+import requests
 import streamlit as st
-from datetime import datetime, timedelta
-import random
-
-# Initialize session state for total points if not exists
-if "total_points" not in st.session_state:
-    st.session_state.total_points = 125750
-
-# Add after initial session state setup
-if "activities" not in st.session_state:
-    st.session_state.activities = [
-        {
-            "date": (datetime.now() - timedelta(days=x)).strftime("%Y-%m-%d"),
-            "app": app,
-            "points": points,
-            "tx": f"https://solscan.io/tx/{random.randint(1000000, 9999999)}",
-        }
-        for x, (app, points) in enumerate(
-            [
-                ("MedFit Tracker", 500),
-                ("WellnessRewards", 250),
-            ]
-        )
-    ]
+from activity_view import activity_window
+from balance_feed import BalanceFeed
+from catalog_client import seed_rewards
+from rendering import activity_date, platform_card, reward_card, stylesheet
+from timings import Timings
+from txids import derive_tx_id
+from wallet_state import WalletState
+
+API_URL = "http://localhost:8000"
+SUBSCRIPTIONS_URL = "ws://localhost:8001"
+ACTIVITY_PAGE_SIZE = 20
+# Full-history downloads, streamed by the ledger service straight to the browser
+STATEMENT_FORMATS = [("CSV", "csv"), ("JSON Lines", "jsonl"), ("Parquet", "parquet")]
+# Every visitor to the demo shares one ledger wallet
+DEMO_WALLET = os.environ.get("DEMO_WALLET", "demo-wallet")
+# Seconds between re-renders of the points card from the balance feed
+POINTS_REFRESH = 1.0
+# Serve this process's timings at http://localhost:<port>/metrics when set
+METRICS_PORT = os.environ.get("DASHBOARD_METRICS_PORT")
+
+render_started = time.perf_counter()
+
+
+@st.cache_resource
+def get_balance_feed():
+    """Process-wide balance subscriptions shared by every session"""
+    return BalanceFeed(SUBSCRIPTIONS_URL)
+
+
+@st.cache_resource
+def get_state():
+    """Process-wide wallet state shared by every session"""
+    return WalletState(API_URL, feed=get_balance_feed())
+
+
+@st.cache_resource
+def get_timings():
+    """Process-wide render and redemption timings"""
+    timings = Timings("app2")
+    if METRICS_PORT:
+        timings.serve(int(METRICS_PORT))
+    return timings
+
 
 # Page configuration
 st.set_page_config(
@@ -30,120 +56,11 @@ st.set_page_config(
     layout="wide",
 )
 
+# Start the demo wallet's reads in the background while the page is laid out
+get_state().prefetch(DEMO_WALLET, ACTIVITY_PAGE_SIZE, summary=False)
+
 # Custom CSS with dark theme improvements
-st.markdown(
-    """
-    <style>
-    .main {
-        padding: 0rem 1rem;
-    }
-    .stButton>button {
-        width: 100%;
-        background-color: #9945FF;
-        color: white;
-        border-radius: 10px;
-        padding: 0.5rem;
-        transition: all 0.3s ease;
-    }
-    .stButton>button:hover {
-        background-color: #8935ee;
-        transform: translateY(-2px);
-    }
-    .points-card {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 15px;
-        text-align: center;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.2);
-        margin: 1rem 0;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    .title-section {
-        text-align: center;
-        padding: 1rem 0;
-        margin-bottom: 0.5rem;
-        color: white;
-    }
-    .section-title {
-        font-size: 1.8rem;
-        color: white;
-        margin: 2rem 0 1rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 2px solid #9945FF;
-        display: inline-block;
-    }
-    .reward-card {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1.5rem;
-        border-radius: 10px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.2);
-        margin-bottom: 1rem;
-        height: 400px;
-        display: flex;
-        flex-direction: column;
-        transition: transform 0.3s ease;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .reward-card:hover {
-        transform: translateY(-5px);
-        border: 1px solid rgba(153, 69, 255, 0.3);
-    }
-    .reward-image-container {
-        width: 100%;
-        height: 200px;
-        overflow: hidden;
-        border-radius: 8px;
-        margin-bottom: 1rem;
-    }
-    .reward-image {
-        width: 100%;
-        height: 100%;
-        object-fit: cover;
-    }
-    .activity-container {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1rem;
-        border-radius: 10px;
-        margin-bottom: 0.5rem;
-        transition: all 0.3s ease;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .activity-container:hover {
-        transform: translateX(5px);
-        border: 1px solid rgba(153, 69, 255, 0.3);
-    }
-    .platform-card {
-        background: linear-gradient(135deg, rgba(25, 25, 25, 0.9), rgba(35, 35, 35, 0.8));
-        backdrop-filter: blur(10px);
-        padding: 1rem;
-        border-radius: 10px;
-        text-align: center;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.2);
-        margin: 0.5rem;
-        transition: all 0.3s ease;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        color: white;
-    }
-    .platform-card:hover {
-        transform: translateY(-2px);
-        border: 1px solid rgba(153, 69, 255, 0.3);
-    }
-    .footer {
-        text-align: center;
-        padding: 2rem 0;
-        color: rgba(255, 255, 255, 0.5);
-        font-size: 0.8rem;
-        margin-top: 2rem;
-    }
-    </style>
-""",
-    unsafe_allow_html=True,
-)
+st.markdown(stylesheet(), unsafe_allow_html=True)
 
 # Title Section
 st.markdown(
@@ -157,35 +74,50 @@ st.markdown(
 )
 
 # Points Summary
-st.markdown(
-    f"""
-    <div class='points-card'>
-        <h1 style='font-size: 2.8rem; color: #9945FF; margin: 0;'>{st.session_state.total_points:,}</h1>
-        <p style='font-size: 1rem; color: #fff; margin: 0;'>Total Healthcare Points Accumulated via Solana</p>
-    </div>
-""",
-    unsafe_allow_html=True,
-)
+try:
+    with get_timings().span("balances"):
+        _, total_points = get_state().balances(DEMO_WALLET)
+except Exception as e:
+    st.error(f"Error fetching balance: {str(e)}")
+    total_points = 0
+
+
+@st.fragment(run_every=POINTS_REFRESH)
+def points_card(total_points):
+    """The points card, re-rendered with the balance feed's pushed tokens without rerunning the page"""
+    pushed = get_balance_feed().get(DEMO_WALLET)
+    if pushed is not None:
+        total_points = pushed[1]
+    st.markdown(
+        f"""
+        <div class='points-card'>
+            <h1 style='font-size: 2.8rem; color: #9945FF; margin: 0;'>{total_points:,}</h1>
+            <p style='font-size: 1rem; color: #fff; margin: 0;'>Total Healthcare Points Accumulated via Solana</p>
+        </div>
+    """,
+        unsafe_allow_html=True,
+    )
+
+
+points_card(total_points)
 
 
 # Keep only this comprehensive redemption function
-def redeem_reward(reward_name, points_cost):
-    if st.session_state.total_points >= points_cost:
-        # Update total points
-        st.session_state.total_points -= points_cost
-
-        # Add new activity
-        new_activity = {
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "app": f"Reward: {reward_name}",
-            "points": -points_cost,
-            "tx": f"https://solscan.io/tx/{random.randint(1000000, 9999999)}",
-        }
-        st.session_state.activities.insert(0, new_activity)
+def redeem_reward(reward_name, points_cost, reward_id=None):
+    if total_points >= points_cost:
+        try:
+            with get_timings().span("redemption.settle"):
+                get_state().redeem(DEMO_WALLET, reward_name, points_cost, reward_id)
+        except requests.HTTPError as e:
+            if e.response.status_code not in (409, 429):
+                raise
+            st.error(e.response.json()["detail"])
+            return False
 
         # Visual feedback
         st.balloons()
         st.success(f"Successfully redeemed {reward_name}!")
+        get_timings().count("rerun.redeem")
         st.rerun()  # Add this line to force immediate update
         return True
     else:
@@ -193,27 +125,39 @@ def redeem_reward(reward_name, points_cost):
         return False
 
 
-# Define rewards list before the UI components
-rewards = [
-    {
-        "name": "Annual Health Checkup",
-        "points": 5000,
-        "image": "https://images.unsplash.com/photo-1579684385127-1ef15d508118?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
-        "description": "Complete health screening package",
-    },
-    {
-        "name": "Wellness Subscription",
-        "points": 7500,
-        "image": "https://images.unsplash.com/photo-1571019613454-1cb2f99b2d8b?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
-        "description": "3-month premium wellness app access",
-    },
-    {
-        "name": "Medical Coverage Boost",
-        "points": 10000,
-        "image": "https://images.unsplash.com/photo-1505751172876-fa1923c5c528?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
-        "description": "Additional medical coverage worth $500",
-    },
-]
+def fetch_activity_page(cursor, limit):
+    """One page of the demo wallet's ledger activity; the demo platform entries sit on the first page"""
+    try:
+        activities, next_cursor = get_state().activities(DEMO_WALLET, cursor, limit)
+    except Exception as e:
+        st.error(f"Error fetching activities: {str(e)}")
+        activities, next_cursor = [], None
+    activities = list(activities)
+    if cursor is None:
+        now = int(time.time())
+        today = now // 86400
+        activities += [
+            {
+                "timestamp": now - x * 86400,
+                "type": app,
+                "points": points,
+                "tx": derive_tx_id(DEMO_WALLET, app, today - x),
+            }
+            for x, (app, points) in enumerate(
+                [
+                    ("MedFit Tracker", 500),
+                    ("WellnessRewards", 250),
+                ]
+            )
+        ]
+        activities.sort(key=itemgetter("timestamp"), reverse=True)
+        activities = activities[:limit]
+    rows = [(activity_date(a["timestamp"]), a["type"], a["points"], a["tx"]) for a in activities]
+    return rows, next_cursor
+
+
+# Rewards come from the catalog's seed file; points come from the demo wallet
+rewards = seed_rewards()
 
 # Display rewards section with buttons
 st.markdown(
@@ -222,27 +166,18 @@ st.markdown(
 )
 
 # Create columns for rewards
-reward_cols = st.columns(3)
+reward_cols = st.columns(len(rewards))
 for idx, reward in enumerate(rewards):
     with reward_cols[idx]:
         st.markdown(
-            f"""
-            <div class='reward-card'>
-                <div class='reward-image-container'>
-                    <img src='{reward["image"]}' class='reward-image' alt='{reward["name"]}'>
-                </div>
-                <h4 style='margin: 0.5rem 0;'>{reward["name"]}</h4>
-                <p style='color: rgba(255, 255, 255, 0.8); flex-grow: 1;'>{reward["description"]}</p>
-                <p style='color: #9945FF; font-weight: bold; margin: 0.5rem 0;'>{reward["points"]} points</p>
-            </div>
-        """,
+            reward_card(reward["name"], reward["points"], reward["image"], reward["description"]),
             unsafe_allow_html=True,
         )
 
         if st.button(
             f"Redeem for {reward['points']} points", key=f"redeem_{reward['name']}"
         ):
-            redeem_reward(reward["name"], reward["points"])
+            redeem_reward(reward["name"], reward["points"], reward["id"])
 
 # Recent Activity Section
 st.markdown(
@@ -250,17 +185,13 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Update activities display
-for activity in st.session_state.activities:
-    col1, col2, col3, col4 = st.columns([2, 3, 2, 3])
-    with col1:
-        st.write(activity["date"])
-    with col2:
-        st.write(activity["app"])
-    with col3:
-        st.write(f"{activity['points']:+,d} points")
-    with col4:
-        st.markdown(f"[View on Solana]({activity['tx']})")
+activity_window("activity-pages", fetch_activity_page, ACTIVITY_PAGE_SIZE)
+statement_cols = st.columns(len(STATEMENT_FORMATS))
+for col, (label, fmt) in zip(statement_cols, STATEMENT_FORMATS):
+    col.link_button(
+        f"Download statement ({label})",
+        f"{API_URL}/wallets/{quote(DEMO_WALLET, safe='')}/statement?format={fmt}",
+    )
 
 # Connected Platforms Section
 st.markdown(
@@ -278,18 +209,7 @@ apps = [
 
 for i, (app_name, icon, connected) in enumerate(apps):
     with app_cols[i]:
-        st.markdown(
-            f"""
-            <div class='platform-card'>
-                <div style='font-size: 1.5rem; margin-bottom: 0.5rem;'>{icon}</div>
-                <div style='font-weight: bold; margin-bottom: 0.3rem;'>{app_name}</div>
-                <div style='color: {"#28a745" if connected else "#dc3545"};'>
-                    {('✅ Connected' if connected else '❌ Not Connected')}
-                </div>
-            </div>
-        """,
-            unsafe_allow_html=True,
-        )
+        st.markdown(platform_card(app_name, icon, connected), unsafe_allow_html=True)
 
 # Footer Section
 st.markdown(
@@ -300,3 +220,5 @@ st.markdown(
 """,
     unsafe_allow_html=True,
 )
+
+get_timings().observe("render", time.perf_counter() - render_started)
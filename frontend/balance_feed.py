@@ -0,0 +1,159 @@
+"""Wallet balances kept current by the ledger's WebSocket push hub.
+
+Every followed wallet shares one connection to the hub, multiplexed and
+held open by one background thread. Following a wallet sends a subscribe
+message. Once the hub confirms it, the wallet's balances are read again
+over HTTP with ``fetch``, so nothing that changed while the subscription
+was being set up is missed. Any push that arrives during that read wins
+over it. From then on, every balance, tokens and activity update is
+applied in memory, and page reruns read balances from there instead of
+calling the balances endpoint.
+
+A wallet that goes unread for ``idle_timeout`` seconds is unsubscribed and
+forgotten, so the feed only holds the wallets sessions are looking at.
+While the connection is down, ``get`` returns None and the page falls
+back to HTTP. The thread reconnects after ``retry_delay`` and subscribes
+to every followed wallet again.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+RETRY_DELAY = 5.0
+IDLE_TIMEOUT = 600.0
+# How often idle wallets are looked for
+SWEEP_INTERVAL = 30.0
+FETCH_THREADS = 2
+
+
+class BalanceFeed:
+    """``fetch(public_key)`` returns ``(sol, tokens)`` read over HTTP; ``WalletState`` sets it"""
+
+    def __init__(self, url, fetch=None, retry_delay=RETRY_DELAY, idle_timeout=IDLE_TIMEOUT):
+        self.url = url
+        self.fetch = fetch
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self._followed = {}  # public_key -> when it was last read
+        self._balances = {}  # public_key -> [sol, tokens], once live
+        self._pushed = {}  # public_key -> {index: value} pushed while its balances are fetched
+        self._ws = None
+        self._thread = None
+        self._fetcher = ThreadPoolExecutor(FETCH_THREADS, thread_name_prefix="balance-fetch")
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def get(self, public_key):
+        """(sol, tokens) pushed for a wallet, or None if it is not live"""
+        with self._lock:
+            if public_key in self._followed:
+                self._followed[public_key] = time.monotonic()
+            balances = self._balances.get(public_key)
+            return None if balances is None else tuple(balances)
+
+    def follow(self, public_key):
+        """Start receiving pushes for a wallet; ``get`` returns them once it is live"""
+        with self._lock:
+            new = public_key not in self._followed
+            self._followed[public_key] = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="balance-feed", daemon=True)
+                self._thread.start()
+            ws = self._ws
+        if new and ws is not None:
+            self._send(ws, "subscribe", public_key)
+
+    def _send(self, ws, op, public_key):
+        try:
+            with self._send_lock:
+                ws.send(json.dumps({"op": op, "public_key": public_key}))
+        except ConnectionClosed:
+            # The reconnect subscribes every followed wallet again
+            pass
+
+    def _run(self):
+        while True:
+            try:
+                with connect(f"{self.url}/wallets") as ws:
+                    self._expire(None)
+                    with self._lock:
+                        self._ws = ws
+                        wallets = list(self._followed)
+                    for public_key in wallets:
+                        self._send(ws, "subscribe", public_key)
+                    sweep_at = time.monotonic() + SWEEP_INTERVAL
+                    while True:
+                        try:
+                            message = ws.recv(timeout=max(0.0, sweep_at - time.monotonic()))
+                        except TimeoutError:
+                            message = None
+                        if message is not None:
+                            self._dispatch(ws, json.loads(message))
+                        if time.monotonic() >= sweep_at:
+                            self._expire(ws)
+                            sweep_at = time.monotonic() + SWEEP_INTERVAL
+            except (OSError, ConnectionClosed):
+                pass
+            finally:
+                with self._lock:
+                    self._ws = None
+                    self._balances.clear()
+                    self._pushed.clear()
+            time.sleep(self.retry_delay)
+
+    def _expire(self, ws):
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [public_key for public_key, read_at in self._followed.items() if read_at < cutoff]
+            for public_key in idle:
+                del self._followed[public_key]
+                self._balances.pop(public_key, None)
+                self._pushed.pop(public_key, None)
+        if ws is not None:
+            for public_key in idle:
+                self._send(ws, "unsubscribe", public_key)
+
+    def _dispatch(self, ws, update):
+        public_key = update["public_key"]
+        if update["type"] == "subscribed":
+            with self._lock:
+                if public_key not in self._followed:
+                    return
+                self._pushed[public_key] = {}
+            self._fetcher.submit(self._refetch, ws, public_key)
+            return
+        if update["type"] == "balance":
+            index, value = 0, update["sol"]
+        elif "tokens" in update:
+            index, value = 1, update["tokens"]
+        else:
+            return
+        with self._lock:
+            balances = self._balances.get(public_key)
+            if balances is not None:
+                balances[index] = value
+            pushed = self._pushed.get(public_key)
+            if pushed is not None:
+                pushed[index] = value
+
+    def _refetch(self, ws, public_key):
+        try:
+            balances = list(self.fetch(public_key))
+        except Exception:
+            balances = None
+        with self._lock:
+            pushed = self._pushed.pop(public_key, None)
+            if pushed is None or self._ws is not ws or public_key not in self._followed:
+                return  # Expired or disconnected meanwhile
+            if balances is not None:
+                for index, value in pushed.items():
+                    balances[index] = value
+                self._balances[public_key] = balances
+                return
+            # Unreadable for now: forget the wallet, and the next read follows it again
+            del self._followed[public_key]
+        self._send(ws, "unsubscribe", public_key)
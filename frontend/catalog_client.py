@@ -0,0 +1,93 @@
+"""Rewards catalog as seen by the dashboards.
+
+The ledger service serves the catalog with an ETag. The client keeps the
+last listing it received and revalidates it with ``If-None-Match`` at
+most once every ``revalidate_after`` seconds, so a rerun usually costs
+nothing and an unchanged catalog costs one empty 304 response. If the
+service cannot be reached, the last listing is kept until the next
+revalidation is due; before any listing has arrived, the catalog's seed
+file stands in. A failed check counts as a check, so an unreachable
+service costs one timed-out request per interval rather than one per
+rerun. ``prefetch`` starts a due revalidation in the background, so the
+page can lay out other sections while it is under way.
+
+Reward images are linked to the service's resized thumbnails once it has
+made them, falling back to the original image URL.
+"""
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+
+import requests
+
+SEED_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "catalog.json")
+REVALIDATE_AFTER = 2.0
+IMAGE_MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+@lru_cache(maxsize=None)
+def seed_rewards(path=SEED_PATH):
+    """Rewards from the catalog's seed file, for pages without the ledger service"""
+    with open(path) as f:
+        return json.load(f)
+
+
+class CatalogClient:
+    def __init__(self, url, revalidate_after=REVALIDATE_AFTER):
+        self.url = url
+        self.revalidate_after = revalidate_after
+        self._etag = None
+        self._rewards = None
+        self._checked_at = None  # monotonic time of the last check, successful or not
+        self._lock = threading.Lock()
+        self._prefetching = threading.Lock()
+
+    def _fresh(self):
+        return self._checked_at is not None and time.monotonic() - self._checked_at < self.revalidate_after
+
+    def rewards(self):
+        """The current listing, revalidated if it is older than ``revalidate_after``"""
+        with self._lock:
+            if self._fresh():
+                return self._listing()
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            try:
+                response = requests.get(f"{self.url}/rewards", headers=headers, timeout=5)
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    self._rewards = response.json()["rewards"]
+                    self._etag = response.headers.get("ETag")
+            except requests.RequestException:
+                pass
+            self._checked_at = time.monotonic()
+            return self._listing()
+
+    def _listing(self):
+        return self._rewards if self._rewards is not None else seed_rewards()
+
+    def prefetch(self):
+        """Revalidate from a background thread if the next ``rewards`` call would"""
+        if self._fresh() or not self._prefetching.acquire(blocking=False):
+            return
+        threading.Thread(target=self._prefetch, name="catalog-prefetch", daemon=True).start()
+
+    def _prefetch(self):
+        try:
+            self.rewards()
+        finally:
+            self._prefetching.release()
+
+    def image_sources(self, reward):
+        """``(media type, srcset)`` pairs for a reward's thumbnails, for ``reward_card``"""
+        return tuple(
+            (IMAGE_MEDIA_TYPES[ext], ", ".join(f"{self.url}/images/{name} {width}w" for width, name in sizes))
+            for ext, sizes in (reward.get("thumbnails") or {}).items()
+            if ext in IMAGE_MEDIA_TYPES
+        )
+
+    def invalidate(self):
+        """Revalidate on the next call, e.g. after a redemption changed the stock"""
+        with self._lock:
+            self._checked_at = None
@@ -0,0 +1,185 @@
+"""Background redemption pipeline.
+
+Redemptions are queued by the page and settled on a small pool of
+worker threads, so the Streamlit script thread never waits on the ledger
+service. The page submits, gets an id back immediately and polls for the
+outcome.
+"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import requests
+
+# Redemptions settled at once; each is one round-trip to the ledger service
+SETTLE_THREADS = 8
+# Tries at recording a redemption with the ledger service before it fails
+SETTLE_ATTEMPTS = 3
+
+PENDING = "pending"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+
+
+@dataclass
+class Redemption:
+    id: str
+    public_key: str
+    reward: str
+    points: int
+    submitted_at: float
+    reward_id: Optional[str] = None
+    status: str = PENDING
+    tx_hash: Optional[bytes] = None
+    error: Optional[str] = None
+    settled_at: Optional[float] = None
+    attempts: int = 0
+
+
+class RetryLater(Exception):
+    """Raised by ``settle`` to have the redemption settled again ``delay`` seconds from now"""
+
+    def __init__(self, delay, reason=None):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class RedemptionPipeline:
+    """Queue of redemptions settled by a bounded pool of threads.
+
+    ``settle`` is called on a pool thread; it returns the transaction hash
+    or raises to mark the redemption as failed. Raising ``RetryLater`` puts
+    the redemption back in the queue, due again after its delay, so a retry
+    never holds a pool thread while it waits. A dispatcher thread hands
+    due redemptions to the pool, at most ``settle_threads`` at a time, and
+    the rest wait in the queue in the order they are due.
+    """
+
+    def __init__(self, settle: Callable[[Redemption], bytes], settle_threads: int = SETTLE_THREADS):
+        self._settle = settle
+        self._threads = settle_threads
+        self._settling = 0
+        self._pool = ThreadPoolExecutor(settle_threads, thread_name_prefix="redemption-settle")
+        self._cond = threading.Condition()
+        self._due = []  # heap of (due_at, seq, redemption_id)
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._dispatcher = threading.Thread(
+            target=self._run, name="redemption-dispatcher", daemon=True
+        )
+        self._dispatcher.start()
+
+    def submit(self, public_key, reward, points, reward_id=None):
+        """Queue a redemption and return its id without waiting"""
+        now = time.monotonic()
+        job = Redemption(uuid.uuid4().hex, public_key, reward, points, now, reward_id)
+        with self._cond:
+            self._jobs[job.id] = job
+            heapq.heappush(self._due, (now, next(self._seq), job.id))
+            self._cond.notify_all()
+        return job.id
+
+    def status(self, redemption_id):
+        """Return the redemption record, or None if the id is unknown"""
+        with self._cond:
+            return self._jobs.get(redemption_id)
+
+    def forget(self, redemption_id):
+        """Drop a settled redemption once the page has consumed it"""
+        with self._cond:
+            job = self._jobs.get(redemption_id)
+            if job is not None and job.status != PENDING:
+                del self._jobs[redemption_id]
+
+    def wait(self, redemption_id, timeout=None):
+        """Block until the redemption settles (for scripts and benchmarks)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(redemption_id)
+                if job is None or job.status != PENDING:
+                    return job
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return job
+                self._cond.wait(remaining)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (self._settling >= self._threads or not self._due
+                       or self._due[0][0] > time.monotonic()):
+                    if self._settling >= self._threads or not self._due:
+                        timeout = None
+                    else:
+                        timeout = self._due[0][0] - time.monotonic()
+                    self._cond.wait(timeout)
+                _, _, redemption_id = heapq.heappop(self._due)
+                job = self._jobs[redemption_id]
+                self._settling += 1
+            self._pool.submit(self._settle_job, job)
+
+    def _settle_job(self, job):
+        job.attempts += 1
+        try:
+            tx_hash, error, status = self._settle(job), None, CONFIRMED
+        except RetryLater as e:
+            with self._cond:
+                self._settling -= 1
+                heapq.heappush(self._due, (time.monotonic() + e.delay, next(self._seq), job.id))
+                self._cond.notify_all()
+            return
+        except Exception as e:
+            # Whatever went wrong, the page is told the redemption failed rather than left polling
+            tx_hash, error, status = None, str(e) or type(e).__name__, FAILED
+
+        with self._cond:
+            self._settling -= 1
+            job.tx_hash = tx_hash
+            job.error = error
+            job.settled_at = time.monotonic()
+            job.status = status
+            self._cond.notify_all()
+
+
+def settle_redemption(state, redemption):
+    """Record a redemption with the ledger service (pass it to the pipeline as ``settle``)
+
+    The redemption id doubles as the idempotency key, so retrying after a
+    dropped connection, a server error or a 429 never debits the wallet twice. Retries are
+    handed back to the pipeline to schedule rather than waited out here, so
+    a throttled wallet never holds up other sessions' redemptions.
+    """
+    retry = redemption.attempts < SETTLE_ATTEMPTS
+    try:
+        activity = state.redeem(
+            redemption.public_key, redemption.reward, redemption.points, redemption.reward_id,
+            idempotency_key=redemption.id
+        )
+    except requests.HTTPError as e:
+        if e.response.status_code == 429 and retry:
+            # Turned away by the service's admission control; it says when to come back
+            raise RetryLater(float(e.response.headers.get("Retry-After", 1)))
+        if e.response.status_code in (409, 429):
+            raise ValueError(_detail(e.response))
+        if e.response.status_code >= 500 and retry:
+            raise RetryLater(0.5 * 2 ** (redemption.attempts - 1))
+        raise
+    except requests.RequestException:
+        # Dropped connections, timeouts and responses cut short
+        if not retry:
+            raise
+        raise RetryLater(0.5 * 2 ** (redemption.attempts - 1))
+    return activity["tx"]
+
+
+def _detail(response):
+    try:
+        return response.json()["detail"]
+    except (ValueError, KeyError, TypeError):
+        return response.text or response.reason
@@ -0,0 +1,152 @@
+"""HTML fragments for the dashboards.
+
+The stylesheet is read and minified once per process, and every card and
+activity row is built by a memoized function of its inputs, so a rerun
+over unchanged data formats nothing. Activity rows are emitted in blocks
+counted from the oldest row: a new activity at the top changes only the
+newest block, and every other block is byte-for-byte what the browser
+already has. Streamlit sends such repeated elements as a hash reference
+once they reach ``global.minCachedMessageSize`` bytes (lowered for this
+in ``.streamlit/config.toml``), so unchanged blocks, the stylesheet and
+the cards cost a few bytes per rerun instead of their full markup.
+"""
+import html
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+
+from txids import to_base58
+
+STYLESHEET_PATH = os.path.join(os.path.dirname(__file__), "dashboard.css")
+ACTIVITY_BLOCK_ROWS = 50
+FRAGMENT_CACHE_SIZE = 8192
+
+_ACTIVITY_ROW = (
+    "<div class='activity-container'>"
+    "<div style='display: grid; grid-template-columns: 2fr 2fr 2fr 3fr; gap: 1rem; align-items: center;'>"
+    "<div>{date}</div><div>{label}</div>"
+    "<div style='color: {color}; font-weight: bold;'>{sign}{points} pts</div>"
+    "<div><a href='https://solscan.io/tx/{tx}' target='_blank' style='color: #9945FF;'>View on Solana</a></div>"
+    "</div></div>"
+).format
+_REWARD_CARD = (
+    "<div class='reward-card'>"
+    "<div class='reward-image-container'><picture>{sources}"
+    "<img src='{image}' class='reward-image' alt='{name}' loading='lazy' decoding='async'>"
+    "</picture></div>"
+    "<h4 style='margin: 0.5rem 0;'>{name}</h4>"
+    "<p style='color: rgba(255, 255, 255, 0.8); flex-grow: 1;'>{description}</p>"
+    "<p style='color: #9945FF; font-weight: bold; margin: 0.5rem 0;'>{points} points</p>"
+    "{stock}"
+    "</div>"
+).format
+_IMAGE_SOURCE = "<source type='{type}' srcset='{srcset}' sizes='{sizes}'>".format
+# Rendered width of a reward image: a third of the page, or all of it on phones
+REWARD_IMAGE_SIZES = "(max-width: 640px) 100vw, 33vw"
+_STOCK = "<p style='color: {color}; margin: 0 0 0.5rem 0;'>{text}</p>".format
+_POINTS_BREAKDOWN = (
+    "<p style='font-size: 0.9rem; color: rgba(255, 255, 255, 0.7); margin: 0.5rem 0 0 0;'>"
+    "{earned:,} earned · {redeemed:,} redeemed · {streak}{rank}</p>"
+).format
+_LEADERBOARD_ROW = (
+    "<div class='activity-container' style='{highlight}'>"
+    "<div style='display: grid; grid-template-columns: 1fr 6fr 3fr; gap: 1rem; align-items: center;'>"
+    "<div>#{rank}</div><div>{wallet}</div>"
+    "<div style='color: #9945FF; font-weight: bold;'>{earned:,} pts</div>"
+    "</div></div>"
+).format
+_PLATFORM_CARD = (
+    "<div class='platform-card'>"
+    "<div style='font-size: 1.5rem; margin-bottom: 0.5rem;'>{icon}</div>"
+    "<div style='font-weight: bold; margin-bottom: 0.3rem;'>{name}</div>"
+    "<div style='color: {color};'>{status}</div>"
+    "</div>"
+).format
+
+
+@lru_cache(maxsize=None)
+def stylesheet(path=STYLESHEET_PATH):
+    """The dashboard CSS as one minified <style> element"""
+    with open(path) as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", re.sub(r"\s+", " ", css)).replace(";}", "}")
+    return f"<style>{css.strip()}</style>"
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def activity_date(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def activity_row(date, label, points, tx):
+    return _ACTIVITY_ROW(
+        date=date,
+        label=html.escape(label),
+        color="#FF4B4B" if points < 0 else "#9945FF",
+        sign="+" if points > 0 else "",
+        points=points,
+        tx=to_base58(tx),
+    )
+
+
+def activity_blocks(rows, rows_per_block=ACTIVITY_BLOCK_ROWS):
+    """Join rendered rows, newest first, into blocks aligned to the oldest row"""
+    if not rows:
+        return []
+    first = len(rows) % rows_per_block or rows_per_block
+    return ["".join(rows[:first])] + [
+        "".join(rows[i:i + rows_per_block]) for i in range(first, len(rows), rows_per_block)
+    ]
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def reward_card(name, points, image, description, stock=None, sources=()):
+    """A reward card; ``sources`` are ``(media type, srcset)`` pairs of thumbnails, preferred first"""
+    if stock is None:
+        stock_line = ""
+    elif stock:
+        stock_line = _STOCK(color="rgba(255, 255, 255, 0.6)", text=f"{stock:,} left")
+    else:
+        stock_line = _STOCK(color="#FF4B4B", text="Out of stock")
+    return _REWARD_CARD(
+        name=html.escape(name), points=points, image=html.escape(image), description=html.escape(description),
+        stock=stock_line,
+        sources="".join(
+            _IMAGE_SOURCE(type=media_type, srcset=html.escape(srcset), sizes=REWARD_IMAGE_SIZES)
+            for media_type, srcset in sources
+        ),
+    )
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def points_breakdown(earned, redeemed, streak, rank=None):
+    """The line under the points total: lifetime totals, streak and leaderboard place"""
+    return _POINTS_BREAKDOWN(
+        earned=earned,
+        redeemed=redeemed,
+        streak=f"🔥 {streak}-day streak" if streak else "no streak yet",
+        rank=f" · #{rank:,} on the leaderboard" if rank else "",
+    )
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def leaderboard_row(rank, public_key, earned, own=False):
+    wallet = public_key if len(public_key) <= 16 else f"{public_key[:6]}…{public_key[-6:]}"
+    return _LEADERBOARD_ROW(
+        rank=rank,
+        wallet=html.escape(wallet),
+        earned=earned,
+        highlight="border: 1px solid #9945FF;" if own else "",
+    )
+
+
+@lru_cache(maxsize=64)
+def platform_card(name, icon, connected):
+    return _PLATFORM_CARD(
+        name=html.escape(name),
+        icon=icon,
+        color="#28a745" if connected else "#dc3545",
+        status="✅ Connected" if connected else "❌ Not Connected",
+    )
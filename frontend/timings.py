@@ -0,0 +1,82 @@
+"""Timings of the dashboard's own work, for the redemption and render paths.
+
+The ledger service measures itself at its ``/metrics``; this measures
+what happens in the Streamlit process: how long a script run takes and
+how much of it each section spends waiting on data, how long a queued
+redemption takes to settle and to be confirmed, and how often the page
+forces a rerun. One ``Timings`` is shared by every session of a
+process. It records into the dashboard's own metric types
+(``metrics.py``), kept in a registry of its own, and with ``port`` given
+serves them in the service's Prometheus text format on
+``http://<host>:<port>/metrics``.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import Counter, Histogram, exposition
+
+# Upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Timings:
+    def __init__(self, app):
+        self.app = app
+        self._registry = []
+        self._spans = Histogram("dashboard_span_seconds", "Time the dashboard spent in each section or step",
+                                ["app", "span"], buckets=BUCKETS, registry=self._registry)
+        self._events = Counter("dashboard_events", "Dashboard events such as forced reruns",
+                               ["app", "event"], registry=self._registry)
+        self._server = None
+
+    def observe(self, name, seconds):
+        self._spans.labels(self.app, name).observe(seconds)
+
+    def count(self, name):
+        self._events.labels(self.app, name).inc()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def exposition(self):
+        return exposition(self._registry)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve ``/metrics`` from a background thread"""
+        timings = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = timings.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="dashboard-metrics", daemon=True).start()
+        return self
+
+
+class _Span:
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.observe(self.name, time.perf_counter() - self.start)
+        return False
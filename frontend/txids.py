@@ -0,0 +1,41 @@
+"""Transaction identifiers.
+
+An id is 32 bytes, either random from the OS CSPRNG or derived by hashing
+what it identifies, and stays ``bytes`` everywhere except the HTML that
+displays it. Encoding to base58 (the form Solana explorers use) or hex
+happens at render time through LRU-cached encoders, so rerunning a page
+over the same activities does not re-encode them.
+"""
+import hashlib
+import secrets
+from functools import lru_cache
+
+from solders.hash import Hash
+
+TX_ID_SIZE = 32
+ENCODE_CACHE_SIZE = 4096
+
+
+def new_tx_id():
+    """Fresh random transaction id"""
+    return secrets.token_bytes(TX_ID_SIZE)
+
+
+def derive_tx_id(*parts):
+    """Stable transaction id for the record identified by ``parts``"""
+    return hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=TX_ID_SIZE).digest()
+
+
+@lru_cache(maxsize=ENCODE_CACHE_SIZE)
+def to_base58(tx_id):
+    return str(Hash(tx_id))
+
+
+@lru_cache(maxsize=ENCODE_CACHE_SIZE)
+def to_hex(tx_id):
+    return tx_id.hex()
+
+
+def short(encoded):
+    """First and last 8 characters of an encoded id, for toasts and tables"""
+    return f"{encoded[:8]}...{encoded[-8:]}"
@@ -0,0 +1,206 @@
+"""Wallet state shared by every session of both dashboards.
+
+Balances, summaries, activity pages and the leaderboard all live in the
+ledger service. ``WalletState`` is one process-wide, read-through cache
+in front of it. A read is served from memory while its entry is younger
+than ``ttl`` seconds, and fetched from the service otherwise. Entries are
+grouped by wallet, and only the ``max_wallets`` most recently read
+wallets are kept. So memory is bounded however many sessions are open,
+and sessions viewing the same wallet share one copy.
+
+A session keeps only what is its own: the wallet it is viewing, its
+activity page cursors and the ids of its pending redemptions. Writes go
+to the service and drop the wallet's cached entries. When a balance feed
+is attached, balances pushed over it are used instead of cached ones, and
+the feed reads a wallet's balances through ``fetch_balances`` once its
+subscription is confirmed.
+Requests carry the dashboard's ``INTERACTIVE_TOKEN`` as a bearer token,
+so the service admits them ahead of batch traffic when it is overloaded.
+
+Concurrent reads of the same entry share one request. ``prefetch`` uses
+that to start a page's reads in the background as soon as the wallet is
+known, so the page finds them done or in flight when it gets to them
+instead of waiting on each in turn.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+
+STATE_TTL = 2.0
+MAX_WALLETS = 10_000
+# Cached reads per wallet (activity pages, mostly) before the oldest is dropped
+MAX_ENTRIES_PER_WALLET = 16
+LEADERBOARD = "\0leaderboard"
+PREFETCH_THREADS = 4
+# One of the service's INTERACTIVE_TOKENS
+INTERACTIVE_TOKEN = os.environ.get("INTERACTIVE_TOKEN")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    wallets: int = 0
+
+
+class WalletState:
+    def __init__(self, url, ttl=STATE_TTL, max_wallets=MAX_WALLETS, feed=None, token=INTERACTIVE_TOKEN):
+        self.url = url
+        self.token = token
+        self.ttl = ttl
+        self.max_wallets = max_wallets
+        self.feed = feed
+        if feed is not None:
+            feed.fetch = self.fetch_balances
+        self._wallets = OrderedDict()  # public key -> {read: (expires at, value)}, least recent first
+        self._inflight = {}  # (public key, read) -> Future of the request being made
+        self._prefetcher = ThreadPoolExecutor(PREFETCH_THREADS, thread_name_prefix="wallet-prefetch")
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._http = threading.local()
+
+    def _session(self):
+        # requests.Session is not thread-safe; keep one per thread for keep-alive
+        session = getattr(self._http, "session", None)
+        if session is None:
+            session = self._http.session = requests.Session()
+            if self.token:
+                session.headers["Authorization"] = f"Bearer {self.token}"
+        return session
+
+    def _read(self, public_key, read, fetch):
+        now = time.monotonic()
+        fetching = False
+        with self._lock:
+            entries = self._wallets.get(public_key)
+            if entries is not None:
+                self._wallets.move_to_end(public_key)
+                cached = entries.get(read)
+                if cached is not None and cached[0] > now:
+                    self._stats.hits += 1
+                    return cached[1]
+            flight = self._inflight.get((public_key, read))
+            if flight is not None:
+                self._stats.hits += 1
+            else:
+                flight = self._inflight[public_key, read] = Future()
+                self._stats.misses += 1
+                fetching = True
+        if not fetching:
+            return flight.result()
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                if self._inflight.get((public_key, read)) is flight:
+                    del self._inflight[public_key, read]
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            flight.set_result(value)
+            if self._inflight.get((public_key, read)) is not flight:
+                return value  # Invalidated while it was being read
+            del self._inflight[public_key, read]
+            entries = self._wallets.get(public_key)
+            if entries is None:
+                entries = self._wallets[public_key] = {}
+                while len(self._wallets) > self.max_wallets:
+                    self._wallets.popitem(last=False)
+                    self._stats.evictions += 1
+            entries.pop(read, None)
+            entries[read] = (now + self.ttl, value)
+            if len(entries) > MAX_ENTRIES_PER_WALLET:
+                del entries[next(iter(entries))]
+        return value
+
+    def _get(self, path, **params):
+        response = self._session().get(f"{self.url}{path}", params=params, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def balances(self, public_key):
+        """``(sol, tokens)``, from the balance feed if it is live for this wallet"""
+        if self.feed is not None:
+            pushed = self.feed.get(public_key)
+            if pushed is not None:
+                return pushed
+            self.feed.follow(public_key)
+        balances = self._read(public_key, "balances", lambda: self._get(f"/wallets/{public_key}/balances"))
+        return balances["sol"], balances["tokens"]
+
+    def fetch_balances(self, public_key):
+        """``(sol, tokens)`` read from the service, bypassing the cache"""
+        balances = self._get(f"/wallets/{public_key}/balances")
+        return balances["sol"], balances["tokens"]
+
+    def summary(self, public_key):
+        """Lifetime totals, streak and leaderboard rank"""
+        return self._read(public_key, "summary", lambda: self._get(f"/wallets/{public_key}/summary"))
+
+    def activities(self, public_key, cursor=None, limit=20):
+        """One page of activity, newest first, as ``(items, next_cursor)`` with ``tx`` as bytes"""
+
+        def fetch():
+            params = {"limit": limit} if cursor is None else {"limit": limit, "cursor": cursor}
+            page = self._get(f"/wallets/{public_key}/activities", **params)
+            for item in page["items"]:
+                item["tx"] = bytes.fromhex(item["tx"])
+            return page["items"], page["next_cursor"]
+
+        return self._read(public_key, ("activities", cursor, limit), fetch)
+
+    def leaderboard(self, k=10):
+        return self._read(LEADERBOARD, k, lambda: self._get("/leaderboard", k=k))
+
+    def prefetch(self, public_key, activities=20, summary=True, leaderboard=None):
+        """Start reading a wallet's balances, summary and first ``activities`` page in the background
+
+        Pass ``leaderboard=k`` to fetch the top ``k`` as well. Errors are
+        left for the page's own reads to report.
+        """
+        self._prefetcher.submit(self.balances, public_key)
+        if summary:
+            self._prefetcher.submit(self.summary, public_key)
+        if activities:
+            self._prefetcher.submit(self.activities, public_key, None, activities)
+        if leaderboard:
+            self._prefetcher.submit(self.leaderboard, leaderboard)
+
+    def redeem(self, public_key, reward, points, reward_id=None, idempotency_key=None):
+        """Record a redemption with the ledger and return its activity
+
+        Raises ``requests.HTTPError`` if the ledger refuses it (409 for too
+        few points or no stock left).
+        """
+        try:
+            response = self._session().post(
+                f"{self.url}/wallets/{public_key}/redemptions",
+                json={"reward": reward, "points": points, "reward_id": reward_id},
+                headers={"Idempotency-Key": idempotency_key or uuid.uuid4().hex},
+                timeout=10,
+            )
+            response.raise_for_status()
+        finally:
+            self.invalidate(public_key)
+        activity = response.json()
+        activity["tx"] = bytes.fromhex(activity["tx"])
+        return activity
+
+    def invalidate(self, public_key):
+        """Forget a wallet's cached reads, e.g. after it changed"""
+        # Redemptions never change points earned, so the leaderboard stays
+        with self._lock:
+            self._wallets.pop(public_key, None)
+            for key in [key for key in self._inflight if key[0] == public_key]:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self._stats.hits, self._stats.misses, self._stats.evictions, len(self._wallets))
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from backend.catalog import Catalog, OutOfStock, Reward
+from backend.ledger import Ledger
+from backend.storage import LedgerStorage
+
+
+def catalog():
+    return Catalog([
+        Reward("mug", "Mug", "Merch", 100, "", "", stock=2),
+        Reward("gym", "Gym Membership", "Fitness", 500, "", ""),
+    ])
+
+
+def test_reserve_never_takes_more_than_the_stock():
+    rewards = catalog()
+    etag = rewards.etag
+    assert rewards.reserve("mug") == 1
+    assert rewards.reserve("mug") == 0
+    with pytest.raises(OutOfStock):
+        rewards.reserve("mug")
+    assert rewards.etag != etag
+    rewards.release("mug")
+    assert rewards.get("mug").stock == 1
+
+
+def test_unlimited_rewards_have_no_stock():
+    rewards = catalog()
+    assert rewards.reserve("gym") is None
+    assert rewards.get("gym").stock is None
+
+
+def test_listing_is_served_from_cache_until_the_stock_changes():
+    rewards = catalog()
+    etag, body = rewards.listing()
+    assert rewards.listing() == (etag, body)
+    rewards.reserve("mug")
+    assert rewards.listing()[0] != etag
+
+
+def test_restock_subtracts_redemptions_in_the_ledger(tmp_path):
+    ledger = Ledger(storage=LedgerStorage(str(tmp_path)))
+    rewards = catalog()
+    ledger.redeem("alice", "Mug", 100, stock=rewards.stock("mug"))
+    # Free-form redemptions that share a reward's name take no stock
+    ledger.redeem("alice", "Mug", 100)
+    ledger.close()
+
+    recovered = Ledger(storage=LedgerStorage(str(tmp_path)))
+    restocked = catalog()
+    restocked.restock_from(recovered)
+    assert restocked.get("mug").stock == 1
+    assert restocked.get("gym").stock is None
+    recovered.close()
+
+
+def test_restock_never_goes_below_zero():
+    ledger = Ledger()
+    generous = Catalog([Reward("mug", "Mug", "Merch", 100, "", "", stock=5)])
+    for _ in range(3):
+        ledger.redeem(os.urandom(4).hex(), "Mug", 100, stock=generous.stock("mug"))
+    rewards = catalog()
+    rewards.restock_from(ledger)
+    assert rewards.get("mug").stock == 0
@@ -0,0 +1,102 @@
+import logging
+import threading
+
+import pytest
+
+from backend.ingestion import Backpressure, IngestionPipeline, IntakeJournal, UnknownPlatform, event_tx
+from backend.ledger import DEFAULT_TOKENS, Ledger
+
+PLATFORM = "NutriPoints"
+
+
+def test_duplicate_events_are_credited_once():
+    ledger = Ledger()
+    pipeline = IngestionPipeline(ledger)
+    pipeline.submit(PLATFORM, [("e1", "alice", 10), ("e1", "alice", 10), ("e2", "alice", 5)])
+    pipeline.submit(PLATFORM, [("e2", "alice", 5)])
+    assert pipeline.drain(5)
+    stats = pipeline.stats()
+    assert (stats.applied, stats.duplicates) == (2, 2)
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS + 15
+
+
+def test_same_event_id_on_another_platform_is_not_a_duplicate():
+    ledger = Ledger()
+    pipeline = IngestionPipeline(ledger)
+    pipeline.submit(PLATFORM, [("e1", "alice", 10)])
+    pipeline.submit("MentalWell", [("e1", "alice", 10)])
+    assert pipeline.drain(5)
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS + 20
+
+
+def test_events_already_in_the_ledger_are_dropped_after_a_restart():
+    ledger = Ledger()
+    ledger.credit_many([("alice", PLATFORM, 10, event_tx(PLATFORM, "e1"))])
+    pipeline = IngestionPipeline(ledger)
+    pipeline.submit(PLATFORM, [("e1", "alice", 10)])
+    assert pipeline.drain(5)
+    assert pipeline.stats().duplicates == 1
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS + 10
+
+
+def test_unknown_platform_is_rejected():
+    pipeline = IngestionPipeline(Ledger())
+    with pytest.raises(UnknownPlatform):
+        pipeline.submit("Elsewhere", [("e1", "alice", 10)])
+    assert pipeline.stats().rejected_batches == 1
+
+
+def test_full_queue_pushes_back():
+    class Stuck(Ledger):
+        def credit_many(self, credits):
+            release.wait()
+            return super().credit_many(credits)
+
+    release = threading.Event()
+    pipeline = IngestionPipeline(Stuck(), queue_batches=1)
+    with pytest.raises(Backpressure):
+        for i in range(3):
+            pipeline.submit(PLATFORM, [(f"e{i}", "alice", 1)])
+    release.set()
+    assert pipeline.drain(5)
+
+
+def test_journaled_batches_are_applied_after_a_crash(tmp_path):
+    ledger = Ledger()
+    # Acknowledged, then the process died before the applier got to it
+    IntakeJournal(str(tmp_path)).append(0, [("alice", PLATFORM, 10, event_tx(PLATFORM, "e1"))])
+    # Credited before the crash, but its journal segment was not yet deleted
+    ledger.credit_many([("bob", PLATFORM, 7, event_tx(PLATFORM, "e2"))])
+    IntakeJournal(str(tmp_path)).append(0, [("bob", PLATFORM, 7, event_tx(PLATFORM, "e2"))])
+
+    pipeline = IngestionPipeline(ledger, journal_dir=str(tmp_path))
+    assert pipeline.drain(5)
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS + 10
+    assert ledger.balances("bob")[1] == DEFAULT_TOKENS + 7
+    # Both replayed segments are deleted once applied
+    assert [path.name for path in tmp_path.iterdir()] == ["intake-00000002.log"]
+
+
+def test_failed_batches_are_retried_then_dead_lettered(tmp_path, caplog):
+    class Flaky(Ledger):
+        failures = 2
+
+        def credit_many(self, credits):
+            if self.failures:
+                self.failures -= 1
+                raise OSError("disk full")
+            return super().credit_many(credits)
+
+    ledger = Flaky()
+    pipeline = IngestionPipeline(ledger, journal_dir=str(tmp_path), apply_attempts=3, retry_delay=0.001)
+    with caplog.at_level(logging.CRITICAL):
+        pipeline.submit(PLATFORM, [("e1", "alice", 10)])
+        assert pipeline.drain(5)
+        assert ledger.balances("alice")[1] == DEFAULT_TOKENS + 10
+
+        ledger.failures = 3
+        pipeline.submit(PLATFORM, [("e2", "alice", 10)])
+        assert pipeline.drain(5)
+    assert pipeline.stats().failed == 1
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS + 10
+    assert [name.name for name in tmp_path.iterdir() if name.name.startswith("dead-letter-")]
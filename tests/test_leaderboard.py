@@ -0,0 +1,50 @@
+import random
+
+from backend.aggregates import READ_APPLY_LIMIT, Leaderboard
+
+
+def test_ties_share_a_rank_in_the_order_reached():
+    board = Leaderboard()
+    board.update_many([("a", 10), ("b", 30), ("c", 10), ("d", 20)])
+    assert board.top(4) == [("b", 30), ("d", 20), ("a", 10), ("c", 10)]
+    assert [board.rank(k) for k in "abcd"] == [3, 1, 3, 2]
+    assert board.rank("missing") is None
+
+
+def test_moves_and_removals():
+    board = Leaderboard()
+    board.update_many([("a", 10), ("b", 20)])
+    board.update("a", 25)
+    assert board.top(1) == [("a", 25)]
+    board.remove("a")
+    assert len(board) == 1
+    assert board.rank("a") is None
+    assert board.rank("b") == 1
+
+
+def test_matches_a_full_sort_under_random_updates():
+    rng = random.Random(7)
+    board = Leaderboard(load=4)
+    scores = {}
+    for step in range(5000):
+        if rng.random() < 0.05:
+            # Bulk credits, large enough to be merged in by the write
+            size = rng.randrange(1, 4 * READ_APPLY_LIMIT)
+            batch = [(f"w{rng.randrange(300)}", rng.randrange(40)) for _ in range(size)]
+        else:
+            batch = [(f"w{rng.randrange(300)}", rng.randrange(40))]
+        board.update_many(batch)
+        scores.update(batch)
+        if step % 50 == 0:
+            ranked = sorted((score for score in scores.values() if score), reverse=True)
+            assert len(board) == len(ranked)
+            assert [score for _, score in board.top(25)] == ranked[:25]
+            public_key = rng.choice([k for k, score in scores.items() if score])
+            assert board.rank(public_key) == 1 + sum(score > scores[public_key] for score in ranked)
+
+
+def test_rebuild_replaces_the_board():
+    board = Leaderboard()
+    board.update_many([("a", 10)])
+    board.rebuild([("b", 5), ("c", 0), ("d", 7)])
+    assert board.top(10) == [("d", 7), ("b", 5)]
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from backend.catalog import Catalog, OutOfStock, Reward
+from backend.ledger import DEFAULT_TOKENS, IdempotencyConflict, InsufficientPoints, Ledger
+from backend.storage import LedgerStorage
+
+
+def credit(ledger, public_key, points, platform="NutriPoints"):
+    return ledger.credit_many([(public_key, platform, points, os.urandom(32))])
+
+
+def test_redeem_with_same_key_debits_once():
+    ledger = Ledger()
+    first = ledger.redeem("alice", "Mug", 100, idempotency_key="r-1")
+    again = ledger.redeem("alice", "Mug", 100, idempotency_key="r-1")
+    assert again == first
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS - 100
+
+
+def test_reused_key_for_another_redemption_conflicts():
+    ledger = Ledger()
+    ledger.redeem("alice", "Mug", 100, idempotency_key="r-1")
+    with pytest.raises(IdempotencyConflict):
+        ledger.redeem("alice", "Hat", 100, idempotency_key="r-1")
+    with pytest.raises(IdempotencyConflict):
+        ledger.redeem("alice", "Mug", 200, idempotency_key="r-1")
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS - 100
+
+
+def test_insufficient_points_leaves_balance_and_stock():
+    ledger = Ledger(default_tokens=50)
+    catalog = Catalog([Reward("mug", "Mug", "Merch", 100, "", "", stock=1)])
+    with pytest.raises(InsufficientPoints):
+        ledger.redeem("alice", "Mug", 100, stock=catalog.stock("mug"))
+    assert ledger.balances("alice")[1] == 50
+    assert catalog.get("mug").stock == 1
+
+
+def test_out_of_stock_undoes_the_debit():
+    ledger = Ledger()
+    catalog = Catalog([Reward("mug", "Mug", "Merch", 100, "", "", stock=0)])
+    with pytest.raises(OutOfStock):
+        ledger.redeem("alice", "Mug", 100, stock=catalog.stock("mug"))
+    assert ledger.balances("alice")[1] == DEFAULT_TOKENS
+    assert ledger.stock_taken() == {}
+
+
+def test_recovery_replays_the_log(tmp_path):
+    ledger = Ledger(storage=LedgerStorage(str(tmp_path)))
+    credit(ledger, "alice", 500)
+    ledger.debit("alice", 20)
+    activity = ledger.redeem("alice", "Mug", 100, idempotency_key="r-1")
+    ledger.close()
+
+    recovered = Ledger(storage=LedgerStorage(str(tmp_path)))
+    assert recovered.balances("alice")[1] == DEFAULT_TOKENS + 500 - 20 - 100
+    assert recovered.summary("alice")["earned"] == 500
+    # Idempotency keys survive the restart
+    assert recovered.redeem("alice", "Mug", 100, idempotency_key="r-1") == activity
+    recovered.close()
+
+
+def test_recovery_from_a_snapshot_and_the_log_after_it(tmp_path):
+    ledger = Ledger(storage=LedgerStorage(str(tmp_path)))
+    credit(ledger, "alice", 500)
+    ledger.checkpoint()
+    credit(ledger, "bob", 300)
+    ledger.close()
+
+    recovered = Ledger(storage=LedgerStorage(str(tmp_path)))
+    assert recovered.balances("alice")[1] == DEFAULT_TOKENS + 500
+    assert recovered.balances("bob")[1] == DEFAULT_TOKENS + 300
+    assert recovered.leaderboard(2) == [("alice", 500), ("bob", 300)]
+    recovered.close()
+
+
+def test_recovery_drops_a_torn_tail(tmp_path):
+    ledger = Ledger(storage=LedgerStorage(str(tmp_path)))
+    credit(ledger, "alice", 500)
+    credit(ledger, "alice", 70)
+    ledger.close()
+    (wal,) = [name for name in os.listdir(tmp_path) if name.startswith("wal-")]
+    path = tmp_path / wal
+    # A crash part-way through the last write
+    path.write_bytes(path.read_bytes()[:-5])
+
+    recovered = Ledger(storage=LedgerStorage(str(tmp_path)))
+    assert recovered.balances("alice")[1] == DEFAULT_TOKENS + 500
+    credit(recovered, "alice", 1)
+    recovered.close()
+    assert Ledger(storage=LedgerStorage(str(tmp_path))).balances("alice")[1] == DEFAULT_TOKENS + 501